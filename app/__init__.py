@@ -7,10 +7,18 @@ from flask_security import Security, SQLAlchemyUserDatastore
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from app_config import config
+from app.scan_cache import scan_cache
+from app.barcodes import barcode_cache
+from app.sessions import server_sessions
+from app.profiling import request_profiler
+from app.metrics import metrics
+from app.assets import assets
+from app.database import sqlite_tuning, configure_engines, dispose_engines_after_fork, RoutingSession
 import os
 
 # Initialize extensions
-db = SQLAlchemy()
+# Reads from views marked @read_only go to the 'readonly' bind (see app/database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 babel = Babel()
 login_manager = LoginManager()
@@ -47,24 +55,41 @@ def create_app(config_name=None):
         return request.accept_languages.best_match(['en', 'bg']) or 'en'
 
     # Initialize extensions with app
+    configure_engines(app)
     db.init_app(app)
+    sqlite_tuning.init_app(app)
+    dispose_engines_after_fork(app)
+    request_profiler.init_app(app)
     migrate.init_app(app, db)
     babel.init_app(app, locale_selector=get_locale)
     login_manager.init_app(app)
     limiter.init_app(app)
+    metrics.init_app(app)
+    assets.init_app(app)
+    scan_cache.init_app(app)
+    barcode_cache.init_app(app)
+    server_sessions.init_app(app)
 
     # Configure Flask-Login
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.session_protection = 'strong'
 
-    # Import models
-    from app import models
+    # Import models (and the search index DDL hooked to their tables)
+    from app import models, search
+
+    # Audit log writer
+    from app.audit import audit_sink
+    audit_sink.init_app(app)
 
     # Setup Flask-Security-Too
     user_datastore = SQLAlchemyUserDatastore(db, models.User, models.Role)
     security.init_app(app, user_datastore)
 
+    # Serve current_user from the per-worker principal cache
+    from app.principals import principal_cache
+    principal_cache.init_app(app)
+
     # Register blueprints
     from app.auth import auth_bp
     from app.inventory import inventory_bp
@@ -86,10 +111,6 @@ def create_app(config_name=None):
                 response.headers[header] = value
             return response
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-
     # Register CLI commands
     from app.cli import register_commands
     register_commands(app)
@@ -0,0 +1,393 @@
+"""Static asset pipeline: purged, fingerprinted and precompressed builds"""
+import glob
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import Blueprint, abort, request, send_from_directory, url_for
+
+assets_bp = Blueprint('assets', __name__)
+
+# Files under the static folder published by ``flask build-assets``
+ASSET_SOURCES = (
+    'css/tailwind-full.css',
+    'fonts/inter.css',
+    'fonts/inter-*.ttf',
+    'js/alpine.min.js',
+)
+
+# Stylesheets whose rules for classes never used in the templates are dropped
+PURGE_SOURCES = ('css/tailwind-full.css',)
+
+# Files scanned for class names (same content as tailwind.config.js)
+CONTENT_GLOBS = ('templates/**/*.html', '**/*.py')
+
+# Build output, relative to the static folder
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Extensions that get .gz/.br siblings
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.json')
+
+# Fingerprinted files never change, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 31536000
+
+# Tailwind's default extractors: a broad token and one without surrounding punctuation
+CLASS_CANDIDATE_RE = re.compile(r'''[^<>"'`\s]*[^<>"'`\s:]''')
+INNER_CANDIDATE_RE = re.compile(r'''[^<>"'`\s.(){}\[\]#=%]*[^<>"'`\s.(){}\[\]#=%:]''')
+
+SELECTOR_CLASS_RE = re.compile(r'\.((?:\\[0-9a-fA-F]{1,6}\s?|\\.|[\w-])+)')
+CSS_ESCAPE_RE = re.compile(r'\\([0-9a-fA-F]{1,6})\s?|\\(.)')
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+# At-rules whose bodies are lists of rules to purge recursively
+NESTED_AT_RULES = ('@media', '@supports', '@layer', '@container')
+
+
+class Assets:
+    """
+    Resolve logical static paths to their fingerprinted builds
+
+    ``asset_url('css/tailwind-full.css')`` in templates returns the URL of
+    the purged, content-hashed file listed in ``static/dist/manifest.json``.
+    Without a manifest (before the first ``flask build-assets``, or with
+    ``ASSETS_USE_MANIFEST`` off) it falls back to the source file.
+    Fingerprinted files are served with ``Cache-Control: immutable`` and a
+    precompressed ``.br`` or ``.gz`` sibling when the client accepts one.
+    """
+
+    def __init__(self):
+        self.dist_folder = None
+        self.manifest = {}
+
+    def init_app(self, app):
+        """Load the manifest and register the asset route and template helper"""
+        from app import limiter
+
+        self.dist_folder = os.path.join(app.static_folder, DIST_DIR)
+        self.manifest = load_manifest(self.dist_folder) if app.config.get('ASSETS_USE_MANIFEST', True) else {}
+
+        app.add_template_global(self.url, 'asset_url')
+        limiter.exempt(dist_asset)
+        app.register_blueprint(assets_bp)
+
+    def url(self, filename):
+        """URL of a static file, fingerprinted when it has been built"""
+        built = self.manifest.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets.dist_asset', filename=built)
+
+
+assets = Assets()
+
+
+@assets_bp.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+    """Serve a fingerprinted asset, precompressed when the client accepts it"""
+    if assets.dist_folder is None:
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    path = filename
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(os.path.join(assets.dist_folder, filename + suffix)):
+            encoding, path = candidate, filename + suffix
+            break
+
+    response = send_from_directory(assets.dist_folder, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def load_manifest(dist_folder):
+    """Logical path -> fingerprinted path mapping, or {} if assets were never built"""
+    try:
+        with open(os.path.join(dist_folder, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_assets(static_folder, content_root):
+    """
+    Purge, fingerprint and precompress ASSET_SOURCES into ``static/dist``
+
+    Files from the previous build are kept, so pages rendered before a
+    restart can still load their assets; anything older is removed.
+
+    Args:
+        static_folder: Application static folder
+        content_root: Directory searched with CONTENT_GLOBS for used classes
+
+    Returns:
+        List of dicts with the source, output and byte sizes of each asset
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    previous = load_manifest(dist_folder)
+    candidates = extract_candidates(_read_content(content_root))
+
+    sources = []
+    for pattern in ASSET_SOURCES:
+        matches = sorted(glob.glob(os.path.join(static_folder, pattern)))
+        if not matches:
+            raise FileNotFoundError(f'No static files match {pattern}')
+        sources.extend(os.path.relpath(path, static_folder).replace(os.sep, '/') for path in matches)
+
+    # Fonts and scripts first, so stylesheets can point at their fingerprinted names
+    sources.sort(key=lambda logical: logical.endswith('.css'))
+
+    manifest = {}
+    results = []
+    for logical in sources:
+        with open(os.path.join(static_folder, logical), 'rb') as f:
+            data = original = f.read()
+
+        if logical.endswith('.css'):
+            text = data.decode('utf-8')
+            if logical in PURGE_SOURCES:
+                text = purge_css(text, candidates)
+            data = rewrite_css_urls(text, logical, manifest).encode('utf-8')
+
+        built = fingerprint(logical, data)
+        path = os.path.join(dist_folder, built)
+        _write(path, data)
+
+        result = {'source': logical, 'output': built, 'original': len(original), 'size': len(data)}
+        if logical.endswith(COMPRESSIBLE):
+            result.update(precompress(path, data))
+        manifest[logical] = built
+        results.append(result)
+
+    _write(os.path.join(dist_folder, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    _remove_stale(dist_folder, set(manifest.values()) | set(previous.values()))
+    return results
+
+
+def fingerprint(logical, data):
+    """``css/app.css`` -> ``css/app.<hash>.css``, hashed on the file content"""
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = posixpath.splitext(logical)
+    return f'{stem}.{digest}{ext}'
+
+
+def precompress(path, data):
+    """
+    Write ``.gz`` (and ``.br`` when Brotli is installed) siblings of a built file
+
+    Returns:
+        Dict with the compressed sizes that were written
+    """
+    sizes = {}
+    # mtime=0 keeps the output reproducible between builds
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        _write(path + '.gz', compressed)
+        sizes['gzip'] = len(compressed)
+
+    try:
+        import brotli
+    except ImportError:
+        return sizes
+
+    compressed = brotli.compress(data, quality=11)
+    if len(compressed) < len(data):
+        _write(path + '.br', compressed)
+        sizes['br'] = len(compressed)
+    return sizes
+
+
+def extract_candidates(texts):
+    """Every token in the given texts that could be a class name"""
+    candidates = set()
+    for text in texts:
+        candidates.update(CLASS_CANDIDATE_RE.findall(text))
+        candidates.update(INNER_CANDIDATE_RE.findall(text))
+    return candidates
+
+
+def purge_css(css, candidates):
+    """
+    Drop rules whose selectors use classes that are not in candidates
+
+    Element and attribute rules (the preflight), keyframes, font faces and
+    ``/*!`` license comments are kept; ``@media``/``@supports`` blocks are
+    purged recursively and dropped once empty.
+    """
+    output = []
+    for kind, prelude, body in _css_items(css):
+        if kind == 'comment':
+            if prelude.startswith('/*!'):
+                output.append(prelude)
+        elif kind == 'statement':
+            output.append(prelude)
+        elif prelude.startswith('@'):
+            if prelude.split(None, 1)[0].lower() in NESTED_AT_RULES:
+                inner = purge_css(body, candidates)
+                if inner:
+                    output.append(f'{prelude}{{{inner}}}')
+            else:
+                output.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [selector for selector in _split_selectors(prelude)
+                         if _selector_used(selector, candidates)]
+            if selectors:
+                output.append(f'{",".join(selectors)}{{{body}}}')
+    return ''.join(output)
+
+
+def rewrite_css_urls(css, logical, manifest):
+    """Point relative ``url()`` references at the fingerprinted files in manifest"""
+    base = posixpath.dirname(logical)
+
+    def replace(match):
+        reference = match.group(2).strip()
+        if reference.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', reference).groups()
+        target = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if target is None:
+            return match.group(0)
+        return f"url('{posixpath.relpath(target, base or '.')}{suffix}')"
+
+    return CSS_URL_RE.sub(replace, css)
+
+
+def _css_items(css):
+    """
+    Split a stylesheet into top-level items
+
+    Yields:
+        ('comment', text, None), ('statement', text, None) for at-rules
+        ending in ``;``, or ('block', prelude, body) for ``prelude { body }``
+    """
+    length = len(css)
+    index = 0
+    while index < length:
+        while index < length and css[index].isspace():
+            index += 1
+        if index >= length:
+            return
+
+        if css.startswith('/*', index):
+            end = css.find('*/', index + 2)
+            end = length if end == -1 else end + 2
+            yield 'comment', css[index:end], None
+            index = end
+            continue
+
+        start = index
+        quote = None
+        while index < length:
+            char = css[index]
+            if quote:
+                if char == '\\':
+                    index += 1
+                elif char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '\\':
+                index += 1
+            elif char in '{;':
+                break
+            index += 1
+
+        if index >= length or css[index] == ';':
+            yield 'statement', css[start:index + 1].strip(), None
+            index += 1
+            continue
+
+        prelude = css[start:index].strip()
+        depth = 1
+        body_start = index = index + 1
+        quote = None
+        while index < length and depth:
+            char = css[index]
+            if quote:
+                if char == '\\':
+                    index += 1
+                elif char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '\\':
+                index += 1
+            elif css.startswith('/*', index):
+                end = css.find('*/', index + 2)
+                index = length if end == -1 else end + 1
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+            index += 1
+        yield 'block', prelude, css[body_start:index - 1]
+
+
+def _split_selectors(prelude):
+    """Split a selector list on top-level commas"""
+    selectors = []
+    depth = 0
+    start = 0
+    escaped = False
+    for index, char in enumerate(prelude):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+    selectors.append(prelude[start:].strip())
+    return [selector for selector in selectors if selector]
+
+
+def _selector_used(selector, candidates):
+    for name in SELECTOR_CLASS_RE.findall(selector):
+        name = CSS_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)) if m.group(1) else m.group(2), name)
+        if name not in candidates:
+            return False
+    return True
+
+
+def _read_content(content_root):
+    for pattern in CONTENT_GLOBS:
+        for path in sorted(glob.glob(os.path.join(content_root, pattern), recursive=True)):
+            with open(path, encoding='utf-8', errors='ignore') as f:
+                yield f.read()
+
+
+def _write(path, data):
+    """Write a file atomically so a running worker never serves a partial asset"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _remove_stale(dist_folder, keep):
+    for path in glob.glob(os.path.join(dist_folder, '**', '*'), recursive=True):
+        if not os.path.isfile(path):
+            continue
+        relative = os.path.relpath(path, dist_folder).replace(os.sep, '/')
+        if relative == MANIFEST_NAME:
+            continue
+        if relative.endswith(('.gz', '.br')):
+            relative = relative[:-3]
+        if relative not in keep:
+            os.remove(path)
@@ -0,0 +1,142 @@
+"""Audit log sink with synchronous, transactional and buffered write modes"""
+import atexit
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import AuditLog
+
+MODES = ('sync', 'transaction', 'buffered')
+
+
+class AuditSink:
+    """
+    Write audit entries according to the configured ``AUDIT_LOG_MODE``
+
+    sync:        add the entry and commit immediately (one commit per entry)
+    transaction: add the entry to the caller's session; it is committed with
+                 the caller's own commit, or at the end of the request
+    buffered:    queue the entry in memory and insert queued entries with a
+                 single executemany when the buffer is full or old enough
+    """
+
+    def __init__(self):
+        self.app = None
+        self.mode = 'transaction'
+        self.buffer_size = 100
+        self.flush_interval = 2.0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._oldest = None
+        self._flusher = None
+        self._flusher_pid = None
+
+    def init_app(self, app):
+        """Configure the sink and register its request and exit hooks"""
+        self.app = app
+        self.mode = app.config.get('AUDIT_LOG_MODE', 'transaction')
+        self.buffer_size = app.config.get('AUDIT_BUFFER_SIZE', self.buffer_size)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+
+        if self.mode not in MODES:
+            raise ValueError(f'Invalid AUDIT_LOG_MODE: {self.mode}')
+
+        app.after_request(self._commit_pending)
+        atexit.register(self.flush)
+
+    def write(self, entry, commit=True):
+        """
+        Persist an audit entry
+
+        Args:
+            entry: Dict of AuditLog column values
+            commit: False forces the entry into the caller's transaction
+        """
+        if not commit or self.mode == 'transaction':
+            db.session.add(AuditLog(**entry))
+            db.session.info.setdefault('audit_pending', []).append(entry)
+        elif self.mode == 'sync':
+            db.session.add(AuditLog(**entry))
+            db.session.commit()
+        else:
+            self._enqueue(entry)
+
+    def queue_depth(self):
+        """Number of buffered entries not yet written"""
+        return len(self._queue)
+
+    def flush(self):
+        """Insert all buffered entries with a single executemany"""
+        with self._lock:
+            rows, self._queue = self._queue, []
+            self._oldest = None
+
+        if not rows or self.app is None:
+            return
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(AuditLog.__table__.insert(), rows)
+        except Exception as e:
+            # Don't let audit logging break the application
+            print(f"Error flushing {len(rows)} audit entries: {str(e)}")
+
+    def _enqueue(self, entry):
+        with self._lock:
+            self._queue.append(entry)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._queue) >= self.buffer_size
+
+        self._ensure_flusher()
+        if full:
+            self.flush()
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so each worker starts its own
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._run_flusher, name='audit-flusher', daemon=True)
+        self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval / 2)
+            oldest = self._oldest
+            if oldest is not None and time.monotonic() - oldest >= self.flush_interval:
+                self.flush()
+
+    def _commit_pending(self, response):
+        """
+        Commit audit entries left in the session by views that did not commit
+
+        Only the queued entries are written. Anything else the view left
+        uncommitted is rolled back first, as it would be when the request's
+        session is removed.
+        """
+        entries = db.session.info.pop('audit_pending', None)
+        if entries:
+            try:
+                db.session.rollback()
+                db.session.add_all([AuditLog(**entry) for entry in entries])
+                db.session.commit()
+            except Exception as e:
+                print(f"Error committing audit entries: {str(e)}")
+                db.session.rollback()
+        return response
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def forget_pending_audit(session):
+    """Queued entries were committed with, or rolled back with, the caller's transaction"""
+    session.info.pop('audit_pending', None)
+
+
+audit_sink = AuditSink()
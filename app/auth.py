@@ -1,9 +1,11 @@
 """Authentication routes"""
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from flask_security import roles_required
 from app import db, limiter
+from sqlalchemy.orm import selectinload
 from app.models import User, Role
+from app.sessions import rotate_session
 from app.utils import log_audit
 from datetime import datetime
 import secrets
@@ -42,6 +44,7 @@ def login():
                 return redirect(url_for('auth.verify_2fa'))
 
             # Login successful
+            rotate_session(session)
             login_user(user, remember=remember)
             user.last_login = datetime.utcnow()
             db.session.commit()
@@ -78,6 +81,7 @@ def verify_2fa():
             remember = session.pop('remember_2fa', False)
             session.pop('pending_2fa_user_id', None)
 
+            rotate_session(session)
             login_user(user, remember=remember)
             user.last_login = datetime.utcnow()
             db.session.commit()
@@ -100,6 +104,7 @@ def logout():
     """User logout"""
     log_audit('logout', 'user', current_user.id)
     logout_user()
+    rotate_session(session)
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
 
@@ -144,21 +149,33 @@ def setup_2fa():
                 flash('Two-factor authentication has been enabled!', 'success')
             else:
                 flash('Invalid verification code. Please try again.', 'danger')
-                return render_template('auth/setup_2fa.html',
-                                     qr_code=session.get('temp_qr_code'))
+                if not temp_secret:
+                    return redirect(url_for('auth.setup_2fa'))
+                return render_template('auth/setup_2fa.html', secret=temp_secret)
 
         return redirect(url_for('auth.profile'))
 
     # Generate new TOTP secret
     import pyotp
-    import qrcode
-    from io import BytesIO
-    import base64
 
     secret = pyotp.random_base32()
     session['temp_totp_secret'] = secret
 
-    # Generate QR code
+    return render_template('auth/setup_2fa.html', secret=secret)
+
+
+@auth_bp.route('/setup-2fa/qr.png')
+@login_required
+def setup_2fa_qr_code():
+    """QR code for the pending TOTP secret, rendered on demand rather than kept in the session"""
+    import pyotp
+    import qrcode
+    from io import BytesIO
+
+    secret = session.get('temp_totp_secret')
+    if not secret:
+        return 'No pending two-factor setup', 404
+
     totp_uri = pyotp.totp.TOTP(secret).provisioning_uri(
         name=current_user.email,
         issuer_name='IMS - Inventory Management'
@@ -171,16 +188,10 @@ def setup_2fa():
     img = qr.make_image(fill_color="black", back_color="white")
     buf = BytesIO()
     img.save(buf, format='PNG')
-    buf.seek(0)
-
-    qr_code_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    qr_code_data = f"data:image/png;base64,{qr_code_base64}"
-
-    session['temp_qr_code'] = qr_code_data
 
-    return render_template('auth/setup_2fa.html',
-                         qr_code=qr_code_data,
-                         secret=secret)
+    response = current_app.response_class(buf.getvalue(), mimetype='image/png')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
 # Admin routes
@@ -189,5 +200,5 @@ def setup_2fa():
 @roles_required('Admin')
 def list_users():
     """List all users (Admin only)"""
-    users = User.query.all()
+    users = User.query.options(selectinload(User.roles)).all()
     return render_template('auth/users.html', users=users)
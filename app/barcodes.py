@@ -0,0 +1,226 @@
+"""Rendering and caching of barcode images"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+# Writer options that may be passed through the query string: (type, minimum, maximum).
+# Values are clamped to the range so no request can render an oversized image.
+WRITER_OPTIONS = {
+    'module_width': (float, 0.1, 0.6),
+    'module_height': (float, 5.0, 40.0),
+    'quiet_zone': (float, 0.0, 10.0),
+    'font_size': (int, 0, 24),
+    'text_distance': (float, 0.0, 10.0),
+    'write_text': (lambda value: value not in ('0', 'false', 'False'), None, None),
+}
+
+# Longest code rendered (the length of a product_code)
+MAX_CODE_LENGTH = 100
+
+MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+class BarcodeError(ValueError):
+    """Raised when a code cannot be rendered as the requested barcode type"""
+
+
+class BarcodeCache:
+    """
+    Two-level cache of rendered barcode images
+
+    Images are keyed by (code, type, format, writer options). Rendered
+    output is deterministic for a key, so the key digest doubles as a
+    strong ETag and as the on-disk file name.
+
+    The disk level is capped at ``disk_max_bytes``: once a worker's running
+    estimate of the directory size passes it, the least recently used files
+    (by modification time, refreshed on every disk hit) are deleted until the
+    directory is back under 80% of the cap.
+    """
+
+    def __init__(self, maxsize=256, directory=None, disk_max_bytes=100 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # Estimated directory size, measured on the first write
+
+    def init_app(self, app):
+        """Configure the cache from the application config"""
+        self.maxsize = app.config.get('BARCODE_CACHE_SIZE', self.maxsize)
+        self.directory = app.config.get('BARCODE_CACHE_DIR') or os.path.join(
+            app.instance_path, 'barcodes'
+        )
+        self.disk_max_bytes = app.config.get('BARCODE_CACHE_DISK_MB', 100) * 1024 * 1024
+        self._disk_bytes = None
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, code, barcode_type='code128', fmt='png', options=None):
+        """
+        Return a rendered barcode image, rendering it on a cache miss
+
+        Returns:
+            Tuple of (image bytes, etag)
+
+        Raises:
+            BarcodeError: If the type is unknown or the code is invalid for it
+        """
+        options = normalize_options(options)
+        etag = cache_key(code, barcode_type, fmt, options)
+
+        with self._lock:
+            data = self._entries.get(etag)
+            if data is not None:
+                self._entries.move_to_end(etag)
+                return data, etag
+
+        data = self._read_disk(etag, fmt)
+        if data is None:
+            data = render_barcode(code, barcode_type, fmt, options)
+            self._write_disk(etag, fmt, data)
+
+        with self._lock:
+            self._entries[etag] = data
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return data, etag
+
+    def _path(self, etag, fmt):
+        return os.path.join(self.directory, etag[:2], f'{etag}.{fmt}')
+
+    def _read_disk(self, etag, fmt):
+        if not self.directory:
+            return None
+        path = self._path(etag, fmt)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, etag, fmt, data):
+        if not self.directory:
+            return
+        path = self._path(etag, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write atomically so concurrent workers never read a partial file
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching barcode image: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += len(data)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete the least recently used images until the directory is under 80% of the cap"""
+        files = sorted(self._disk_files(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.8
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already removed by another worker
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def _disk_files(self):
+        """(path, size, mtime) of every cached image"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+
+def normalize_options(options):
+    """Keep only supported writer options, converted to their proper types and clamped to their range"""
+    normalized = {}
+    for name, value in (options or {}).items():
+        if name not in WRITER_OPTIONS:
+            continue
+        convert, minimum, maximum = WRITER_OPTIONS[name]
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            raise BarcodeError(f'Invalid value for {name}: {value}')
+        if minimum is not None:
+            # Rounded as well, so near-identical values share one cached image
+            value = round(min(max(value, minimum), maximum), 2)
+        normalized[name] = value
+    return normalized
+
+
+def cache_key(code, barcode_type, fmt, options):
+    """Digest identifying one rendered image (also used as its ETag)"""
+    import barcode
+    payload = json.dumps([barcode.version, code, barcode_type, fmt, options], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_barcode(code, barcode_type='code128', fmt='png', options=None):
+    """
+    Render a barcode image with python-barcode
+
+    Args:
+        code: The code to encode
+        barcode_type: Type of barcode (code128, ean13, etc.)
+        fmt: 'png' or 'svg'
+        options: Writer options
+
+    Returns:
+        Image bytes
+    """
+    import barcode
+    from barcode.errors import BarcodeError as LibraryBarcodeError
+
+    if fmt not in MIMETYPES:
+        raise BarcodeError(f'Unsupported format: {fmt}')
+    if len(code) > MAX_CODE_LENGTH:
+        raise BarcodeError(f'Codes are limited to {MAX_CODE_LENGTH} characters')
+
+    if fmt == 'png':
+        from barcode.writer import ImageWriter
+        writer = ImageWriter(format='PNG')
+    else:
+        from barcode.writer import SVGWriter
+        writer = SVGWriter()
+
+    try:
+        barcode_class = barcode.get_barcode_class(barcode_type)
+        rv = BytesIO()
+        barcode_class(code, writer=writer).write(rv, options=options)
+    except (LibraryBarcodeError, ValueError, TypeError) as e:
+        raise BarcodeError(str(e))
+
+    return rv.getvalue()
+
+
+barcode_cache = BarcodeCache()
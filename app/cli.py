@@ -6,7 +6,8 @@ import uuid
 from flask import Flask
 from flask.cli import with_appcontext
 from app import db
-from app.models import User, Role
+from app.models import User, Role, Product, ProductCode
+from sqlalchemy import insert, inspect
 from werkzeug.security import generate_password_hash
 
 
@@ -103,8 +104,466 @@ def delete_user_command(email, confirm):
     click.echo(click.style(f'✓ User {user.username} deleted successfully!', fg='green'))
 
 
+@click.command('init-schema')
+@with_appcontext
+def init_schema_command():
+    """Create any missing tables, columns and indexes (existing columns are left untouched)"""
+    db.create_all()
+
+    # create_all() skips columns and indexes added to tables that already exist
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.exec_driver_sql(_add_column_sql(table, column))
+                    click.echo(f'  Added column {table.name}.{column.name}')
+                    if (table.name, column.name) == ('stock_movement', 'stock_take_id'):
+                        linked = _link_stock_take_movements(connection)
+                        click.echo(f'  Linked {linked} stock take adjustments')
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    click.echo(click.style('✓ Database schema is up to date', fg='green'))
+
+
+def _add_column_sql(table, column):
+    """ALTER TABLE statement adding a model column to an existing table"""
+    preparer = db.engine.dialect.identifier_preparer
+    sql = (f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} '
+           f'{column.type.compile(dialect=db.engine.dialect)}')
+    if column.server_default is not None:
+        sql += f" DEFAULT '{column.server_default.arg}'"
+    if not column.nullable and column.server_default is not None:
+        sql += ' NOT NULL'
+    for foreign_key in column.foreign_keys:
+        sql += (f' REFERENCES {preparer.format_table(foreign_key.column.table)}'
+                f' ({preparer.format_column(foreign_key.column)})')
+    return sql
+
+
+def _link_stock_take_movements(connection):
+    """Point adjustments applied before stock_take_id existed at their stock take (by its ST-<id> reference)"""
+    return connection.exec_driver_sql(
+        "UPDATE stock_movement SET stock_take_id = CAST(substr(reference, 4) AS INTEGER) "
+        "WHERE stock_take_id IS NULL AND movement_type = 'adjustment' AND reference LIKE 'ST-%' "
+        "AND CAST(substr(reference, 4) AS INTEGER) IN (SELECT id FROM stock_take WHERE status = 'applied')"
+    ).rowcount
+
+
+@click.command('backfill-product-codes')
+@click.option('--chunk-size', default=1000, help='Rows inserted per batch')
+@with_appcontext
+def backfill_product_codes_command(chunk_size):
+    """Populate the product_code lookup table from existing products"""
+    db.create_all()
+
+    owners = dict(db.session.query(ProductCode.code, ProductCode.product_id))
+    rows = []
+    inserted = 0
+    conflicts = []
+
+    products = db.session.query(
+        Product.id, Product.sku, Product.barcode, Product.rfid_tag
+    ).order_by(Product.id)
+
+    for product_id, *values in products:
+        for kind, code in zip(ProductCode.PRIMARY_KINDS.values(), values):
+            if not code:
+                continue
+            owner = owners.get(code)
+            if owner is not None:
+                if owner != product_id:
+                    conflicts.append((code, product_id, owner))
+                continue
+            owners[code] = product_id
+            rows.append({'code': code, 'kind': kind, 'product_id': product_id})
+
+        if len(rows) >= chunk_size:
+            db.session.execute(insert(ProductCode), rows)
+            inserted += len(rows)
+            rows = []
+
+    if rows:
+        db.session.execute(insert(ProductCode), rows)
+        inserted += len(rows)
+
+    db.session.commit()
+
+    click.echo(click.style(f'✓ Added {inserted} product codes', fg='green'))
+    for code, product_id, owner in conflicts:
+        click.echo(click.style(
+            f'  Skipped {code} on product {product_id}: already assigned to product {owner}', fg='yellow'
+        ))
+
+
+@click.command('rebuild-inventory-summary')
+@with_appcontext
+def rebuild_inventory_summary_command():
+    """Recompute the dashboard inventory summary from scratch"""
+    from app.utils import rebuild_inventory_summary
+
+    rows = rebuild_inventory_summary()
+    click.echo(click.style(f'✓ Inventory summary rebuilt ({rows} rows)', fg='green'))
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Create and repopulate the full-text product search index"""
+    from app.search import rebuild_search_index
+
+    indexed = rebuild_search_index()
+    if indexed is None:
+        click.echo(click.style('Full-text search is not supported by this database; using ILIKE search', fg='yellow'))
+        return
+
+    click.echo(click.style(f'✓ Search index rebuilt ({indexed} products)', fg='green'))
+
+
+@click.command('wal-checkpoint')
+@click.option('--mode', type=click.Choice(['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'], case_sensitive=False),
+              default='TRUNCATE', help='SQLite checkpoint mode')
+@with_appcontext
+def wal_checkpoint_command(mode):
+    """Checkpoint the SQLite write-ahead log into the database file"""
+    from app.database import checkpoint
+
+    if db.engine.dialect.name != 'sqlite':
+        click.echo(click.style('WAL checkpoints only apply to SQLite databases', fg='yellow'))
+        return
+
+    with db.engine.connect() as connection:
+        busy, wal_pages, checkpointed = checkpoint(connection.connection.dbapi_connection, mode.upper())
+
+    if wal_pages < 0:
+        click.echo(click.style('Database is not in WAL mode', fg='yellow'))
+        return
+
+    if busy:
+        click.echo(click.style(f'Checkpoint incomplete: database busy ({checkpointed}/{wal_pages} pages)', fg='yellow'))
+        return
+
+    click.echo(click.style(f'✓ WAL checkpointed ({checkpointed}/{wal_pages} pages)', fg='green'))
+
+
+@click.command('invalidate-user-cache')
+@with_appcontext
+def invalidate_user_cache_command():
+    """Drop cached users and roles in every worker (after editing them outside the app)"""
+    from app.principals import principal_cache
+
+    principal_cache.invalidate()
+    click.echo(click.style('✓ User cache invalidated', fg='green'))
+
+
+@click.command('purge-sessions')
+@with_appcontext
+def purge_sessions_command():
+    """Delete expired server-side sessions"""
+    from app.sessions import server_sessions
+
+    removed = server_sessions.purge()
+    click.echo(click.style(f'✓ Removed {removed} expired sessions', fg='green'))
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Purge, fingerprint and precompress static assets into static/dist"""
+    from flask import current_app
+    from app.assets import build_assets
+
+    try:
+        results = build_assets(current_app.static_folder, current_app.root_path)
+    except (OSError, ValueError) as e:
+        click.echo(click.style(f'Error building assets: {str(e)}', fg='red'))
+        return
+
+    for result in results:
+        compressed = ', '.join(f'{encoding} {result[encoding]:,}' for encoding in ('gzip', 'br') if encoding in result)
+        click.echo(f"  {result['source']} -> {result['output']} "
+                   f"({result['original']:,} -> {result['size']:,} bytes{'; ' + compressed if compressed else ''})")
+    click.echo(click.style(f'✓ Built {len(results)} assets (restart the app to load the new manifest)', fg='green'))
+
+
+@click.command('seed-bench')
+@click.option('--products', default=10000, help='Products to create')
+@click.option('--categories', default=50, help='Categories to create')
+@click.option('--movements', default=100000, help='Stock movements to create')
+@click.option('--days', default=365, help='Days of movement history')
+@click.option('--seed', default=42, help='Random seed (same seed, same data)')
+@click.option('--chunk-size', default=5000, help='Rows inserted per batch')
+@click.option('--username', default='bench', help='User the load benchmark logs in as')
+@click.option('--password', default='bench-password', help='Password for the benchmark user')
+@click.option('--yes', is_flag=True, help='Do not ask before adding to a database that has products')
+@with_appcontext
+def seed_bench_command(products, categories, movements, days, seed, chunk_size, username, password, yes):
+    """Bulk-insert synthetic products and stock movements for benchmarking"""
+    import time
+    from app.seed import seed_bench_data, bench_user
+
+    if not yes and db.session.query(Product.id).first() is not None:
+        click.confirm('The database already has products. Add benchmark data anyway?', abort=True)
+
+    user = bench_user(username, password)
+    totals = {}
+
+    def progress(stage, rows):
+        totals[stage] = totals.get(stage, 0) + rows
+        click.echo(f'\r  {stage}: {totals[stage]:,}   ', nl=False)
+
+    started = time.perf_counter()
+    counts = seed_bench_data(products=products, categories=categories, movements=movements, days=days,
+                             user_id=user.id, seed=seed, chunk_size=chunk_size, progress=progress)
+    elapsed = time.perf_counter() - started
+
+    click.echo()
+    click.echo(click.style(f'✓ Benchmark data created in {elapsed:.1f}s', fg='green'))
+    for table, count in counts.items():
+        click.echo(f'  {table}: {count:,}')
+    click.echo(f'  Login: {username} / {password}')
+
+
+@click.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=None, type=int, help='Rows written per transaction')
+@click.option('--user', 'username', default=None, help='User recorded on movements (default: first admin)')
+@click.option('--dry-run', is_flag=True, help='Validate and roll back every chunk')
+@click.option('--errors', 'errors_path', default=None, type=click.Path(dir_okay=False, writable=True),
+              help='Write every rejected row to this CSV file')
+@with_appcontext
+def import_products_command(path, chunk_size, username, dry_run, errors_path):
+    """Create or update products by SKU from a CSV file"""
+    import csv
+    import os
+    from flask import current_app
+    from app.importer import ProductImporter, CSVImportError
+
+    if username:
+        user = User.query.filter_by(username=username).first()
+    else:
+        user = User.query.filter(User.roles.any(Role.name == 'Admin')).order_by(User.id).first()
+    if user is None:
+        click.echo(click.style('Error: No user to record the import as (use --user)', fg='red'))
+        return
+
+    errors_file = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    on_error = None
+    if errors_file:
+        writer = csv.writer(errors_file)
+        writer.writerow(['line', 'sku', 'error'])
+        on_error = lambda line, sku, message: writer.writerow([line, sku or '', message])  # noqa: E731
+
+    importer = ProductImporter(
+        user.id,
+        chunk_size=chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', 1000),
+        dry_run=dry_run,
+        max_errors=20,
+        source=os.path.basename(path),
+        on_error=on_error,
+    )
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            report = importer.run(stream)
+    except CSVImportError as e:
+        click.echo(click.style(f'Error: {str(e)}', fg='red'))
+        return
+    finally:
+        if errors_file:
+            errors_file.close()
+
+    label = 'Validated' if dry_run else 'Imported'
+    click.echo(click.style(
+        f'✓ {label} {report.rows:,} rows in {report.elapsed:.1f}s ({report.rows_per_second:,.0f} rows/s)', fg='green'
+    ))
+    click.echo(f'  created: {report.created:,}  updated: {report.updated:,}  failed: {report.failed:,}')
+    click.echo(f'  initial stock movements: {report.movements:,}  new categories: {report.categories_created:,}')
+    for error in report.errors:
+        click.echo(click.style(f"  line {error['line']} ({error['sku'] or '-'}): {error['error']}", fg='yellow'))
+    if report.failed > len(report.errors):
+        click.echo(f'  ... {report.failed - len(report.errors):,} more'
+                   + (f' (see {errors_path})' if errors_path else ' (use --errors FILE to save them all)'))
+
+
+@click.command('export')
+@click.argument('dataset', type=click.Choice(['products', 'movements']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', help='Output format')
+@click.option('--output', '-o', default='-', type=click.Path(dir_okay=False, allow_dash=True),
+              help='File to write (default: stdout)')
+@click.option('--from', 'date_from', default=None, help='Movements on or after this date (YYYY-MM-DD)')
+@click.option('--to', 'date_to', default=None, help='Movements up to and including this date (YYYY-MM-DD)')
+@click.option('--sku', default=None, help='Movements of this product')
+@click.option('--user', 'username', default=None, help='Movements by this user')
+@with_appcontext
+def export_command(dataset, fmt, output, date_from, date_to, sku, username):
+    """Stream products or stock movements as CSV/NDJSON (e.g. from cron)"""
+    import time
+    from app.exports import PRODUCT_COLUMNS, MOVEMENT_COLUMNS, product_rows, movement_rows, stream_export, parse_date
+
+    if dataset == 'products':
+        columns, rows = PRODUCT_COLUMNS, product_rows()
+    else:
+        try:
+            filters = {'date_from': parse_date(date_from), 'date_to': parse_date(date_to, end=True)}
+        except ValueError:
+            raise click.BadParameter('--from and --to must be dates (YYYY-MM-DD)')
+        if sku:
+            filters['product_id'] = db.session.query(Product.id).filter_by(sku=sku).scalar()
+            if filters['product_id'] is None:
+                raise click.BadParameter(f'No product with SKU {sku}', param_hint='--sku')
+        if username:
+            filters['user_id'] = db.session.query(User.id).filter_by(username=username).scalar()
+            if filters['user_id'] is None:
+                raise click.BadParameter(f'No user {username}', param_hint='--user')
+        columns, rows = MOVEMENT_COLUMNS, movement_rows(**filters)
+
+    started = time.perf_counter()
+    written = 0
+    with click.open_file(output, 'wb') as stream:
+        for chunk in stream_export(fmt, columns, rows):
+            stream.write(chunk)
+            written += len(chunk)
+
+    if output != '-':
+        click.echo(click.style(
+            f'✓ Exported {dataset} to {output} ({written / 1024 / 1024:.1f} MB in {time.perf_counter() - started:.1f}s)',
+            fg='green'
+        ))
+
+
+@click.command('snapshot-stock')
+@click.option('--period', type=click.Choice(['daily', 'monthly']), default='daily', help='Snapshot period')
+@click.option('--at', 'at', default=None, help='Snapshot the period containing this date (YYYY-MM-DD, default: today)')
+@click.option('--keep-daily', default=None, type=int, help='Delete daily snapshots older than this many days')
+@with_appcontext
+def snapshot_stock_command(period, at, keep_daily):
+    """Record every product's stock at the start of the day/month (run from cron)"""
+    from datetime import datetime
+    from flask import current_app
+    from app.snapshots import take_snapshot, prune_snapshots
+
+    try:
+        moment = datetime.fromisoformat(at) if at else None
+    except ValueError:
+        raise click.BadParameter('must be a date (YYYY-MM-DD)', param_hint='--at')
+
+    snapshot, created = take_snapshot(period, moment)
+    if created:
+        click.echo(click.style(
+            f'✓ {period.capitalize()} snapshot as of {snapshot.taken_at:%Y-%m-%d %H:%M}: '
+            f'{snapshot.product_count:,} products, {snapshot.total_units:,} units', fg='green'
+        ))
+    else:
+        click.echo(f'{period.capitalize()} snapshot as of {snapshot.taken_at:%Y-%m-%d %H:%M} already exists')
+
+    if keep_daily is None:
+        keep_daily = current_app.config.get('SNAPSHOT_KEEP_DAILY', 35)
+    if keep_daily > 0:
+        pruned = prune_snapshots('daily', keep_daily)
+        if pruned:
+            click.echo(f'  Deleted {pruned} daily snapshots older than {keep_daily} days')
+
+
+@click.command('verify-snapshots')
+@click.option('--last', default=None, type=int, help='Only check the most recent N snapshots')
+@with_appcontext
+def verify_snapshots_command(last):
+    """Check snapshots against the stock movement ledger"""
+    from app.models import StockSnapshot
+    from app.snapshots import verify_snapshot, verify_current
+
+    snapshots = StockSnapshot.query.order_by(StockSnapshot.taken_at, StockSnapshot.id).all()
+    if not snapshots:
+        click.echo('No snapshots to verify')
+        return
+
+    failed = 0
+    for snapshot in snapshots[-last:] if last else snapshots:
+        differences = verify_snapshot(snapshot)
+        label = f'{snapshot.period} {snapshot.taken_at:%Y-%m-%d %H:%M}'
+        if differences:
+            failed += 1
+            click.echo(click.style(f'✗ {label}: {len(differences)} products differ from the ledger', fg='red'))
+            for product_id, stored, ledger in differences[:10]:
+                click.echo(f'    product {product_id}: snapshot {stored}, ledger {ledger}')
+        else:
+            click.echo(click.style(f'✓ {label}', fg='green'))
+
+    differences = verify_current()
+    if differences:
+        failed += 1
+        click.echo(click.style(f'✗ current stock: {len(differences)} products differ from their last movement '
+                               '(quantity changed without a movement?)', fg='red'))
+        for product_id, ledger, current in differences[:10]:
+            click.echo(f'    product {product_id}: ledger {ledger}, current {current}')
+    else:
+        click.echo(click.style('✓ current stock matches the ledger', fg='green'))
+
+    if failed:
+        raise click.exceptions.Exit(1)
+
+
+@click.command('rebuild-movement-rollups')
+@with_appcontext
+def rebuild_movement_rollups_command():
+    """Recompute the daily movement rollups from the stock movements"""
+    from app.utils import rebuild_movement_rollups
+
+    rows = rebuild_movement_rollups()
+    click.echo(click.style(f'✓ Movement rollups rebuilt ({rows:,} product-days)', fg='green'))
+
+
+@click.command('compute-forecasts')
+@click.option('--window', 'window_days', default=None, type=int, help='Days of history (default FORECAST_WINDOW_DAYS)')
+@click.option('--lead-time', 'lead_time_days', default=None, type=float,
+              help='Supplier lead time in days (default FORECAST_LEAD_TIME_DAYS)')
+@click.option('--service-level', default=None, type=float, help='e.g. 0.95 (default FORECAST_SERVICE_LEVEL)')
+@with_appcontext
+def compute_forecasts_command(window_days, lead_time_days, service_level):
+    """Recompute consumption velocity and reorder points for all products"""
+    import time
+
+    try:
+        from app.forecast import compute_forecasts
+    except ImportError:
+        click.echo(click.style('Error: forecasting requires NumPy (pip install -r requirements.txt)', fg='red'))
+        raise click.exceptions.Exit(1)
+
+    started = time.perf_counter()
+    try:
+        counts = compute_forecasts(window_days=window_days, lead_time_days=lead_time_days,
+                                   service_level=service_level)
+    except ValueError as e:
+        click.echo(click.style(f'Error: {str(e)}', fg='red'))
+        raise click.exceptions.Exit(1)
+    elapsed = time.perf_counter() - started
+
+    click.echo(click.style(
+        f"✓ Forecasts computed for {counts['products']:,} products in {elapsed:.1f}s", fg='green'
+    ))
+    click.echo(f"  With demand: {counts['with_demand']:,}")
+    click.echo(f"  At or below reorder point: {counts['to_reorder']:,}")
+
+
 def register_commands(app: Flask):
     """Register CLI commands with Flask app"""
     app.cli.add_command(create_user_command)
+    app.cli.add_command(init_schema_command)
     app.cli.add_command(list_users_command)
     app.cli.add_command(delete_user_command)
+    app.cli.add_command(backfill_product_codes_command)
+    app.cli.add_command(rebuild_inventory_summary_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(wal_checkpoint_command)
+    app.cli.add_command(purge_sessions_command)
+    app.cli.add_command(invalidate_user_cache_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(seed_bench_command)
+    app.cli.add_command(import_products_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(snapshot_stock_command)
+    app.cli.add_command(verify_snapshots_command)
+    app.cli.add_command(rebuild_movement_rollups_command)
+    app.cli.add_command(compute_forecasts_command)
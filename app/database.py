@@ -0,0 +1,267 @@
+"""Engine configuration: read/write routing, pool metrics and SQLite tuning"""
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Delete, Insert, Update, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Bind key of the read-only engine in SQLALCHEMY_BINDS
+READONLY_BIND = 'readonly'
+
+# Pragmas that write to the database file and cannot run on read-only connections
+WRITE_PRAGMAS = ('journal_mode', 'synchronous', 'wal_autocheckpoint')
+
+
+def configure_engines(app):
+    """
+    Fill in engine options and the read-only bind before ``db.init_app``
+
+    The default engine keeps a small, dedicated pool for the write path.
+    When ``DB_READONLY_ROUTING`` is on, a ``readonly`` bind is added: the
+    ``DATABASE_READONLY_URL`` if set, otherwise the same SQLite file opened
+    with ``mode=ro``.
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    # In-memory SQLite uses a StaticPool, which takes no sizing options
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options.setdefault('poolclass', TimedQueuePool)
+        options.setdefault('pool_size', app.config.get('DB_WRITE_POOL_SIZE', 2))
+        options.setdefault('max_overflow', app.config.get('DB_WRITE_POOL_OVERFLOW', 2))
+        options.setdefault('pool_timeout', app.config.get('DB_POOL_TIMEOUT', 30))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    if app.config.get('DB_READONLY_ROUTING') and READONLY_BIND not in binds:
+        readonly_url = app.config.get('DATABASE_READONLY_URL') or readonly_sqlite_url(url)
+        if readonly_url:
+            # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS
+            bind = {
+                'url': readonly_url,
+                'poolclass': TimedQueuePool,
+                'pool_size': app.config.get('DB_READ_POOL_SIZE', 10),
+                'max_overflow': app.config.get('DB_READ_POOL_OVERFLOW', 10),
+                'pool_timeout': app.config.get('DB_POOL_TIMEOUT', 30),
+            }
+            if 'connect_args' in options and make_url(readonly_url).get_backend_name() == url.get_backend_name():
+                bind['connect_args'] = options['connect_args']
+            binds[READONLY_BIND] = bind
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def dispose_engines_after_fork(app):
+    """
+    Drop pooled connections inherited from the parent in forked processes
+
+    With gunicorn's ``preload_app`` the app (and any connection it opened)
+    is created in the master; sharing those SQLite handles across workers
+    is unsafe, so each child starts with empty pools. ``close=False``
+    leaves the parent's connections untouched.
+    """
+    from app import db
+
+    def after_fork():
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=after_fork)
+
+
+def readonly_sqlite_url(database_uri):
+    """
+    Read-only URI for a file-backed SQLite database
+
+    Returns:
+        ``sqlite:///file:<path>?mode=ro&uri=true``, or None for other
+        backends and in-memory databases
+    """
+    url = make_url(database_uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    if url.query.get('uri'):
+        return None
+
+    return str(url.set(database=f'file:{url.database}', query={'mode': 'ro', 'uri': 'true'}))
+
+
+def read_only(view):
+    """
+    Route a view's reads to the read-only engine
+
+    Writes still go to the default engine: flushes and INSERT/UPDATE/DELETE
+    statements are never routed to the read-only bind.
+    """
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return decorated_view
+
+
+class RoutingSession(Session):
+    """Session that sends reads from read-only views to the ``readonly`` bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing
+                and has_request_context() and g.get('db_read_only')
+                and not isinstance(clause, (Insert, Update, Delete))):
+            engine = self._db.engines.get(READONLY_BIND)
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._wait_lock = threading.Lock()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def pool_stats(db):
+    """
+    Connection pool sizes and checkout wait times for each engine in this worker
+
+    Returns:
+        Dict of bind name ('default' or the bind key) to pool statistics
+    """
+    stats = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__, 'pid': os.getpid()}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'max_overflow': pool._max_overflow,
+            })
+        if isinstance(pool, TimedQueuePool):
+            entry.update({
+                'checkouts': pool.wait_count,
+                'wait_total_ms': round(pool.wait_total * 1000, 3),
+                'wait_avg_ms': round(pool.wait_total * 1000 / pool.wait_count, 3) if pool.wait_count else 0.0,
+                'wait_max_ms': round(pool.wait_max * 1000, 3),
+            })
+        stats[key or 'default'] = entry
+    return stats
+
+
+class SQLiteTuning:
+    """
+    Apply the configured ``SQLITE_PRAGMAS`` profile to new SQLite connections
+
+    Pragmas such as journal_mode, synchronous and mmap_size are
+    per-connection (WAL persists in the file, the rest does not), so they
+    are set from a ``connect`` event rather than once at startup. When WAL
+    is enabled a passive checkpoint is also run every
+    ``SQLITE_CHECKPOINT_INTERVAL`` seconds as connections are returned to
+    the pool, so the WAL file does not grow without bound between the
+    automatic checkpoints.
+    """
+
+    def __init__(self):
+        self.pragmas = {}
+        self.checkpoint_interval = 0
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Attach the pragma and checkpoint hooks to the app's SQLite engines"""
+        from app import db
+
+        self.pragmas = dict(app.config.get('SQLITE_PRAGMAS') or {})
+        self.checkpoint_interval = app.config.get('SQLITE_CHECKPOINT_INTERVAL', 0)
+
+        with app.app_context():
+            engines = dict(db.engines)
+
+        for key, engine in engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+
+            if key == READONLY_BIND:
+                pragmas = {name: value for name, value in self.pragmas.items() if name not in WRITE_PRAGMAS}
+                pragmas['query_only'] = 1
+            else:
+                pragmas = self.pragmas
+            if pragmas:
+                event.listen(engine, 'connect', self._pragma_listener(pragmas))
+
+        engine = engines.get(None)
+        if (engine is not None and engine.dialect.name == 'sqlite' and self.checkpoint_interval
+                and str(self.pragmas.get('journal_mode', '')).upper() == 'WAL'):
+            event.listen(engine, 'checkin', self._on_checkin)
+
+    @staticmethod
+    def _pragma_listener(pragmas):
+        def on_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name} = {value}')
+            finally:
+                cursor.close()
+        return on_connect
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        if dbapi_connection is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_checkpoint < self.checkpoint_interval:
+                return
+            self._last_checkpoint = now
+
+        try:
+            checkpoint(dbapi_connection, 'PASSIVE')
+        except Exception as e:
+            print(f"Error running WAL checkpoint: {str(e)}")
+
+
+def checkpoint(dbapi_connection, mode='PASSIVE'):
+    """
+    Run a WAL checkpoint on a raw SQLite connection
+
+    Args:
+        dbapi_connection: sqlite3 connection
+        mode: PASSIVE, FULL, RESTART or TRUNCATE
+
+    Returns:
+        Tuple of (busy, WAL pages, pages checkpointed)
+    """
+    if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f'Invalid checkpoint mode: {mode}')
+
+    cursor = dbapi_connection.cursor()
+    try:
+        return tuple(cursor.execute(f'PRAGMA wal_checkpoint({mode})').fetchone())
+    finally:
+        cursor.close()
+
+
+sqlite_tuning = SQLiteTuning()
@@ -0,0 +1,167 @@
+"""Streamed CSV/NDJSON exports of products and stock movements"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import db
+from app.models import Category, Product, StockMovement, User
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+PRODUCT_COLUMNS = ('id', 'sku', 'name', 'barcode', 'rfid_tag', 'category_en', 'category_bg', 'quantity',
+                   'min_stock_level', 'unit_price', 'value', 'location', 'created_at', 'updated_at')
+MOVEMENT_COLUMNS = ('id', 'created_at', 'product_id', 'sku', 'product_name', 'movement_type', 'quantity',
+                    'previous_quantity', 'new_quantity', 'user_id', 'username', 'reference', 'notes')
+STOCK_AS_OF_COLUMNS = ('product_id', 'sku', 'name', 'quantity')
+
+# Rows fetched per round trip and rows encoded per yielded chunk
+YIELD_PER = 2000
+ROWS_PER_CHUNK = 500
+
+
+def product_rows(yield_per=YIELD_PER):
+    """
+    All products with their category names and stock value (quantity x unit price)
+
+    Yields:
+        Tuples in PRODUCT_COLUMNS order
+    """
+    query = (
+        db.session.query(
+            Product.id, Product.sku, Product.name, Product.barcode, Product.rfid_tag,
+            Category.name_en, Category.name_bg, Product.quantity, Product.min_stock_level,
+            Product.unit_price, Product.location, Product.created_at, Product.updated_at,
+        )
+        .outerjoin(Category, Product.category_id == Category.id)
+        .order_by(Product.id)
+        .execution_options(yield_per=yield_per)
+    )
+    for row in query:
+        *head, unit_price, location, created_at, updated_at = row
+        value = (unit_price or Decimal('0')) * row.quantity
+        yield (*head, unit_price, value, location, created_at, updated_at)
+
+
+def movement_rows(date_from=None, date_to=None, product_id=None, user_id=None, yield_per=YIELD_PER):
+    """
+    Stock movements in id (insertion) order, so no sort is needed however many match
+
+    Args:
+        date_from: Only movements at or after this datetime
+        date_to: Only movements before this datetime
+        product_id: Only movements of this product
+        user_id: Only movements by this user
+
+    Yields:
+        Tuples in MOVEMENT_COLUMNS order
+    """
+    query = (
+        db.session.query(
+            StockMovement.id, StockMovement.created_at, StockMovement.product_id, Product.sku, Product.name,
+            StockMovement.movement_type, StockMovement.quantity, StockMovement.previous_quantity,
+            StockMovement.new_quantity, StockMovement.user_id, User.username, StockMovement.reference,
+            StockMovement.notes,
+        )
+        .join(Product, StockMovement.product_id == Product.id)
+        .outerjoin(User, StockMovement.user_id == User.id)
+    )
+    if date_from is not None:
+        query = query.filter(StockMovement.created_at >= date_from)
+    if date_to is not None:
+        query = query.filter(StockMovement.created_at < date_to)
+    if product_id is not None:
+        query = query.filter(StockMovement.product_id == product_id)
+    if user_id is not None:
+        query = query.filter(StockMovement.user_id == user_id)
+
+    yield from query.order_by(StockMovement.id).execution_options(yield_per=yield_per)
+
+
+def stock_as_of_rows(at, yield_per=YIELD_PER):
+    """
+    Every product's stock at a point in time, replayed from the nearest snapshot
+
+    Yields:
+        Tuples in STOCK_AS_OF_COLUMNS order
+    """
+    from app.snapshots import nearest_snapshot, quantities_as_of
+
+    replay = quantities_as_of(at, nearest_snapshot(at)).subquery()
+    query = (
+        db.session.query(Product.id, Product.sku, Product.name, replay.c.quantity)
+        .join(replay, replay.c.id == Product.id)
+        .order_by(Product.id)
+        .execution_options(yield_per=yield_per)
+    )
+    yield from query
+
+
+def stream_csv(columns, rows, rows_per_chunk=ROWS_PER_CHUNK):
+    """Encode rows as CSV with a header, yielding bytes every ``rows_per_chunk`` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_csv_value(value) for value in row])
+        if count % rows_per_chunk == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def stream_ndjson(columns, rows, rows_per_chunk=ROWS_PER_CHUNK):
+    """Encode rows as newline-delimited JSON objects, yielding bytes every ``rows_per_chunk`` rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=_json_value, ensure_ascii=False))
+        if len(lines) >= rows_per_chunk:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def stream_export(fmt, columns, rows):
+    """Encoder for an export format ('csv' or 'ndjson')"""
+    encoder = stream_csv if fmt == 'csv' else stream_ndjson
+    return encoder(columns, rows)
+
+
+def parse_date(value, end=False):
+    """
+    Parse a YYYY-MM-DD (or ISO datetime) filter value
+
+    A bare date used as an end bound covers that whole day.
+
+    Raises:
+        ValueError: If the value is not a date
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _drain(buffer):
+    data = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return value
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
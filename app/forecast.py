@@ -0,0 +1,132 @@
+"""Consumption velocity, days of cover and reorder points, computed for all products at once with NumPy"""
+import math
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+
+from app import db
+from app.models import MovementRollup, Product, ProductForecast
+
+# Forecast rows written per statement
+CHUNK_SIZE = 5000
+
+
+def compute_forecasts(window_days=None, half_life_days=None, lead_time_days=None, service_level=None,
+                      today=None):
+    """
+    Recompute every product's forecast from the daily movement rollups
+
+    Demand is the units going out per day; adjustments are not demand.
+    Per product, over the full days of the window (fewer for products
+    created inside it):
+
+    - velocity: recency-weighted mean daily demand, the weight of a day
+      halving every ``half_life_days``; days without movements count as zero
+    - demand_std: standard deviation of daily demand
+    - reorder_point: demand over the lead time plus safety stock for the
+      service level, ceil(velocity * L + z * std * sqrt(L))
+
+    The rollups of all products are loaded as flat arrays and reduced per
+    product with ``np.bincount``; nothing loops over products. The previous
+    forecasts are replaced in one transaction.
+
+    Args:
+        window_days: Days of history (default FORECAST_WINDOW_DAYS)
+        half_life_days: Recency half-life (default FORECAST_HALF_LIFE_DAYS)
+        lead_time_days: Supplier lead time (default FORECAST_LEAD_TIME_DAYS)
+        service_level: Chance of no stockout before a reorder arrives (default FORECAST_SERVICE_LEVEL)
+        today: UTC date the window ends before (default today)
+
+    Returns:
+        dict with products, with_demand and to_reorder counts
+    """
+    config = current_app.config
+    window_days = window_days or config.get('FORECAST_WINDOW_DAYS', 90)
+    half_life_days = half_life_days or config.get('FORECAST_HALF_LIFE_DAYS', 14)
+    lead_time_days = lead_time_days if lead_time_days is not None else config.get('FORECAST_LEAD_TIME_DAYS', 7)
+    service_level = service_level or config.get('FORECAST_SERVICE_LEVEL', 0.95)
+    if not 0 < service_level < 1:
+        raise ValueError('The service level must be between 0 and 1')
+
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=window_days)
+    end_day = np.datetime64(today, 'D')
+
+    connection = db.session.connection()
+    products = Product.__table__.c
+    rollups = MovementRollup.__table__.c
+
+    # Products, in id order so rollups are placed by binary search
+    rows = connection.execute(
+        select(products.id, products.quantity, func.date(products.created_at)).order_by(products.id)
+    ).all()
+    if not rows:
+        connection.execute(ProductForecast.__table__.delete())
+        db.session.commit()
+        return {'products': 0, 'with_demand': 0, 'to_reorder': 0}
+
+    ids, quantities, created = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+    quantities = np.array(quantities, dtype=np.float64)
+    created = np.array([moment or start for moment in created], dtype='datetime64[D]')
+    days = np.clip((end_day - created).astype(np.int64), 1, window_days)
+
+    # Daily demand of every product as flat arrays, read one day at a time
+    # (an index range scan each) so the age of every row is known up front
+    index, age, demand = [], [], []
+    for days_ago in range(window_days):
+        day_rows = connection.execute(
+            select(rollups.product_id, rollups.units_out)
+            .where(rollups.day == today - timedelta(days=days_ago + 1), rollups.units_out > 0)
+        ).all()
+        if day_rows:
+            day_ids, day_demand = zip(*day_rows)
+            day_ids = np.array(day_ids, dtype=np.int64)
+            position = np.minimum(np.searchsorted(ids, day_ids), len(ids) - 1)
+            # Rollups of products not loaded (e.g. deleted since) are dropped
+            # rather than credited to the neighbouring product
+            known = ids[position] == day_ids
+            index.append(position[known])
+            age.append(np.full(int(known.sum()), days_ago, dtype=np.int64))
+            demand.append(np.array(day_demand, dtype=np.float64)[known])
+    index = np.concatenate(index) if index else np.empty(0, dtype=np.int64)
+    age = np.concatenate(age) if age else np.empty(0, dtype=np.int64)
+    demand = np.concatenate(demand) if demand else np.empty(0, dtype=np.float64)
+
+    weights = 0.5 ** (np.arange(window_days) / half_life_days)
+    weighted = np.bincount(index, weights=demand * weights[age], minlength=len(ids))
+    velocity = weighted / np.cumsum(weights)[days - 1]
+
+    total = np.bincount(index, weights=demand, minlength=len(ids))
+    squares = np.bincount(index, weights=demand * demand, minlength=len(ids))
+    mean = total / days
+    demand_std = np.sqrt(np.maximum(squares / days - mean * mean, 0.0))
+
+    z = NormalDist().inv_cdf(service_level)
+    reorder_point = np.ceil(velocity * lead_time_days + z * demand_std * math.sqrt(lead_time_days))
+    reorder_point = np.where(velocity > 0, reorder_point, 0).astype(np.int64)
+
+    computed_at = datetime.utcnow()
+    rows = [
+        {'product_id': product_id, 'velocity': rate, 'demand_std': std, 'reorder_point': point,
+         'computed_at': computed_at}
+        for product_id, rate, std, point in zip(ids.tolist(), velocity.tolist(), demand_std.tolist(),
+                                                reorder_point.tolist())
+    ]
+    try:
+        connection.execute(ProductForecast.__table__.delete())
+        for i in range(0, len(rows), CHUNK_SIZE):
+            connection.execute(ProductForecast.__table__.insert(), rows[i:i + CHUNK_SIZE])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'products': len(ids),
+        'with_demand': int(np.count_nonzero(velocity > 0)),
+        'to_reorder': int(np.count_nonzero((velocity > 0) & (quantities <= reorder_point))),
+    }
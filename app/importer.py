@@ -0,0 +1,379 @@
+"""Streaming CSV product import with chunked bulk upserts"""
+import csv
+import json
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import has_request_context
+from sqlalchemy import delete, insert, update, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models import Category, MovementRollup, Product, ProductCode, StockMovement
+
+# Recognised header names (case-insensitive); sku and name are required
+IMPORT_COLUMNS = ('sku', 'name', 'description', 'barcode', 'rfid_tag', 'quantity',
+                  'min_stock_level', 'unit_price', 'location', 'category')
+REQUIRED_COLUMNS = ('sku', 'name')
+COLUMN_ALIASES = {'rfid': 'rfid_tag', 'price': 'unit_price', 'min_stock': 'min_stock_level', 'qty': 'quantity'}
+
+# Column lengths from the Product model
+MAX_LENGTHS = {'sku': 100, 'name': 200, 'barcode': 100, 'rfid_tag': 100, 'location': 100, 'category': 100}
+
+# Product columns besides the SKU that carry a lookup code in product_code
+CODE_COLUMNS = {name: kind for name, kind in ProductCode.PRIMARY_KINDS.items() if name != 'sku'}
+
+
+class CSVImportError(ValueError):
+    """Raised when a file cannot be imported at all (e.g. missing required columns)"""
+
+
+class ImportReport:
+    """Counters and the first ``max_errors`` row errors of an import"""
+
+    def __init__(self, max_errors=1000):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.movements = 0
+        self.categories_created = 0
+        self.errors = []
+        self.elapsed = 0.0
+        self.dry_run = False
+
+    def error(self, line, sku, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'sku': sku, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'movements': self.movements,
+            'categories_created': self.categories_created,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+            'dry_run': self.dry_run,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+class ProductImporter:
+    """
+    Upsert products by SKU from a CSV stream
+
+    Rows are read one at a time and applied in chunks of ``chunk_size``:
+    each chunk is validated against the database with a few IN queries,
+    then written with bulk INSERT/UPDATE statements and committed as one
+    transaction. New products with a quantity get an 'in' movement
+    ("Initial stock"); the quantity of existing products is never changed
+    by an import. Empty cells leave existing values untouched. A single
+    summary audit entry is written at the end.
+
+    Bulk statements bypass the ORM events, so the inventory summary is
+    rebuilt and the scan code cache invalidated once after the last chunk.
+    """
+
+    def __init__(self, user_id, chunk_size=1000, dry_run=False, max_errors=1000, source=None, on_error=None):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.source = source
+        self.on_error = on_error
+        self.report = ImportReport(max_errors=max_errors)
+        self.report.dry_run = dry_run
+        self._categories = None
+        self._seen = set()
+
+    def run(self, stream):
+        """
+        Import every row of a text stream (opened with ``newline=''``)
+
+        Returns:
+            ImportReport
+
+        Raises:
+            CSVImportError: If the header lacks a required column
+        """
+        from app.scan_cache import scan_cache
+        from app.utils import rebuild_inventory_summary
+
+        started = time.perf_counter()
+        reader = csv.DictReader(stream)
+        columns = self._read_header(reader)
+
+        chunk = []
+        try:
+            for row in reader:
+                if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+                    continue
+                self.report.rows += 1
+                parsed = self._parse(row, reader.line_num, columns)
+                if parsed is not None:
+                    chunk.append(parsed)
+                if len(chunk) >= self.chunk_size:
+                    self._apply(chunk)
+                    chunk = []
+            if chunk:
+                self._apply(chunk)
+        except (csv.Error, UnicodeDecodeError) as e:
+            self._error(reader.line_num, None, f'Unreadable CSV, import stopped: {str(e)}')
+        finally:
+            if not self.dry_run and (self.report.created or self.report.updated):
+                rebuild_inventory_summary()
+                scan_cache.invalidate()
+            self.report.elapsed = time.perf_counter() - started
+
+        if not self.dry_run:
+            self._audit()
+        return self.report
+
+    def _read_header(self, reader):
+        if not reader.fieldnames:
+            raise CSVImportError('The file is empty')
+
+        columns = {}
+        for field in reader.fieldnames:
+            name = (field or '').strip().lower().replace(' ', '_')
+            name = COLUMN_ALIASES.get(name, name)
+            if name in IMPORT_COLUMNS and name not in columns.values():
+                columns[field] = name
+
+        missing = [name for name in REQUIRED_COLUMNS if name not in columns.values()]
+        if missing:
+            raise CSVImportError(f'Missing required column(s): {", ".join(missing)}')
+        return columns
+
+    def _parse(self, row, line, columns):
+        """Validate a CSV row; returns a dict of set values, or None after recording an error"""
+        values = {}
+        for field, name in columns.items():
+            value = (row.get(field) or '').strip()
+            if value:
+                values[name] = value
+
+        sku = values.get('sku')
+        if not sku or not values.get('name'):
+            self._error(line, sku, 'SKU and name are required')
+            return None
+
+        for name, limit in MAX_LENGTHS.items():
+            if len(values.get(name, '')) > limit:
+                self._error(line, sku, f'{name} is longer than {limit} characters')
+                return None
+
+        if sku in self._seen:
+            self._error(line, sku, 'Duplicate SKU in file')
+            return None
+
+        try:
+            for name in ('quantity', 'min_stock_level'):
+                if name in values:
+                    values[name] = int(values[name])
+                    if values[name] < 0:
+                        raise ValueError(f'{name} must not be negative')
+            if 'unit_price' in values:
+                values['unit_price'] = Decimal(values['unit_price'].replace(',', '.')).quantize(Decimal('0.01'))
+                if values['unit_price'] < 0 or not values['unit_price'].is_finite():
+                    raise ValueError('unit_price must be a non-negative number')
+        except (ValueError, InvalidOperation) as e:
+            message = str(e) if 'must' in str(e) else 'quantity, min_stock_level and unit_price must be numbers'
+            self._error(line, sku, message)
+            return None
+
+        self._seen.add(sku)
+        values['line'] = line
+        return values
+
+    def _apply(self, chunk):
+        """Resolve a chunk against the database and write it in one transaction"""
+        now = datetime.utcnow()
+        skus = [row['sku'] for row in chunk]
+        existing = {
+            sku: (product_id, barcode, rfid_tag)
+            for sku, product_id, barcode, rfid_tag in db.session.query(
+                Product.sku, Product.id, Product.barcode, Product.rfid_tag
+            ).filter(Product.sku.in_(skus))
+        }
+        codes = {row[name] for row in chunk for name in ('sku', *CODE_COLUMNS) if row.get(name)}
+        owners = dict(db.session.query(ProductCode.code, ProductCode.product_id).filter(ProductCode.code.in_(codes)))
+
+        category_error = self._create_categories(chunk)
+
+        new_products, updates, stale_codes, new_codes, applied = [], [], [], [], []
+        claimed = {}
+        for row in chunk:
+            product_id, *current = existing.get(row['sku'], (None, None, None))
+
+            conflict = None
+            for name in ('sku', *CODE_COLUMNS):
+                code = row.get(name)
+                if not code:
+                    continue
+                owner = owners.get(code)
+                if owner is not None and owner != product_id:
+                    conflict = f'{name} {code} is already assigned to product {owner}'
+                elif claimed.get(code, row['sku']) != row['sku']:
+                    conflict = f'{name} {code} is also used by SKU {claimed[code]} in this file'
+                if conflict:
+                    break
+            if conflict:
+                self._error(row['line'], row['sku'], conflict)
+                continue
+            for name in ('sku', *CODE_COLUMNS):
+                if row.get(name):
+                    claimed[row[name]] = row['sku']
+
+            category = row.get('category')
+            category_id = self._categories.get(category.lower()) if category else None
+            if category and category_id is None and not self.dry_run:
+                self._error(row['line'], row['sku'], f'Could not create category: {category_error}')
+                continue
+
+            fields = {name: row[name] for name in ('name', 'description', 'barcode', 'rfid_tag',
+                                                   'min_stock_level', 'unit_price', 'location') if name in row}
+            if category_id is not None:
+                fields['category_id'] = category_id
+
+            if product_id is None:
+                fields.update(sku=row['sku'], quantity=row.get('quantity', 0), created_at=now, updated_at=now)
+                new_products.append(fields)
+            else:
+                fields.update(id=product_id, updated_at=now)
+                updates.append(fields)
+                before = ProductCode.primary_codes({'sku': row['sku'], **dict(zip(CODE_COLUMNS, current))})
+                after = ProductCode.primary_codes({
+                    'sku': row['sku'], **{name: row.get(name) or old for name, old in zip(CODE_COLUMNS, current)}
+                })
+                stale_codes.extend((product_id, code) for code, kind in before.items() if after.get(code) != kind)
+                new_codes.extend({'code': code, 'kind': kind, 'product_id': product_id}
+                                 for code, kind in after.items() if before.get(code) != kind)
+            applied.append(row)
+
+        try:
+            movements = []
+            if new_products:
+                ids = db.session.scalars(
+                    insert(Product).returning(Product.id, sort_by_parameter_order=True), new_products
+                ).all()
+                for product_id, fields in zip(ids, new_products):
+                    new_codes.extend({'code': code, 'kind': kind, 'product_id': product_id}
+                                     for code, kind in ProductCode.primary_codes(fields).items())
+                    if fields['quantity'] > 0:
+                        movements.append({
+                            'product_id': product_id, 'user_id': self.user_id, 'movement_type': 'in',
+                            'quantity': fields['quantity'], 'previous_quantity': 0,
+                            'new_quantity': fields['quantity'], 'notes': 'Initial stock (import)',
+                            'reference': (self.source or '')[:100] or None, 'created_at': now,
+                        })
+
+            if updates:
+                # ORM bulk UPDATE by primary key; rows are grouped by the columns they set
+                db.session.execute(update(Product), updates)
+            if stale_codes:
+                db.session.execute(delete(ProductCode).where(
+                    tuple_(ProductCode.product_id, ProductCode.code).in_(stale_codes)
+                ))
+            if new_codes:
+                db.session.execute(insert(ProductCode), new_codes)
+            if movements:
+                db.session.execute(insert(StockMovement), movements)
+                MovementRollup.apply_movements(db.session.connection(), movements)
+
+            if self.dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            message = str(getattr(e, 'orig', None) or e)
+            for row in applied:
+                self._error(row['line'], row['sku'], f'Chunk not imported: {message}')
+            return
+
+        self.report.created += len(new_products)
+        self.report.updated += len(updates)
+        self.report.movements += len(movements)
+
+    def _create_categories(self, chunk):
+        """
+        Load the category ids by name (English or Bulgarian) and create the
+        chunk's unknown categories in their own committed transaction
+
+        Creating them ahead of the chunk keeps the cached ids valid when the
+        chunk itself is rolled back. A dry run creates nothing.
+
+        Returns:
+            The error message if the categories could not be created, else None
+        """
+        if self._categories is None:
+            self._categories = {}
+            for category_id, name_en, name_bg in db.session.query(Category.id, Category.name_en, Category.name_bg):
+                self._categories.setdefault(name_en.lower(), category_id)
+                self._categories.setdefault(name_bg.lower(), category_id)
+
+        missing = {}
+        for row in chunk:
+            name = row.get('category')
+            if name and name.lower() not in self._categories:
+                missing.setdefault(name.lower(), name)
+        if not missing or self.dry_run:
+            return None
+
+        now = datetime.utcnow()
+        try:
+            ids = db.session.scalars(
+                insert(Category).returning(Category.id, sort_by_parameter_order=True),
+                [{'name_en': name, 'name_bg': name, 'created_at': now} for name in missing.values()]
+            ).all()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            return str(getattr(e, 'orig', None) or e)
+
+        self._categories.update(zip(missing, ids))
+        self.report.categories_created += len(ids)
+        return None
+
+    def _error(self, line, sku, message):
+        self.report.error(line, sku, message)
+        if self.on_error is not None:
+            self.on_error(line, sku, message)
+
+    def _audit(self):
+        """One summary audit entry for the whole import"""
+        from app.audit import audit_sink
+        from app.utils import log_audit
+
+        details = {key: value for key, value in self.report.to_dict().items() if key not in ('errors', 'dry_run')}
+        details['source'] = self.source
+
+        try:
+            # Committed here rather than left to the request's unit of work,
+            # which a rendered result page may autoflush before it ends
+            if has_request_context():
+                log_audit('products_imported', 'product', details=details, commit=False)
+            else:
+                audit_sink.write({
+                    'user_id': self.user_id,
+                    'action': 'products_imported',
+                    'resource_type': 'product',
+                    'details': json.dumps(details),
+                    'user_agent': 'flask import-products',
+                    'created_at': datetime.utcnow(),
+                }, commit=False)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error logging audit: {str(e)}")
+            db.session.rollback()
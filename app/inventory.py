@@ -1,32 +1,40 @@
 """Inventory management routes"""
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import csv
+import io
+from datetime import datetime
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify,
+                   current_app, stream_with_context)
 from flask_login import login_required, current_user
-from app import db
-from app.models import Product, Category, StockMovement
-from app.utils import (log_audit, record_stock_movement, generate_barcode,
-                      get_user_language, paginate_query)
+from flask_security import roles_accepted
+from app import db, limiter
+from sqlalchemy.orm import joinedload
+from app.models import Product, Category, StockMovement, ProductCode, StockTake, StockTakeLine
+from app.database import read_only
+from app.barcodes import barcode_cache, BarcodeError, MIMETYPES
+from app.labels import printable_code, render_label_pages, stream_label_zip, stream_label_pdf
+from app.importer import ProductImporter, CSVImportError, IMPORT_COLUMNS
+from app.exports import (FORMATS, PRODUCT_COLUMNS, MOVEMENT_COLUMNS, STOCK_AS_OF_COLUMNS, product_rows,
+                         movement_rows, stock_as_of_rows, stream_export, parse_date)
+from app.snapshots import nearest_snapshot, quantities_as_of
+from app.stocktake import (StockTakeError, REVIEW_ROWS, add_count_lines, read_count_csv, reconcile,
+                           apply_stock_take, cancel_stock_take)
+from app.pagination import keyset_paginate, cached_count
+from app.search import apply_product_search
+from app.utils import (log_audit, record_stock_movement,
+                      get_user_language, code_in_use, sync_product_codes,
+                      get_inventory_summary, find_product_by_code)
 
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/inventory')
 
 
-@inventory_bp.route('/products')
-@login_required
-def list_products():
-    """List all products with search and filter"""
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    category_id = request.args.get('category', type=int)
-    low_stock = request.args.get('low_stock', False, type=bool)
-
-    query = Product.query
+def _product_list_query(search, category_id, low_stock):
+    """Build the filtered product query and its pagination keys"""
+    query = Product.query.options(joinedload(Product.category))
 
-    # Search filter
+    # Search filter, ordered by relevance when the full-text index is used
+    keys = None
     if search:
-        query = query.filter(
-            (Product.name.ilike(f'%{search}%')) |
-            (Product.sku.ilike(f'%{search}%')) |
-            (Product.barcode.ilike(f'%{search}%'))
-        )
+        query, keys = apply_product_search(query, search)
 
     # Category filter
     if category_id:
@@ -37,10 +45,37 @@ def list_products():
         query = query.filter(Product.quantity <= Product.min_stock_level)
 
     # Order by name
-    query = query.order_by(Product.name)
+    return query, keys or [Product.name, Product.id]
+
+
+def _product_list_total(query, search, category_id, low_stock):
+    """Total for the product list: from the summary table, or a cached count when filtered"""
+    if not (search or category_id or low_stock):
+        summary, _ = get_inventory_summary()
+        return summary.product_count
+
+    return cached_count(query, ('products', search, category_id, low_stock),
+                        ttl=current_app.config.get('PAGINATION_COUNT_TTL', 60))
+
+
+@inventory_bp.route('/products')
+@login_required
+@read_only
+def list_products():
+    """List all products with search and filter"""
+    cursor = request.args.get('cursor')
+    search = request.args.get('search', '')
+    category_id = request.args.get('category', type=int)
+    low_stock = request.args.get('low_stock', False, type=bool)
+
+    query, keys = _product_list_query(search, category_id, low_stock)
 
     # Paginate
-    pagination = paginate_query(query, page=page, per_page=20)
+    pagination = keyset_paginate(
+        query, keys, cursor=cursor,
+        per_page=current_app.config.get('ITEMS_PER_PAGE', 20),
+        total=_product_list_total(query, search, category_id, low_stock)
+    )
 
     categories = Category.query.all()
 
@@ -57,19 +92,31 @@ def list_products():
 
 @inventory_bp.route('/product/<int:product_id>')
 @login_required
+@read_only
 def view_product(product_id):
     """View product details"""
     product = Product.query.get_or_404(product_id)
 
-    # Get stock movement history
-    movements = StockMovement.query.filter_by(
-        product_id=product_id
-    ).order_by(StockMovement.created_at.desc()).limit(50).all()
+    # Get stock movement history, newest first
+    movements = keyset_paginate(
+        StockMovement.query.options(joinedload(StockMovement.user)).filter_by(product_id=product_id),
+        [StockMovement.created_at, StockMovement.id],
+        cursor=request.args.get('cursor'),
+        per_page=50,
+        descending=True
+    )
+
+    extra_codes = product.codes.filter(
+        ProductCode.kind.in_(ProductCode.EXTRA_KINDS)
+    ).order_by(ProductCode.kind, ProductCode.code).all()
 
     return render_template(
         'inventory/product_detail.html',
         product=product,
-        movements=movements
+        movements=movements.items,
+        movements_page=movements,
+        extra_codes=extra_codes,
+        extra_code_kinds=ProductCode.EXTRA_KINDS
     )
 
 
@@ -95,19 +142,24 @@ def add_product():
             return render_template('inventory/product_form.html',
                                  categories=Category.query.all())
 
-        # Check for duplicate SKU
-        if Product.query.filter_by(sku=sku).first():
+        # Check for duplicate SKU or barcode
+        if code_in_use(sku):
             flash('SKU already exists', 'danger')
             return render_template('inventory/product_form.html',
                                  categories=Category.query.all())
 
+        if barcode_value and code_in_use(barcode_value):
+            flash('Barcode already exists', 'danger')
+            return render_template('inventory/product_form.html',
+                                 categories=Category.query.all())
+
         # Create product
         product = Product(
             name=name,
             description=description,
             sku=sku,
             barcode=barcode_value if barcode_value else None,
-            quantity=quantity,
+            quantity=0,  # Initial stock is added by the movement below
             min_stock_level=min_stock_level,
             unit_price=unit_price,
             location=location,
@@ -115,6 +167,7 @@ def add_product():
         )
 
         db.session.add(product)
+        sync_product_codes(product)
         db.session.commit()
 
         # Log initial stock if quantity > 0
@@ -146,11 +199,22 @@ def edit_product(product_id):
     product = Product.query.get_or_404(product_id)
 
     if request.method == 'POST':
+        sku = request.form.get('sku')
+        barcode_value = request.form.get('barcode', '')
+
+        # Check the new codes are not used by another product
+        for code in (sku, barcode_value):
+            if code and code_in_use(code, exclude_product_id=product.id):
+                flash(f'Code {code} is already in use', 'danger')
+                return render_template('inventory/product_form.html',
+                                     product=product,
+                                     categories=Category.query.all())
+
         # Update product fields
         product.name = request.form.get('name')
         product.description = request.form.get('description', '')
-        product.sku = request.form.get('sku')
-        product.barcode = request.form.get('barcode', '')
+        product.sku = sku
+        product.barcode = barcode_value if barcode_value else None
         product.min_stock_level = request.form.get('min_stock_level', 10, type=int)
         product.unit_price = request.form.get('unit_price', 0, type=float)
         product.location = request.form.get('location', '')
@@ -158,6 +222,7 @@ def edit_product(product_id):
         category_id = request.form.get('category_id', type=int)
         product.category_id = category_id if category_id else None
 
+        sync_product_codes(product)
         db.session.commit()
 
         log_audit('product_updated', 'product', product.id, {
@@ -233,30 +298,459 @@ def adjust_stock(product_id):
     return redirect(url_for('inventory.view_product', product_id=product_id))
 
 
+@inventory_bp.route('/product/<int:product_id>/codes', methods=['POST'])
+@login_required
+def add_product_code(product_id):
+    """Attach an additional packaging barcode (each, case, pallet) to a product"""
+    product = Product.query.get_or_404(product_id)
+
+    code = request.form.get('code', '').strip()
+    kind = request.form.get('kind', 'each')
+    units = request.form.get('units', 1, type=int)
+
+    if kind not in ProductCode.EXTRA_KINDS:
+        flash('Invalid code type', 'danger')
+        return redirect(url_for('inventory.view_product', product_id=product_id))
+
+    if units is None or units < 1:
+        flash('Units per scan must be at least 1', 'danger')
+        return redirect(url_for('inventory.view_product', product_id=product_id))
+
+    if not code:
+        flash('Please scan or enter a code', 'warning')
+        return redirect(url_for('inventory.view_product', product_id=product_id))
+
+    if code_in_use(code):
+        flash(f'Code {code} is already assigned to a product', 'danger')
+        return redirect(url_for('inventory.view_product', product_id=product_id))
+
+    db.session.add(ProductCode(code=code, kind=kind, units=units, product_id=product.id))
+    db.session.commit()
+
+    log_audit('product_code_added', 'product', product.id, {
+        'code': code,
+        'kind': kind,
+        'units': units
+    })
+
+    flash(f'{kind.capitalize()} barcode {code} ({units} units per scan) added', 'success')
+    return redirect(url_for('inventory.view_product', product_id=product_id))
+
+
+@inventory_bp.route('/product/<int:product_id>/codes/<int:code_id>/delete', methods=['POST'])
+@login_required
+def delete_product_code(product_id, code_id):
+    """Remove an additional packaging barcode from a product"""
+    product_code = ProductCode.query.filter_by(
+        id=code_id, product_id=product_id
+    ).first_or_404()
+
+    if product_code.kind not in ProductCode.EXTRA_KINDS:
+        flash('SKU, barcode and RFID codes are managed from the product form', 'warning')
+        return redirect(url_for('inventory.view_product', product_id=product_id))
+
+    code = product_code.code
+    db.session.delete(product_code)
+    db.session.commit()
+
+    log_audit('product_code_removed', 'product', product_id, {'code': code})
+
+    flash(f'Barcode {code} removed', 'success')
+    return redirect(url_for('inventory.view_product', product_id=product_id))
+
+
 @inventory_bp.route('/product/<int:product_id>/barcode')
 @login_required
 def product_barcode(product_id):
-    """Generate and display barcode for product"""
+    """Display a printable barcode for a product"""
     product = Product.query.get_or_404(product_id)
 
     if not product.barcode:
         flash('Product does not have a barcode', 'warning')
         return redirect(url_for('inventory.view_product', product_id=product_id))
 
-    barcode_image = generate_barcode(product.barcode)
-
     return render_template('inventory/barcode.html',
                          product=product,
-                         barcode_image=barcode_image)
+                         barcode_url=url_for('inventory.barcode_image', barcode_type='code128',
+                                             code=product.barcode, fmt='svg'))
+
+
+@inventory_bp.route('/barcode/<barcode_type>/<code>.<any(png, svg):fmt>')
+@login_required
+def barcode_image(barcode_type, code, fmt):
+    """Serve a cached barcode image with a strong ETag and far-future caching"""
+    try:
+        data, etag = barcode_cache.get(code, barcode_type, fmt, request.args.to_dict())
+    except BarcodeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = current_app.response_class(data, mimetype=MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@inventory_bp.route('/labels')
+@login_required
+def label_sheet():
+    """Render printable barcode label sheets for many products"""
+    category_id = request.args.get('category', type=int)
+    low_stock = request.args.get('low_stock', False, type=bool)
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()]
+    fmt = request.args.get('format', 'pdf')
+
+    if fmt not in ('pdf', 'zip'):
+        flash('Invalid label format', 'danger')
+        return redirect(url_for('inventory.list_products'))
+
+    query = db.session.query(Product.name, Product.sku, Product.barcode)
+    if ids:
+        query = query.filter(Product.id.in_(ids))
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    if low_stock:
+        query = query.filter(Product.quantity <= Product.min_stock_level)
+
+    max_labels = current_app.config.get('LABEL_SHEET_MAX', 5000)
+    labels = [(name, sku, printable_code(code, sku))
+              for name, sku, code in query.order_by(Product.name, Product.id).limit(max_labels + 1)]
+
+    if not labels:
+        flash('No products match the label filter', 'warning')
+        return redirect(url_for('inventory.list_products'))
+
+    if len(labels) > max_labels:
+        flash(f'Too many labels. Maximum per sheet run: {max_labels}', 'danger')
+        return redirect(url_for('inventory.list_products'))
+
+    unprintable = sum(1 for _, _, code in labels if code is None)
+    log_audit('labels_printed', 'product', details={'count': len(labels), 'unprintable': unprintable})
+
+    pages = render_label_pages(labels, workers=current_app.config.get('LABEL_RENDER_WORKERS'))
+    if fmt == 'zip':
+        body, mimetype = stream_label_zip(pages), 'application/zip'
+    else:
+        body, mimetype = stream_label_pdf(pages), 'application/pdf'
+
+    response = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=labels.{fmt}'
+    # Products without an ASCII barcode or SKU get a placeholder cell
+    response.headers['X-Labels-Unprintable'] = str(unprintable)
+    return response
+
+
+@inventory_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@roles_accepted('Admin', 'Manager')
+def import_products():
+    """Create or update products by SKU from an uploaded CSV file"""
+    if request.method == 'GET':
+        return render_template('inventory/import.html', columns=IMPORT_COLUMNS)
+
+    max_mb = current_app.config.get('IMPORT_MAX_UPLOAD_MB', 50)
+    if request.content_length and request.content_length > max_mb * 1024 * 1024:
+        flash(f'File too large. Maximum upload size: {max_mb} MB', 'danger')
+        return redirect(url_for('inventory.import_products'))
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV file to import', 'danger')
+        return redirect(url_for('inventory.import_products'))
+
+    importer = ProductImporter(
+        current_user.id,
+        chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 1000),
+        dry_run=request.form.get('dry_run') == '1',
+        max_errors=current_app.config.get('IMPORT_MAX_ERRORS', 200),
+        source=upload.filename,
+    )
+    # Decode the spooled upload incrementally instead of reading it into memory
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        report = importer.run(stream)
+    except CSVImportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('inventory.import_products'))
+    finally:
+        stream.detach()
+
+    if report.failed:
+        flash(f'{report.failed} of {report.rows} rows could not be imported', 'warning')
+    elif not report.dry_run:
+        flash(f'Imported {report.rows} rows', 'success')
+    return render_template('inventory/import.html', columns=IMPORT_COLUMNS, report=report)
+
+
+def _export_response(fmt, name, columns, rows):
+    """Stream an export as an attachment"""
+    response = current_app.response_class(stream_with_context(stream_export(fmt, columns, rows)),
+                                          content_type=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@inventory_bp.route('/export/products.<any(csv, ndjson):fmt>')
+@login_required
+@roles_accepted('Admin', 'Manager')
+@read_only
+def export_products(fmt):
+    """Stream every product with its category and stock value"""
+    log_audit('products_exported', 'product', details={'format': fmt})
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+    return _export_response(fmt, f'products-{stamp}', PRODUCT_COLUMNS, product_rows())
+
+
+@inventory_bp.route('/export/movements.<any(csv, ndjson):fmt>')
+@login_required
+@roles_accepted('Admin', 'Manager')
+@read_only
+def export_movements(fmt):
+    """Stream stock movement history, filtered by date range, product or user"""
+    try:
+        date_from = parse_date(request.args.get('from'))
+        date_to = parse_date(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+
+    filters = {
+        'date_from': date_from,
+        'date_to': date_to,
+        'product_id': request.args.get('product_id', type=int),
+        'user_id': request.args.get('user_id', type=int),
+    }
+    log_audit('movements_exported', 'stock_movement', details={
+        'format': fmt, **{key: str(value) for key, value in filters.items() if value is not None}
+    })
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+    return _export_response(fmt, f'movements-{stamp}', MOVEMENT_COLUMNS, movement_rows(**filters))
+
+
+@inventory_bp.route('/export/stock-as-of.<any(csv, ndjson):fmt>')
+@login_required
+@roles_accepted('Admin', 'Manager')
+@read_only
+def export_stock_as_of(fmt):
+    """Stream every product's stock at a point in time (``at``: a date means the end of that day)"""
+    try:
+        at = parse_date(request.args.get('at'), end=True)
+    except ValueError:
+        at = None
+    if at is None:
+        return jsonify({'error': 'at must be a date (YYYY-MM-DD) or ISO datetime'}), 400
+
+    log_audit('stock_as_of_exported', 'product', details={'format': fmt, 'at': at.isoformat()})
+    return _export_response(fmt, f'stock-{at:%Y%m%d-%H%M}', STOCK_AS_OF_COLUMNS, stock_as_of_rows(at))
+
+
+# Stock-take (cycle count) routes
+@inventory_bp.route('/stock-takes')
+@login_required
+@read_only
+def list_stock_takes():
+    """List recent stock-take sessions"""
+    stock_takes = StockTake.query.order_by(StockTake.id.desc()).limit(50).all()
+    line_counts = dict(
+        db.session.query(StockTakeLine.stock_take_id, db.func.count(StockTakeLine.id))
+        .filter(StockTakeLine.stock_take_id.in_([take.id for take in stock_takes]))
+        .group_by(StockTakeLine.stock_take_id)
+    )
+    return render_template('inventory/stock_takes.html', stock_takes=stock_takes, line_counts=line_counts)
+
+
+@inventory_bp.route('/stock-take/new', methods=['POST'])
+@login_required
+@roles_accepted('Admin', 'Manager')
+def create_stock_take():
+    """Open a new stock-take session"""
+    name = request.form.get('name', '').strip()
+    location = request.form.get('location', '').strip() or None
+
+    if not name:
+        flash('A name for the stock take is required', 'danger')
+        return redirect(url_for('inventory.list_stock_takes'))
+
+    stock_take = StockTake(name=name[:100], location=location[:100] if location else None,
+                           created_by=current_user.id)
+    db.session.add(stock_take)
+    db.session.commit()
+
+    log_audit('stock_take_created', 'stock_take', stock_take.id, {'name': name, 'location': location})
+
+    return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>')
+@login_required
+def view_stock_take(stock_take_id):
+    """Count entry and variance review for a stock take"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+
+    result = reconcile(stock_take)
+
+    applied = None
+    if stock_take.status == 'applied':
+        applied = db.session.query(
+            db.func.count(StockMovement.id), db.func.coalesce(db.func.sum(StockMovement.quantity), 0)
+        ).filter(StockMovement.stock_take_id == stock_take.id).one()
+
+    return render_template('inventory/stock_take.html',
+                           stock_take=stock_take,
+                           result=result,
+                           largest=result.largest(REVIEW_ROWS),
+                           applied=applied)
+
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/count', methods=['POST'])
+@login_required
+@limiter.limit("300 per minute")
+def count_stock_take(stock_take_id):
+    """
+    Stage counted codes for a stock take
+
+    Accepts the scan form (``code``, ``counted``) or JSON: ``{"code", "counted"}``
+    or ``{"items": [{"code", "counted"}]}`` from a handheld batch upload.
+    """
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is not None:
+        items = data.get('items') if isinstance(data.get('items'), list) else [data]
+    else:
+        items = [{'code': request.form.get('code'), 'counted': request.form.get('counted', 1, type=int)}]
+
+    max_items = current_app.config.get('SCAN_BATCH_MAX_ITEMS', 1000)
+    lines = []
+    error = None
+    if len(items) > max_items:
+        error = f'Too many items. Maximum per batch: {max_items}'
+    for item in items if error is None else []:
+        code = str(item.get('code') or '').strip() if isinstance(item, dict) else ''
+        counted = item.get('counted', 1) if isinstance(item, dict) else None
+        if not code or len(code) > 100:
+            error = 'Each item needs a code of at most 100 characters'
+        elif not isinstance(counted, int) or isinstance(counted, bool) or counted < 0:
+            error = f'{code}: count must be a whole number of at least 0'
+        if error:
+            break
+        lines.append((code, counted))
+
+    if error is None:
+        try:
+            added = add_count_lines(stock_take, lines, user_id=current_user.id)
+            db.session.commit()
+        except StockTakeError as e:
+            error = str(e)
+
+    if data is not None:
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        response = {'success': True, 'added': added}
+        if len(lines) == 1:
+            product = find_product_by_code(lines[0][0])
+            response['product'] = {'id': product.id, 'sku': product.sku, 'name': product.name} if product else None
+        return jsonify(response)
+
+    if error:
+        flash(error, 'danger')
+    else:
+        product = find_product_by_code(lines[0][0])
+        if product:
+            flash(f'Counted {lines[0][1]} x {product.name}', 'success')
+        else:
+            flash(f'Counted {lines[0][1]} x unknown code {lines[0][0]}', 'warning')
+    return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/upload', methods=['POST'])
+@login_required
+def upload_stock_take(stock_take_id):
+    """Stage counts from an uploaded CSV (code[,counted] per row)"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+
+    max_mb = current_app.config.get('IMPORT_MAX_UPLOAD_MB', 50)
+    if request.content_length and request.content_length > max_mb * 1024 * 1024:
+        flash(f'File too large. Maximum upload size: {max_mb} MB', 'danger')
+        return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV file of counts', 'danger')
+        return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+    errors = []
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        added = add_count_lines(stock_take, read_count_csv(stream, errors), user_id=current_user.id)
+        db.session.commit()
+    except (StockTakeError, csv.Error, UnicodeDecodeError) as e:
+        db.session.rollback()
+        flash(f'Counts not uploaded: {str(e)}', 'danger')
+        return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+    finally:
+        stream.detach()
+
+    flash(f'Added {added} counted lines from {upload.filename}', 'success')
+    if errors:
+        shown = '; '.join(f'line {line}: {message}' for line, message in errors[:10])
+        flash(f'{len(errors)} rows skipped ({shown})', 'warning')
+    return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/apply', methods=['POST'])
+@login_required
+@roles_accepted('Admin', 'Manager')
+def apply_stock_take_view(stock_take_id):
+    """Apply all reviewed variances as adjustments in one transaction"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+
+    def audit(details):
+        log_audit('stock_take_applied', 'stock_take', stock_take.id, details, commit=False)
+
+    try:
+        result = apply_stock_take(stock_take, current_user.id,
+                                  fingerprint=request.form.get('fingerprint'), audit=audit)
+    except StockTakeError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+    flash(f'Stock take applied: {len(result.variances)} products adjusted', 'success')
+    return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/cancel', methods=['POST'])
+@login_required
+@roles_accepted('Admin', 'Manager')
+def cancel_stock_take_view(stock_take_id):
+    """Discard an open stock take"""
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    try:
+        cancel_stock_take(stock_take)
+        db.session.commit()
+    except StockTakeError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('inventory.view_stock_take', stock_take_id=stock_take.id))
+
+    log_audit('stock_take_cancelled', 'stock_take', stock_take.id)
+    flash(f'Stock take {stock_take.name} cancelled', 'success')
+    return redirect(url_for('inventory.list_stock_takes'))
 
 
 # Category routes
 @inventory_bp.route('/categories')
 @login_required
+@read_only
 def list_categories():
     """List all categories"""
     categories = Category.query.all()
-    return render_template('inventory/categories.html', categories=categories)
+    product_counts = dict(
+        db.session.query(Product.category_id, db.func.count(Product.id))
+        .group_by(Product.category_id)
+    )
+    return render_template('inventory/categories.html',
+                         categories=categories,
+                         product_counts=product_counts)
 
 
 @inventory_bp.route('/category/add', methods=['GET', 'POST'])
@@ -294,6 +788,7 @@ def add_category():
 # API endpoints for AJAX
 @inventory_bp.route('/api/search')
 @login_required
+@read_only
 def api_search():
     """Search products API endpoint"""
     query = request.args.get('q', '')
@@ -301,11 +796,8 @@ def api_search():
     if len(query) < 2:
         return jsonify([])
 
-    products = Product.query.filter(
-        (Product.name.ilike(f'%{query}%')) |
-        (Product.sku.ilike(f'%{query}%')) |
-        (Product.barcode.ilike(f'%{query}%'))
-    ).limit(10).all()
+    products, _ = apply_product_search(Product.query, query)
+    products = products.limit(10).all()
 
     results = [
         {
@@ -319,3 +811,107 @@ def api_search():
     ]
 
     return jsonify(results)
+
+
+@inventory_bp.route('/api/products')
+@login_required
+@read_only
+def api_products():
+    """Cursor-paginated product list API endpoint"""
+    search = request.args.get('search', '')
+    category_id = request.args.get('category', type=int)
+    low_stock = request.args.get('low_stock', False, type=bool)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
+
+    query, keys = _product_list_query(search, category_id, low_stock)
+    total = None
+    if request.args.get('count', False, type=bool):
+        total = _product_list_total(query, search, category_id, low_stock)
+
+    page = keyset_paginate(query, keys, cursor=request.args.get('cursor'),
+                           per_page=per_page, total=total)
+
+    return jsonify({
+        'products': [
+            {
+                'id': p.id,
+                'name': p.name,
+                'sku': p.sku,
+                'barcode': p.barcode,
+                'quantity': p.quantity,
+                'min_stock_level': p.min_stock_level,
+                'unit_price': float(p.unit_price or 0),
+                'category_id': p.category_id
+            }
+            for p in page.items
+        ],
+        'pagination': page.to_dict()
+    })
+
+
+@inventory_bp.route('/api/product/<int:product_id>/movements')
+@login_required
+@read_only
+def api_product_movements(product_id):
+    """Cursor-paginated stock movement history API endpoint"""
+    Product.query.get_or_404(product_id)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
+
+    page = keyset_paginate(
+        StockMovement.query.filter_by(product_id=product_id),
+        [StockMovement.created_at, StockMovement.id],
+        cursor=request.args.get('cursor'),
+        per_page=per_page,
+        descending=True
+    )
+
+    return jsonify({
+        'movements': [
+            {
+                'id': m.id,
+                'movement_type': m.movement_type,
+                'quantity': m.quantity,
+                'previous_quantity': m.previous_quantity,
+                'new_quantity': m.new_quantity,
+                'user_id': m.user_id,
+                'reference': m.reference,
+                'notes': m.notes,
+                'created_at': m.created_at.isoformat() if m.created_at else None
+            }
+            for m in page.items
+        ],
+        'pagination': page.to_dict()
+    })
+
+
+@inventory_bp.route('/api/product/<int:product_id>/stock-as-of')
+@login_required
+@read_only
+def api_product_stock_as_of(product_id):
+    """Stock of a product at a point in time, replayed from the nearest snapshot"""
+    product = Product.query.get_or_404(product_id)
+    try:
+        at = parse_date(request.args.get('at'), end=True)
+    except ValueError:
+        at = None
+    if at is None:
+        return jsonify({'error': 'at must be a date (YYYY-MM-DD) or ISO datetime'}), 400
+
+    snapshot = nearest_snapshot(at)
+    row = db.session.execute(quantities_as_of(at, snapshot, product_id=product.id)).first()
+
+    if snapshot is None:
+        base = {'type': 'current'}
+    else:
+        base = {'type': 'snapshot', 'snapshot_id': snapshot.id, 'period': snapshot.period,
+                'taken_at': snapshot.taken_at.isoformat()}
+
+    return jsonify({
+        'product_id': product.id,
+        'sku': product.sku,
+        'as_of': at.isoformat(),
+        'existed': row is not None,
+        'quantity': row.quantity if row else None,
+        'base': base,
+        'movements_replayed': row.replayed if row else 0
+    })
@@ -0,0 +1,276 @@
+"""Bulk barcode label sheets rendered across a process pool"""
+import os
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+# A4 at 200 DPI with a 3 x 8 grid of labels (common 24-up label stock)
+PAGE_WIDTH = 1654
+PAGE_HEIGHT = 2339
+PAGE_MARGIN = 60
+COLUMNS = 3
+ROWS = 8
+LABELS_PER_PAGE = COLUMNS * ROWS
+DPI = 200
+
+# Render processes shared by all requests of a worker (LABEL_RENDER_WORKERS)
+DEFAULT_RENDER_WORKERS = 2
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def printable_code(*codes):
+    """
+    The first of ``codes`` that Code 128 can encode (ASCII only), or None
+
+    Used to pick a label's barcode before rendering, so one product with,
+    say, a Cyrillic SKU cannot fail a whole sheet run.
+    """
+    for code in codes:
+        if code and code.isascii():
+            return code
+    return None
+
+
+def paginate_labels(labels):
+    """Split (name, sku, code) tuples into page-sized chunks"""
+    return [labels[i:i + LABELS_PER_PAGE] for i in range(0, len(labels), LABELS_PER_PAGE)]
+
+
+def render_label_page(labels):
+    """
+    Render one sheet of labels as a PNG
+
+    Runs inside pool workers, so it only takes plain tuples and imports
+    python-barcode and Pillow lazily.
+
+    Args:
+        labels: List of (name, sku, code) tuples, at most LABELS_PER_PAGE;
+            a label whose code is None or cannot be encoded gets a placeholder
+
+    Returns:
+        PNG bytes of the page
+    """
+    import barcode
+    from barcode.errors import BarcodeError as LibraryBarcodeError
+    from barcode.writer import ImageWriter
+    from PIL import Image, ImageDraw, ImageFont
+
+    page = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT), 'white')
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=22)
+
+    cell_width = (PAGE_WIDTH - 2 * PAGE_MARGIN) // COLUMNS
+    cell_height = (PAGE_HEIGHT - 2 * PAGE_MARGIN) // ROWS
+    barcode_class = barcode.get_barcode_class('code128')
+    options = {'module_height': 8.0, 'font_size': 8, 'text_distance': 3.0, 'quiet_zone': 2.0, 'dpi': DPI}
+
+    for index, (name, sku, code) in enumerate(labels):
+        left = PAGE_MARGIN + (index % COLUMNS) * cell_width
+        top = PAGE_MARGIN + (index // COLUMNS) * cell_height
+
+        draw.text((left + 12, top + 10), (name or '')[:32], fill='black', font=font)
+        draw.text((left + 12, top + 38), f'SKU: {sku}', fill='black', font=font)
+
+        try:
+            if not code:
+                raise LibraryBarcodeError('No printable code')
+            image = barcode_class(code, writer=ImageWriter()).render(options)
+        except (LibraryBarcodeError, ValueError):
+            # Placeholder cell, so the rest of the sheet still prints in place
+            draw.rectangle((left + 12, top + 72, left + cell_width - 12, top + cell_height - 12), outline='black')
+            draw.text((left + 24, top + 84), 'No printable barcode', fill='black', font=font)
+            continue
+        image.thumbnail((cell_width - 24, cell_height - 80))
+        page.paste(image, (left + (cell_width - image.width) // 2, top + 72))
+
+    rv = BytesIO()
+    page.save(rv, format='PNG', optimize=False)
+    return rv.getvalue()
+
+
+def render_label_pages(labels, workers=None):
+    """
+    Render label pages in order, spreading the work over the shared process pool
+
+    Args:
+        labels: List of (name, sku, code) tuples
+        workers: Size of the pool (default DEFAULT_RENDER_WORKERS); 0 or 1
+            renders serially in-process
+
+    Yields:
+        PNG bytes for each page, as soon as it and all earlier pages are done
+    """
+    pages = paginate_labels(labels)
+    if workers is None:
+        workers = DEFAULT_RENDER_WORKERS
+
+    if workers <= 1 or len(pages) <= 1:
+        for page in pages:
+            yield render_label_page(page)
+        return
+
+    # Submit a few pages ahead of the one being streamed rather than all of
+    # them, so a large run neither hogs the pool nor buffers finished pages
+    pool = _render_pool(workers)
+    pending = []
+    try:
+        for page in pages:
+            pending.append(pool.submit(render_label_page, page))
+            if len(pending) > workers:
+                yield pending.pop(0).result()
+        while pending:
+            yield pending.pop(0).result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _render_pool(workers):
+    """The worker process's render pool, created on first use (and again after a fork)"""
+    global _pool, _pool_key
+    with _pool_lock:
+        key = (os.getpid(), workers)
+        if _pool is None or _pool_key != key:
+            if _pool is not None and _pool_key[0] == os.getpid():
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_key = key
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next run starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_label_zip(pages):
+    """
+    Stream rendered pages as a ZIP of PNG files without buffering the archive
+
+    Args:
+        pages: Iterable of PNG page bytes
+
+    Yields:
+        Chunks of the ZIP archive
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for number, page in enumerate(pages, start=1):
+            archive.writestr(f'labels-{number:04d}.png', page)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_label_pdf(pages):
+    """
+    Stream rendered pages as a PDF, each page sent as soon as it is rendered
+
+    Every page becomes a full-page grayscale image. The page tree and the
+    cross-reference table are written after the last page, so nothing is
+    held back beyond the page being encoded.
+
+    Args:
+        pages: Iterable of PNG page bytes
+
+    Yields:
+        Chunks of the PDF document
+    """
+    writer = _PdfWriter()
+    yield writer.start()
+    for page in pages:
+        yield writer.add_page(page)
+    yield writer.finish()
+
+
+class _PdfWriter:
+    """Minimal PDF writer emitting one image-only page at a time"""
+
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self):
+        self._offsets = {}
+        self._position = 0
+        self._pages = []
+
+    def start(self):
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self._position = len(header)
+        return header + self._object(self.CATALOG, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    def add_page(self, png):
+        from PIL import Image
+
+        image = Image.open(BytesIO(png)).convert('L')
+        width, height = image.size
+        data = zlib.compress(image.tobytes(), 6)
+        points_width, points_height = width * 72 / DPI, height * 72 / DPI
+
+        image_id = len(self._offsets) + 2
+        content_id, page_id = image_id + 1, image_id + 2
+        content = f'q {points_width:.2f} 0 0 {points_height:.2f} 0 0 cm /Im0 Do Q'.encode('ascii')
+
+        chunk = self._object(image_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray '
+            f'/BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\nstream\n'
+        ).encode('ascii') + data + b'\nendstream')
+        chunk += self._object(content_id, f'<< /Length {len(content)} >>\nstream\n'.encode('ascii')
+                              + content + b'\nendstream')
+        chunk += self._object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {points_width:.2f} {points_height:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode('ascii'))
+        self._pages.append(page_id)
+        return chunk
+
+    def finish(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._pages)
+        chunk = self._object(self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>'.encode('ascii'))
+
+        size = max(self._offsets) + 1
+        xref = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+        xref += [f'{self._offsets[number]:010d} 00000 n \n' for number in range(1, size)]
+        xref.append(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{self._position}\n%%EOF\n')
+        return chunk + ''.join(xref).encode('ascii')
+
+    def _object(self, number, body):
+        data = f'{number} 0 obj\n'.encode('ascii') + body + b'\nendobj\n'
+        self._offsets[number] = self._position
+        self._position += len(data)
+        return data
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file object that hands out what was written"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,183 @@
+"""Prometheus metrics shared across gunicorn workers through a multiprocess directory"""
+import hmac
+import os
+import time
+
+from flask import Blueprint, Response, abort, g, request
+from sqlalchemy import event
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Request latency buckets in seconds, tuned for sub-second page and scan responses
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    """
+    Request, scan, database and cache metrics exported at ``/metrics``
+
+    Enabled with ``METRICS_ENABLED``. Every worker writes its samples to
+    memory-mapped files in ``PROMETHEUS_MULTIPROC_DIR`` (instance/metrics by
+    default) and a scrape, served by whichever worker receives it, merges
+    the files of all workers. Gauges use ``livesum`` so the files of exited
+    workers are dropped by gunicorn's ``child_exit`` hook.
+
+    Cache hit/miss counters are kept by the caches themselves; the increase
+    since the last request is exported after each request, and a cache hit
+    ratio across all workers is derived at scrape time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.token = None
+        self._exported = {}
+
+    def init_app(self, app):
+        """Create the metrics and register the request and SQL hooks if enabled"""
+        from app import db, limiter
+
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        if not self.enabled:
+            return
+
+        self.directory = app.config.get('PROMETHEUS_MULTIPROC_DIR') or os.path.join(app.instance_path, 'metrics')
+        self.token = app.config.get('METRICS_TOKEN')
+        os.makedirs(self.directory, exist_ok=True)
+        # prometheus_client writes to this directory in every process that
+        # records a sample, so it must be in the environment of the workers
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = self.directory
+
+        from prometheus_client import Counter, Gauge, Histogram
+
+        # registry=None: values are read back from the directory at scrape time
+        self.request_latency = Histogram(
+            'ims_http_request_duration_seconds', 'Request latency by endpoint',
+            ['endpoint', 'method'], buckets=LATENCY_BUCKETS, registry=None
+        )
+        self.requests = Counter(
+            'ims_http_requests', 'Requests by endpoint and status code',
+            ['endpoint', 'method', 'status'], registry=None
+        )
+        self.scans = Counter('ims_scans', 'Processed scans by action', ['action'], registry=None)
+        self.db_queries = Counter('ims_db_queries', 'SQL statements executed by engine', ['bind'], registry=None)
+        self.audit_queue_depth = Gauge(
+            'ims_audit_queue_depth', 'Buffered audit log entries not yet written',
+            multiprocess_mode='livesum', registry=None
+        )
+        self.cache_hits = Counter('ims_cache_hits', 'Cache hits', ['cache'], registry=None)
+        self.cache_misses = Counter('ims_cache_misses', 'Cache misses', ['cache'], registry=None)
+        self._exported = {}
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        with app.app_context():
+            for key, engine in db.engines.items():
+                event.listen(engine, 'before_cursor_execute', self._query_listener(key or 'default'))
+
+        limiter.exempt(metrics_view)
+        app.register_blueprint(metrics_bp)
+
+    def record_scan(self, action, count=1):
+        """Count processed scans for an action (lookup, stock_in or stock_out)"""
+        if self.enabled and count:
+            self.scans.labels(action=action).inc(count)
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        self.request_latency.labels(endpoint=endpoint, method=request.method).observe(
+            time.perf_counter() - started
+        )
+        self.requests.labels(endpoint=endpoint, method=request.method, status=response.status_code).inc()
+        self._export_worker_stats()
+        return response
+
+    def _query_listener(self, bind):
+        counter = self.db_queries.labels(bind=bind)
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            counter.inc()
+        return before_cursor_execute
+
+    def _export_worker_stats(self):
+        from app.audit import audit_sink
+        from app.principals import principal_cache
+        from app.scan_cache import scan_cache
+
+        self.audit_queue_depth.set(audit_sink.queue_depth())
+
+        for name, cache in (('scan', scan_cache), ('user', principal_cache)):
+            stats = cache.stats()
+            for key, counter in (('hits', self.cache_hits), ('misses', self.cache_misses)):
+                last = self._exported.get((name, key), 0)
+                # A lower value means the counter was reset; export it from zero
+                delta = stats[key] - last if stats[key] >= last else stats[key]
+                if delta:
+                    counter.labels(cache=name).inc(delta)
+                self._exported[(name, key)] = stats[key]
+
+    def generate(self):
+        """Render the merged samples of every worker in the Prometheus text format"""
+        from prometheus_client import CollectorRegistry, generate_latest
+
+        registry = CollectorRegistry()
+        registry.register(_MultiProcessCollector(self.directory))
+        return generate_latest(registry)
+
+
+class _MultiProcessCollector:
+    """MultiProcessCollector plus a cache hit ratio derived from the merged counters"""
+
+    def __init__(self, path):
+        from prometheus_client import multiprocess
+
+        self.collector = multiprocess.MultiProcessCollector(None, path=path)
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        totals = {}
+        for family in self.collector.collect():
+            if family.name in ('ims_cache_hits', 'ims_cache_misses'):
+                for sample in family.samples:
+                    if sample.name.endswith('_total'):
+                        entry = totals.setdefault(sample.labels['cache'], {})
+                        entry[family.name] = sample.value
+            yield family
+
+        ratio = GaugeMetricFamily('ims_cache_hit_ratio', 'Cache hit ratio across all workers', labels=['cache'])
+        for cache, entry in sorted(totals.items()):
+            hits = entry.get('ims_cache_hits', 0.0)
+            lookups = hits + entry.get('ims_cache_misses', 0.0)
+            ratio.add_metric([cache], hits / lookups if lookups else 0.0)
+        yield ratio
+
+
+metrics = Metrics()
+
+
+@metrics_bp.route('/metrics')
+def metrics_view():
+    """Prometheus scrape endpoint; requires ``Authorization: Bearer`` when METRICS_TOKEN is set"""
+    from prometheus_client import CONTENT_TYPE_LATEST
+
+    if metrics.token:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), metrics.token.encode()):
+            abort(401)
+
+    try:
+        output = metrics.generate()
+    except Exception as e:
+        print(f"Error collecting metrics: {str(e)}")
+        abort(500)
+
+    return Response(output, content_type=CONTENT_TYPE_LATEST, headers={'Cache-Control': 'no-store'})
@@ -1,7 +1,11 @@
 from datetime import datetime
+from decimal import Decimal
 from app import db
+from app.scan_cache import scan_cache
+from app.principals import principal_cache
 from flask_security import UserMixin, RoleMixin
-from sqlalchemy import event
+from sqlalchemy import bindparam, event, inspect, select
+from sqlalchemy.orm import Session, object_session
 
 
 # Association table for many-to-many relationship between users and roles
@@ -53,9 +57,20 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f'<User {self.username}>'
 
+    @property
+    def role_names(self):
+        """Set of the user's role names"""
+        return frozenset(role.name for role in self.roles)
+
     @property
     def is_admin(self):
-        return any(role.name == 'Admin' for role in self.roles)
+        return 'Admin' in self.role_names
+
+    def has_role(self, role):
+        """Check a role by name (or Role instance) against the loaded roles"""
+        if isinstance(role, str):
+            return role in self.role_names
+        return super().has_role(role)
 
     def set_password(self, password):
         """Hash and set password"""
@@ -128,6 +143,10 @@ class Product(db.Model):
     # Relationships
     stock_movements = db.relationship('StockMovement', backref='product',
                                      lazy='dynamic', cascade='all, delete-orphan')
+    codes = db.relationship('ProductCode', backref='product',
+                           lazy='dynamic', cascade='all, delete-orphan')
+    movement_rollups = db.relationship('MovementRollup', lazy='dynamic', cascade='all, delete-orphan')
+    forecast = db.relationship('ProductForecast', uselist=False, lazy='select', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Product {self.sku}>'
@@ -137,14 +156,67 @@ class Product(db.Model):
         """Check if product is below minimum stock level"""
         return self.quantity <= self.min_stock_level
 
+    @property
+    def needs_reorder(self):
+        """Check if stock is at the forecast reorder point, or below minimum without a forecast"""
+        if self.forecast is not None and self.forecast.velocity > 0:
+            return self.quantity <= self.forecast.reorder_point
+        return self.is_low_stock
+
     @property
     def total_value(self):
         """Calculate total inventory value for this product"""
         return float(self.quantity * self.unit_price)
 
 
+class ProductCode(db.Model):
+    """Scannable code (SKU, barcode, RFID tag or packaging barcode) resolving to a product"""
+    __tablename__ = 'product_code'
+
+    # Kinds mirrored from the Product columns, kept in sync on every product write
+    PRIMARY_KINDS = {'sku': 'sku', 'barcode': 'barcode', 'rfid_tag': 'rfid'}
+    # Additional packaging-level barcodes managed per product
+    EXTRA_KINDS = ('each', 'case', 'pallet')
+
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(100), unique=True, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'sku', 'barcode', 'rfid', 'each', 'case', 'pallet'
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    units = db.Column(db.Integer, default=1, server_default='1', nullable=False)  # Units per scan (pack quantity)
+
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def primary_codes(cls, values):
+        """
+        Distinct primary codes of a product, as code -> kind
+
+        A code repeated across fields (e.g. a barcode equal to the SKU) is
+        listed once, with the kind of the first field: sku, barcode, rfid.
+
+        Args:
+            values: Mapping of Product field name to value
+        """
+        codes = {}
+        for field, kind in cls.PRIMARY_KINDS.items():
+            code = values.get(field)
+            if code:
+                codes.setdefault(code, kind)
+        return codes
+
+    def __repr__(self):
+        return f'<ProductCode {self.kind} {self.code}>'
+
+
 class StockMovement(db.Model):
     """Track all stock movements (in/out)"""
+    __table_args__ = (
+        # Point-in-time replays read movements by time, per product or across all products
+        db.Index('ix_stock_movement_created_at', 'created_at'),
+        db.Index('ix_stock_movement_product_created_at', 'product_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -159,6 +231,9 @@ class StockMovement(db.Model):
     notes = db.Column(db.Text)
     reference = db.Column(db.String(100))  # Order number, invoice, etc.
 
+    # Stock take whose count this adjustment applied
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_take.id'), index=True)
+
     # Timestamp
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -169,6 +244,202 @@ class StockMovement(db.Model):
         return f'<StockMovement {self.movement_type} {self.quantity} of Product {self.product_id}>'
 
 
+class MovementRollup(db.Model):
+    """Daily stock movement totals per product, kept up to date as movements are recorded"""
+    __tablename__ = 'movement_rollup'
+    __table_args__ = (db.Index('ix_movement_rollup_day', 'day'),)
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)  # UTC day of the movements
+
+    # Totals
+    units_in = db.Column(db.Integer, default=0, nullable=False)
+    units_out = db.Column(db.Integer, default=0, nullable=False)
+    adjusted = db.Column(db.Integer, default=0, nullable=False)  # Net of adjustments, may be negative
+    movement_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<MovementRollup {self.product_id} {self.day}>'
+
+    @staticmethod
+    def contribution(movement_type, quantity):
+        """Return what a single movement adds to (units in, units out, adjusted)"""
+        if movement_type == 'in':
+            return abs(quantity), 0, 0
+        if movement_type == 'out':
+            return 0, abs(quantity), 0
+        return 0, 0, quantity
+
+    @classmethod
+    def apply_movements(cls, connection, movements, chunk_size=500):
+        """
+        Add movements to the daily totals of their products
+
+        Movements are grouped per product and day first. Existing rows are
+        incremented with one executemany UPDATE and missing ones inserted in
+        bulk; a single movement is a plain UPDATE, with an INSERT only for
+        the first movement of the day.
+
+        Args:
+            connection: Connection of the transaction writing the movements
+            movements: Iterable of dicts with product_id, movement_type,
+                quantity and created_at (as passed to ``insert(StockMovement)``)
+        """
+        totals = {}
+        for movement in movements:
+            key = (movement['product_id'], movement['created_at'].date())
+            units_in, units_out, adjusted = cls.contribution(movement['movement_type'], movement['quantity'])
+            total = totals.setdefault(key, [0, 0, 0, 0])
+            total[0] += units_in
+            total[1] += units_out
+            total[2] += adjusted
+            total[3] += 1
+        if not totals:
+            return
+
+        table = cls.__table__
+        rows = [{'key_product_id': product_id, 'key_day': day, 'in': total[0], 'out': total[1],
+                 'adj': total[2], 'count': total[3]} for (product_id, day), total in totals.items()]
+        increment = table.update().where(
+            table.c.product_id == bindparam('key_product_id'), table.c.day == bindparam('key_day')
+        ).values(
+            units_in=table.c.units_in + bindparam('in'),
+            units_out=table.c.units_out + bindparam('out'),
+            adjusted=table.c.adjusted + bindparam('adj'),
+            movement_count=table.c.movement_count + bindparam('count'),
+        )
+
+        if len(rows) == 1:
+            missing = rows if connection.execute(increment, rows[0]).rowcount == 0 else []
+        else:
+            existing = set()
+            for day in {row['key_day'] for row in rows}:
+                product_ids = [row['key_product_id'] for row in rows if row['key_day'] == day]
+                for i in range(0, len(product_ids), chunk_size):
+                    existing.update((product_id, day) for (product_id,) in connection.execute(
+                        select(table.c.product_id).where(table.c.day == day,
+                                                         table.c.product_id.in_(product_ids[i:i + chunk_size]))
+                    ))
+            found = [row for row in rows if (row['key_product_id'], row['key_day']) in existing]
+            missing = [row for row in rows if (row['key_product_id'], row['key_day']) not in existing]
+            if found:
+                connection.execute(increment, found)
+
+        if missing:
+            connection.execute(table.insert(), [
+                {'product_id': row['key_product_id'], 'day': row['key_day'], 'units_in': row['in'],
+                 'units_out': row['out'], 'adjusted': row['adj'], 'movement_count': row['count']}
+                for row in missing
+            ])
+
+
+class StockTake(db.Model):
+    """Stock-take (cycle count) session; counted lines are reconciled and applied together"""
+    __tablename__ = 'stock_take'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(100))  # Location prefix; uncounted products there are counted as zero
+    status = db.Column(db.String(20), default='open', nullable=False)  # 'open', 'applied', 'cancelled'
+
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    applied_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime)
+
+    # Relationships
+    lines = db.relationship('StockTakeLine', backref='stock_take', lazy='dynamic', cascade='all, delete-orphan')
+    movements = db.relationship('StockMovement', backref='stock_take', lazy='dynamic')
+    creator = db.relationship('User', foreign_keys=[created_by])
+
+    @property
+    def reference(self):
+        """Reference stored on the adjustment movements of this session"""
+        return f'ST-{self.id}'
+
+    def __repr__(self):
+        return f'<StockTake {self.id} {self.status}>'
+
+
+class StockTakeLine(db.Model):
+    """A counted code staged in a stock-take session (the same code may be counted many times)"""
+    __tablename__ = 'stock_take_line'
+    __table_args__ = (db.Index('ix_stock_take_line_take_product', 'stock_take_id', 'product_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_take.id'), nullable=False)
+    code = db.Column(db.String(100), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))  # Resolved from code on reconcile
+    counted = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StockTakeLine {self.code} x{self.counted}>'
+
+
+class StockSnapshot(db.Model):
+    """Stock of every product at a period boundary, so history can be replayed from it"""
+    __tablename__ = 'stock_snapshot'
+    __table_args__ = (db.UniqueConstraint('period', 'taken_at'),)
+
+    PERIODS = ('daily', 'monthly')
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(20), nullable=False)  # 'daily' or 'monthly'
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)  # Includes movements before this instant
+    product_count = db.Column(db.Integer, default=0, nullable=False)
+    total_units = db.Column(db.Integer, default=0, nullable=False)
+
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    lines = db.relationship('StockSnapshotLine', backref='snapshot', lazy='dynamic',
+                            cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<StockSnapshot {self.period} {self.taken_at}>'
+
+
+class StockSnapshotLine(db.Model):
+    """Quantity of one product in a snapshot"""
+    __tablename__ = 'stock_snapshot_line'
+
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshot.id', ondelete='CASCADE'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)  # No FK: snapshots outlive deleted products
+    quantity = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<StockSnapshotLine {self.snapshot_id} {self.product_id}>'
+
+
+class ProductForecast(db.Model):
+    """Consumption forecast of a product, recomputed in batch from the movement rollups"""
+    __tablename__ = 'product_forecast'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+
+    # Forecast
+    velocity = db.Column(db.Float, default=0, nullable=False)  # Expected units out per day
+    demand_std = db.Column(db.Float, default=0, nullable=False)  # Standard deviation of daily units out
+    reorder_point = db.Column(db.Integer, default=0, nullable=False)  # Reorder at or below this quantity
+
+    # Timestamp
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ProductForecast {self.product_id}>'
+
+    def days_of_cover(self, quantity):
+        """Days ``quantity`` lasts at the forecast velocity, or None without consumption"""
+        return quantity / self.velocity if self.velocity > 0 else None
+
+
 class AuditLog(db.Model):
     """Audit trail for security-sensitive actions"""
     id = db.Column(db.Integer, primary_key=True)
@@ -191,23 +462,183 @@ class AuditLog(db.Model):
         return f'<AuditLog {self.action} by User {self.user_id}>'
 
 
-# Event listeners for automatic audit logging
+class InventorySummary(db.Model):
+    """Running inventory totals, overall and per category, for the dashboard"""
+    __tablename__ = 'inventory_summary'
+
+    TOTAL_KEY = -1  # Row holding totals across all products
+    UNCATEGORIZED_KEY = 0  # Row for products without a category
+
+    id = db.Column(db.Integer, primary_key=True)
+    category_key = db.Column(db.Integer, unique=True, nullable=False)  # TOTAL_KEY, UNCATEGORIZED_KEY or category id
+
+    # Aggregates
+    total_value = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    total_units = db.Column(db.Integer, default=0, nullable=False)
+    product_count = db.Column(db.Integer, default=0, nullable=False)
+    low_stock_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Timestamp
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InventorySummary {self.category_key}>'
+
+    @staticmethod
+    def contribution(quantity, unit_price, min_stock_level):
+        """Return what a single product adds to (value, units, products, low stock)"""
+        quantity = quantity or 0
+        value = Decimal(str(unit_price or 0)) * quantity
+        low_stock = 1 if min_stock_level is not None and quantity <= min_stock_level else 0
+        return value, quantity, 1, low_stock
+
+    @classmethod
+    def apply_delta(cls, connection, category_id, value=0, units=0, products=0, low_stock=0):
+        """
+        Add deltas to the overall row and the product's category row
+
+        Does nothing until the summary has been built with
+        ``flask rebuild-inventory-summary`` (or lazily by the dashboard).
+        """
+        if not (value or units or products or low_stock):
+            return
+
+        table = cls.__table__
+        values = {
+            'total_value': table.c.total_value + value,
+            'total_units': table.c.total_units + units,
+            'product_count': table.c.product_count + products,
+            'low_stock_count': table.c.low_stock_count + low_stock,
+            'updated_at': datetime.utcnow(),
+        }
+
+        result = connection.execute(
+            table.update().where(table.c.category_key == cls.TOTAL_KEY).values(**values)
+        )
+        if result.rowcount == 0:
+            return
+
+        category_key = category_id or cls.UNCATEGORIZED_KEY
+        result = connection.execute(
+            table.update().where(table.c.category_key == category_key).values(**values)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                category_key=category_key, total_value=value, total_units=units,
+                product_count=products, low_stock_count=low_stock,
+                updated_at=datetime.utcnow()
+            ))
+
+
+# Event listeners keeping the inventory summary up to date on product writes
+SUMMARY_FIELDS = ('quantity', 'unit_price', 'min_stock_level', 'category_id')
+
+
+def _apply_contribution(connection, category_id, contribution, sign):
+    value, units, products, low_stock = contribution
+    InventorySummary.apply_delta(connection, category_id, value * sign, units * sign,
+                                 products * sign, low_stock * sign)
+
+
+@event.listens_for(Product, 'after_insert')
+def product_summary_created(mapper, connection, target):
+    """Add a new product to the inventory summary"""
+    _apply_contribution(connection, target.category_id, InventorySummary.contribution(
+        target.quantity, target.unit_price, target.min_stock_level), 1)
+
+
+@event.listens_for(Product, 'after_update')
+def product_summary_updated(mapper, connection, target):
+    """Move a product's contribution when its stock, price, minimum or category changes"""
+    state = inspect(target)
+    old = {}
+    changed = False
+    for field in SUMMARY_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changed = True
+            old[field] = history.deleted[0] if history.deleted else None
+        else:
+            old[field] = getattr(target, field)
+
+    if not changed:
+        return
+
+    _apply_contribution(connection, old['category_id'], InventorySummary.contribution(
+        old['quantity'], old['unit_price'], old['min_stock_level']), -1)
+    _apply_contribution(connection, target.category_id, InventorySummary.contribution(
+        target.quantity, target.unit_price, target.min_stock_level), 1)
+
+
+@event.listens_for(Product, 'after_delete')
+def product_summary_deleted(mapper, connection, target):
+    """Remove a deleted product from the inventory summary"""
+    _apply_contribution(connection, target.category_id, InventorySummary.contribution(
+        target.quantity, target.unit_price, target.min_stock_level), -1)
+
+
+# Event listeners keeping the scanner code cache consistent
+SCAN_CODE_FIELDS = ('barcode', 'rfid_tag', 'sku')
+
+
+def _mark_scan_codes_changed(target):
+    """Flag the owning session so the scan cache is invalidated on commit"""
+    session = object_session(target)
+    if session is not None:
+        session.info['scan_codes_changed'] = True
+
+
 @event.listens_for(Product, 'after_insert')
-def log_product_created(mapper, connection, target):
-    """Log product creation"""
-    # This will be implemented in the audit logging utility
-    pass
+def product_codes_created(mapper, connection, target):
+    """Invalidate cached scan codes when a product is created"""
+    _mark_scan_codes_changed(target)
 
 
 @event.listens_for(Product, 'after_update')
-def log_product_updated(mapper, connection, target):
-    """Log product updates"""
-    # This will be implemented in the audit logging utility
-    pass
+def product_codes_updated(mapper, connection, target):
+    """Invalidate cached scan codes when a product's codes change"""
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SCAN_CODE_FIELDS):
+        _mark_scan_codes_changed(target)
 
 
 @event.listens_for(Product, 'after_delete')
-def log_product_deleted(mapper, connection, target):
-    """Log product deletion"""
-    # This will be implemented in the audit logging utility
-    pass
+def product_codes_deleted(mapper, connection, target):
+    """Invalidate cached scan codes when a product is deleted"""
+    _mark_scan_codes_changed(target)
+
+
+@event.listens_for(ProductCode, 'after_insert')
+@event.listens_for(ProductCode, 'after_update')
+@event.listens_for(ProductCode, 'after_delete')
+def product_code_changed(mapper, connection, target):
+    """Invalidate cached scan codes when the code lookup table changes"""
+    _mark_scan_codes_changed(target)
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def principal_changed(mapper, connection, target):
+    """Invalidate cached user principals when a user, their roles or a role change"""
+    session = object_session(target)
+    if session is not None:
+        session.info['principals_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_scan_cache(session):
+    """Signal all workers once product code or user changes are committed"""
+    if session.info.pop('scan_codes_changed', False):
+        scan_cache.invalidate()
+    if session.info.pop('principals_changed', False):
+        principal_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_scan_cache_changes(session):
+    """Forget pending code and user changes that were rolled back"""
+    session.info.pop('scan_codes_changed', None)
+    session.info.pop('principals_changed', None)
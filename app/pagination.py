@@ -0,0 +1,142 @@
+"""Keyset (cursor) pagination for large ordered listings"""
+import base64
+import binascii
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, literal, tuple_
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def to_dict(self):
+        """Pagination metadata for JSON responses"""
+        return {
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total,
+        }
+
+
+def encode_cursor(values, direction):
+    """Encode key values and a direction into an opaque URL-safe cursor"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    payload = json.dumps({'k': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Returns:
+        Tuple of (key values or None, direction); invalid cursors start from the first page
+    """
+    if not cursor:
+        return None, 'next'
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, direction = payload['k'], payload['d']
+        if len(values) != len(keys) or direction not in ('next', 'prev'):
+            raise ValueError('cursor does not match keys')
+        values = [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime) and value is not None else value
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None, 'next'
+
+    return values, direction
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=20, descending=False, total=None):
+    """
+    Paginate a query by seeking past the last seen key instead of using OFFSET
+
+    Args:
+        query: SQLAlchemy query returning a single entity
+        keys: Column expressions giving a unique, stable ordering (e.g. name, id)
+        cursor: Cursor from a previous page's next_cursor/prev_cursor
+        per_page: Items per page
+        descending: Order by the keys descending instead of ascending
+        total: Optional total to report (see cached_count)
+
+    Returns:
+        KeysetPage
+    """
+    values, direction = decode_cursor(cursor, keys)
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+
+    query = query.add_columns(*keys).order_by(None)
+
+    if values is not None:
+        key_tuple = tuple_(*keys)
+        bound = tuple_(*[literal(value, type_=key.type) for key, value in zip(keys, values)])
+        query = query.filter(key_tuple < bound if reverse else key_tuple > bound)
+
+    query = query.order_by(*[key.desc() if reverse else key.asc() for key in keys])
+    rows = query.limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    next_cursor = prev_cursor = None
+
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(rows[-1][1:], 'next')
+        if (values is not None and not backwards) or (backwards and has_more):
+            prev_cursor = encode_cursor(rows[0][1:], 'prev')
+
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
+
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def cached_count(query, cache_key, ttl=60):
+    """
+    Count a query's rows, reusing the result for ``ttl`` seconds
+
+    The count is an estimate: it may lag behind writes by up to ``ttl``.
+    """
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(cache_key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+    total = query.order_by(None).count()
+
+    with _count_lock:
+        if len(_count_cache) > 1024:
+            _count_cache.clear()
+        _count_cache[cache_key] = (total, now + ttl)
+
+    return total
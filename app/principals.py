@@ -0,0 +1,92 @@
+"""Per-worker cache of the logged-in user's principal (identity, flags and role names)"""
+from flask_security.utils import set_request_attr
+from sqlalchemy.orm import make_transient_to_detached, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.signal_cache import SignalCache
+
+# User columns kept in a principal. Credentials (password, TOTP secret) are
+# never cached; they and any other column load from the database on access.
+PRINCIPAL_COLUMNS = ('id', 'fs_uniquifier', 'username', 'email', 'active', 'language', 'tf_primary_method')
+
+
+class PrincipalCache(SignalCache):
+    """
+    LRU/TTL cache of user principals keyed by ``fs_uniquifier``
+
+    Each entry holds the user's identity, active flag, language and roles,
+    so authenticated requests can rebuild ``current_user`` without querying
+    the user, roles and roles_users tables. Entries are dropped in every
+    worker, through the shared signal file, whenever a user or role is
+    committed.
+    """
+
+    config_prefix = 'USER_CACHE'
+    signal_name = 'user_cache.signal'
+
+    def init_app(self, app):
+        """Configure the cache from the application config and install the user loader"""
+        super().init_app(app)
+        app.login_manager.user_loader(load_user)
+
+
+principal_cache = PrincipalCache(maxsize=1024, ttl=60)
+
+
+def snapshot_user(user):
+    """Plain-data principal for a User with its roles loaded"""
+    return {
+        'columns': {key: getattr(user, key) for key in PRINCIPAL_COLUMNS},
+        'roles': [(role.id, role.name, role.description) for role in user.roles],
+    }
+
+
+def restore_user(principal):
+    """
+    Rebuild a persistent User (and its roles) from a principal without a query
+
+    The instances are attached to the current session as if just loaded, so
+    changes to ``current_user`` are still flushed normally. Columns outside
+    the principal are expired and load from the database on first access.
+    """
+    from app import db
+    from app.models import User, Role
+
+    roles = []
+    for role_id, name, description in principal['roles']:
+        role = Role(id=role_id, name=name, description=description)
+        make_transient_to_detached(role)
+        roles.append(db.session.merge(role, load=False))
+
+    user = User(**principal['columns'])
+    make_transient_to_detached(user)
+    user = db.session.merge(user, load=False)
+    set_committed_value(user, 'roles', roles)
+    return user
+
+
+def load_user(fs_uniquifier):
+    """
+    Flask-Login user loader backed by the principal cache
+
+    Mirrors Flask-Security's loader: inactive users are not logged in.
+    """
+    from app.models import User
+
+    principal = principal_cache.get(fs_uniquifier)
+    if principal is not None:
+        if not principal['columns']['active']:
+            return None
+        user = restore_user(principal)
+    else:
+        user = User.query.options(selectinload(User.roles)).filter_by(
+            fs_uniquifier=str(fs_uniquifier)
+        ).first()
+        if user is None:
+            return None
+        principal_cache.set(fs_uniquifier, snapshot_user(user))
+        if not user.active:
+            return None
+
+    set_request_attr('fs_authn_via', 'session')
+    return user
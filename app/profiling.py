@@ -0,0 +1,145 @@
+"""Opt-in request profiling: Server-Timing header and a JSON slow request/query log"""
+import json
+import logging
+import time
+from datetime import datetime
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger('ims.profiling')
+
+
+class RequestProfiler:
+    """
+    Per-request SQL and template timing, enabled with ``PROFILING_ENABLED``
+
+    When disabled, init_app registers nothing, so requests pay no overhead.
+    When enabled, every response gets a ``Server-Timing`` header (total, SQL
+    and template time), and requests or statements slower than
+    ``PROFILING_SLOW_REQUEST_MS`` / ``PROFILING_SLOW_QUERY_MS`` are written
+    as one JSON object per line to the ``ims.profiling`` logger. Statement
+    parameters are never logged, only their types.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_request_ms = 500
+        self.slow_query_ms = 100
+
+    def init_app(self, app):
+        """Register the request, template and SQL hooks if profiling is enabled"""
+        from app import db
+
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        if not self.enabled:
+            return
+
+        self.slow_request_ms = app.config.get('PROFILING_SLOW_REQUEST_MS', self.slow_request_ms)
+        self.slow_query_ms = app.config.get('PROFILING_SLOW_QUERY_MS', self.slow_query_ms)
+        _configure_logger(app.config.get('PROFILING_LOG_FILE'))
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_template, app)
+        template_rendered.connect(self._finish_template, app)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._start_query)
+                event.listen(engine, 'after_cursor_execute', self._finish_query)
+
+    def _start_request(self):
+        g.profile = {'started': time.perf_counter(), 'queries': 0, 'sql': 0.0,
+                     'templates': 0.0, 'template_stack': []}
+
+    def _finish_request(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+
+        total = (time.perf_counter() - profile['started']) * 1000
+        sql = profile['sql'] * 1000
+        templates = profile['templates'] * 1000
+
+        response.headers.add('Server-Timing', f'total;dur={total:.1f}')
+        response.headers.add('Server-Timing', f'db;dur={sql:.1f};desc="{profile["queries"]} queries"')
+        if profile['templates']:
+            response.headers.add('Server-Timing', f'tpl;dur={templates:.1f}')
+
+        if total >= self.slow_request_ms:
+            _log({
+                'type': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round(total, 1),
+                'sql_ms': round(sql, 1),
+                'queries': profile['queries'],
+                'template_ms': round(templates, 1),
+            })
+
+        return response
+
+    def _start_template(self, sender, template, context, **extra):
+        profile = g.get('profile') if has_request_context() else None
+        if profile is not None:
+            profile['template_stack'].append(time.perf_counter())
+
+    def _finish_template(self, sender, template, context, **extra):
+        profile = g.get('profile') if has_request_context() else None
+        if profile is not None and profile['template_stack']:
+            profile['templates'] += time.perf_counter() - profile['template_stack'].pop()
+
+    def _start_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profile_query_started', []).append(time.perf_counter())
+
+    def _finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('profile_query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+
+        profile = g.get('profile') if has_request_context() else None
+        if profile is not None:
+            profile['queries'] += 1
+            profile['sql'] += elapsed
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            _log({
+                'type': 'slow_query',
+                'path': request.path if has_request_context() else None,
+                'duration_ms': round(elapsed * 1000, 1),
+                'statement': ' '.join(statement.split()),
+                'parameters': redact_parameters(parameters, executemany),
+            })
+
+
+def redact_parameters(parameters, executemany=False):
+    """Replace bound values with their type names so no data reaches the log"""
+    if executemany:
+        return {'rows': len(parameters)}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _configure_logger(path):
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _log(entry):
+    entry['time'] = datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+    logger.info(json.dumps(entry, default=str))
+
+
+request_profiler = RequestProfiler()
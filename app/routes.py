@@ -1,9 +1,14 @@
 """Main application routes"""
 from flask import Blueprint, render_template, redirect, url_for, flash, session, request
 from flask_login import login_required, current_user
-from app.models import Product, Category, StockMovement
-from app.utils import get_low_stock_products, calculate_inventory_value, get_user_language, set_user_language
-from app import db
+from flask_security import roles_accepted
+from app.models import Product, Category, StockMovement, ProductForecast
+from app.utils import (get_low_stock_products, get_inventory_summary, get_user_language, set_user_language,
+                       get_reorder_suggestions, reorder_suggestions_query, log_audit)
+from app.pagination import cached_count
+from app import db, limiter
+from app.database import read_only
+from sqlalchemy.orm import joinedload
 
 main_bp = Blueprint('main', __name__)
 
@@ -18,32 +23,69 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     """Main dashboard"""
-    # Get statistics
-    total_products = Product.query.count()
-    low_stock_products = get_low_stock_products()
-    total_inventory_value = calculate_inventory_value()
+    # Get statistics from the maintained summary table
+    summary, category_summaries = get_inventory_summary()
+    low_stock_products = get_low_stock_products(limit=5)
+
+    # Reorder suggestions from the cached consumption forecasts
+    reorder_suggestions = get_reorder_suggestions(limit=10)
+    reorder_count = cached_count(reorder_suggestions_query(), ('reorder_suggestions',))
+    forecasts_computed_at = db.session.query(ProductForecast.computed_at).limit(1).scalar()
 
     # Get recent stock movements
-    recent_movements = StockMovement.query.order_by(
+    recent_movements = StockMovement.query.options(
+        joinedload(StockMovement.product),
+        joinedload(StockMovement.user)
+    ).order_by(
         StockMovement.created_at.desc()
     ).limit(10).all()
 
     # Get product categories
-    categories = Category.query.all()
+    categories = {category.id: category for category in Category.query.all()}
 
     return render_template(
         'dashboard.html',
-        total_products=total_products,
-        low_stock_count=len(low_stock_products),
+        total_products=summary.product_count,
+        low_stock_count=summary.low_stock_count,
         low_stock_products=low_stock_products,
-        total_inventory_value=total_inventory_value,
+        reorder_suggestions=reorder_suggestions,
+        reorder_count=reorder_count,
+        forecasts_computed_at=forecasts_computed_at,
+        total_inventory_value=float(summary.total_value),
+        category_summaries=[s for s in category_summaries if s.product_count],
         recent_movements=recent_movements,
         categories=categories
     )
 
 
+@main_bp.route('/forecasts/refresh', methods=['POST'])
+@login_required
+@roles_accepted('Admin', 'Manager')
+@limiter.limit("10 per hour")
+def refresh_forecasts():
+    """Recompute consumption forecasts and reorder points for all products"""
+    try:
+        from app.forecast import compute_forecasts
+    except ImportError:
+        flash('Forecasting requires NumPy (pip install -r requirements.txt)', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    try:
+        counts = compute_forecasts()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error computing forecasts: {str(e)}")
+        flash('Forecasts could not be computed', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    log_audit('forecasts_computed', 'product', None, counts)
+    flash(f"Forecasts updated for {counts['products']} products; {counts['to_reorder']} to reorder", 'success')
+    return redirect(url_for('main.dashboard'))
+
+
 @main_bp.route('/language/<lang>')
 def set_language(lang):
     """Change user language preference"""
@@ -0,0 +1,17 @@
+"""In-process cache mapping scanned codes to product ids and pack quantities"""
+from app.signal_cache import SignalCache
+
+
+class ScanCodeCache(SignalCache):
+    """
+    Bounded LRU cache with a TTL that resolves a scanned code to (product id, units per scan)
+
+    The signal file is touched whenever a product's codes change, so every
+    worker drops its copy (see SignalCache).
+    """
+
+    config_prefix = 'SCAN_CACHE'
+    signal_name = 'scan_cache.signal'
+
+
+scan_cache = ScanCodeCache()
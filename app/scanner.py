@@ -1,9 +1,13 @@
 """Barcode/RFID scanner integration routes"""
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required
+from flask_security import roles_required
 from app import db, limiter
-from app.models import Product
-from app.utils import log_audit, record_stock_movement, get_user_language
+from app.database import pool_stats
+from app.metrics import metrics
+from app.scan_cache import scan_cache
+from app.utils import (log_audit, record_stock_movement, get_user_language, find_product_by_code,
+                       resolve_code, find_products_by_codes, InsufficientStockError)
 
 scanner_bp = Blueprint('scanner', __name__, url_prefix='/scanner')
 
@@ -27,13 +31,10 @@ def lookup():
             return render_template('scanner/lookup.html')
 
         # Search by barcode, RFID, or SKU
-        product = Product.query.filter(
-            (Product.barcode == code) |
-            (Product.rfid_tag == code) |
-            (Product.sku == code)
-        ).first()
+        product = find_product_by_code(code)
 
         if product:
+            metrics.record_scan('lookup')
             log_audit('product_scanned', 'product', product.id, {'code': code})
             return redirect(url_for('inventory.view_product', product_id=product.id))
         else:
@@ -56,16 +57,13 @@ def stock_in():
             flash('Please scan or enter a code', 'warning')
             return render_template('scanner/stock_in.html')
 
-        # Find product
-        product = Product.query.filter(
-            (Product.barcode == code) |
-            (Product.rfid_tag == code) |
-            (Product.sku == code)
-        ).first()
+        # Find product; a case or pallet barcode moves its pack quantity per scan
+        product, units = resolve_code(code)
 
         if not product:
             flash(f'No product found with code: {code}', 'danger')
             return render_template('scanner/stock_in.html')
+        quantity *= units
 
         try:
             # Record stock movement
@@ -77,6 +75,7 @@ def stock_in():
                 reference=reference
             )
             db.session.commit()
+            metrics.record_scan('stock_in')
 
             log_audit('stock_in_scan', 'product', product.id, {
                 'code': code,
@@ -109,20 +108,13 @@ def stock_out():
             flash('Please scan or enter a code', 'warning')
             return render_template('scanner/stock_out.html')
 
-        # Find product
-        product = Product.query.filter(
-            (Product.barcode == code) |
-            (Product.rfid_tag == code) |
-            (Product.sku == code)
-        ).first()
+        # Find product; a case or pallet barcode moves its pack quantity per scan
+        product, units = resolve_code(code)
 
         if not product:
             flash(f'No product found with code: {code}', 'danger')
             return render_template('scanner/stock_out.html')
-
-        if product.quantity < quantity:
-            flash(f'Insufficient stock! Available: {product.quantity}', 'danger')
-            return render_template('scanner/stock_out.html')
+        quantity *= units
 
         try:
             # Record stock movement
@@ -134,6 +126,7 @@ def stock_out():
                 reference=reference
             )
             db.session.commit()
+            metrics.record_scan('stock_out')
 
             log_audit('stock_out_scan', 'product', product.id, {
                 'code': code,
@@ -149,6 +142,9 @@ def stock_out():
             # Clear form for next scan
             return render_template('scanner/stock_out.html', success=True)
 
+        except InsufficientStockError as e:
+            db.session.rollback()
+            flash(f'Insufficient stock! Available: {e.available}', 'danger')
         except Exception as e:
             db.session.rollback()
             flash(f'Error removing stock: {str(e)}', 'danger')
@@ -171,17 +167,18 @@ def api_scan():
     if not code:
         return jsonify({'success': False, 'error': 'No code provided'}), 400
 
-    # Find product
-    product = Product.query.filter(
-        (Product.barcode == code) |
-        (Product.rfid_tag == code) |
-        (Product.sku == code)
-    ).first()
+    # Find product; a case or pallet barcode moves its pack quantity per scan
+    product, units = resolve_code(code)
 
     if not product:
         return jsonify({'success': False, 'error': 'Product not found'}), 404
 
+    if action in ('stock_in', 'stock_out') and (
+            not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0):
+        return jsonify({'success': False, 'error': 'Quantity must be a positive integer'}), 400
+
     if action == 'lookup':
+        metrics.record_scan('lookup')
         return jsonify({
             'success': True,
             'product': {
@@ -192,7 +189,8 @@ def api_scan():
                 'min_stock_level': product.min_stock_level,
                 'is_low_stock': product.is_low_stock,
                 'unit_price': float(product.unit_price)
-            }
+            },
+            'units_per_scan': units
         })
 
     elif action == 'stock_in':
@@ -200,14 +198,15 @@ def api_scan():
             record_stock_movement(
                 product=product,
                 movement_type='in',
-                quantity=quantity,
+                quantity=quantity * units,
                 notes='Quick scan stock in'
             )
             db.session.commit()
+            metrics.record_scan('stock_in')
 
             return jsonify({
                 'success': True,
-                'message': f'Added {quantity} units',
+                'message': f'Added {quantity * units} units',
                 'new_quantity': product.quantity
             })
         except Exception as e:
@@ -215,29 +214,193 @@ def api_scan():
             return jsonify({'success': False, 'error': str(e)}), 500
 
     elif action == 'stock_out':
-        if product.quantity < quantity:
-            return jsonify({
-                'success': False,
-                'error': f'Insufficient stock. Available: {product.quantity}'
-            }), 400
-
         try:
             record_stock_movement(
                 product=product,
                 movement_type='out',
-                quantity=quantity,
+                quantity=quantity * units,
                 notes='Quick scan stock out'
             )
             db.session.commit()
+            metrics.record_scan('stock_out')
 
             return jsonify({
                 'success': True,
-                'message': f'Removed {quantity} units',
+                'message': f'Removed {quantity * units} units',
                 'new_quantity': product.quantity,
                 'is_low_stock': product.is_low_stock
             })
+        except InsufficientStockError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 400
         except Exception as e:
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)}), 500
 
     return jsonify({'success': False, 'error': 'Invalid action'}), 400
+
+
+BATCH_ACTIONS = {'lookup': None, 'stock_in': 'in', 'stock_out': 'out'}
+
+
+@scanner_bp.route('/api/scan-batch', methods=['POST'])
+@login_required
+@limiter.limit("10 per minute")
+def api_scan_batch():
+    """
+    Apply many scans from a batch scanner upload in one transaction
+
+    Expects ``{"items": [{"code", "action", "quantity", "reference"}], "atomic": bool}``.
+    With ``atomic`` (the default) nothing is written unless every item is
+    valid; otherwise valid items are applied and invalid ones are reported.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    atomic = bool(data.get('atomic', True))
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'No items provided'}), 400
+
+    max_items = current_app.config.get('SCAN_BATCH_MAX_ITEMS', 1000)
+    if len(items) > max_items:
+        return jsonify({
+            'success': False,
+            'error': f'Too many items. Maximum per batch: {max_items}'
+        }), 400
+
+    codes = [str(item.get('code', '')).strip() for item in items if isinstance(item, dict)]
+    products = find_products_by_codes(code for code in codes if code)
+
+    # Validate every item against the running quantities before writing anything
+    results = []
+    planned = []
+    available = {}
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({'index': index, 'success': False, 'error': 'Invalid item'})
+            continue
+
+        code = str(item.get('code', '')).strip()
+        action = item.get('action', 'lookup')
+        quantity = item.get('quantity', 1)
+        result = {'index': index, 'code': code, 'action': action}
+        results.append(result)
+
+        if not code:
+            result.update(success=False, error='No code provided')
+            continue
+
+        if action not in BATCH_ACTIONS:
+            result.update(success=False, error='Invalid action')
+            continue
+
+        product, units = products.get(code, (None, 1))
+        if product is None:
+            result.update(success=False, error='Product not found')
+            continue
+
+        if action == 'lookup':
+            result.update(success=True, product_id=product.id, sku=product.sku,
+                          quantity=product.quantity, is_low_stock=product.is_low_stock, units_per_scan=units)
+            continue
+
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            result.update(success=False, error='Quantity must be a positive integer')
+            continue
+        quantity *= units
+
+        reference = item.get('reference')
+        if reference is not None and (not isinstance(reference, str) or len(reference) > 100):
+            result.update(success=False, error='Reference must be text of at most 100 characters')
+            continue
+
+        current = available.get(product.id, product.quantity)
+        if action == 'stock_out' and current < quantity:
+            result.update(success=False, error=f'Insufficient stock. Available: {current}')
+            continue
+
+        available[product.id] = current + quantity if action == 'stock_in' else current - quantity
+        planned.append((result, product, action, quantity, reference))
+
+    failed = [result for result in results if not result.get('success', True)]
+
+    if atomic and failed:
+        for result, *_ in planned:
+            result.update(success=False, error='Not applied: batch rejected')
+        return jsonify({
+            'success': False,
+            'atomic': True,
+            'applied': 0,
+            'failed': len(failed),
+            'results': results
+        }), 400
+
+    applied = 0
+
+    try:
+        for result, product, action, quantity, reference in planned:
+            try:
+                record_stock_movement(
+                    product=product,
+                    movement_type=BATCH_ACTIONS[action],
+                    quantity=quantity,
+                    notes='Batch scan',
+                    reference=reference
+                )
+            except InsufficientStockError as e:
+                # Stock was taken by a concurrent scan since validation
+                if atomic:
+                    db.session.rollback()
+                    return jsonify({
+                        'success': False,
+                        'atomic': True,
+                        'applied': 0,
+                        'failed': 1,
+                        'error': f'Item {result["index"]}: {str(e)}'
+                    }), 409
+                result.update(success=False, error=str(e))
+                failed.append(result)
+                continue
+
+            applied += 1
+            log_audit(f'{action}_scan', 'product', product.id, {
+                'code': result['code'],
+                'quantity': quantity,
+                'batch': True
+            }, commit=False)
+            result.update(success=True, product_id=product.id, new_quantity=product.quantity,
+                          is_low_stock=product.is_low_stock)
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    for action in BATCH_ACTIONS:
+        metrics.record_scan(action, sum(1 for result in results
+                                        if result.get('success') and result['action'] == action))
+
+    return jsonify({
+        'success': not failed,
+        'atomic': atomic,
+        'applied': applied,
+        'failed': len(failed),
+        'results': results
+    })
+
+
+@scanner_bp.route('/api/cache-stats')
+@login_required
+@roles_required('Admin')
+def api_cache_stats():
+    """Scan code cache hit/miss counters for this worker"""
+    return jsonify(scan_cache.stats())
+
+
+@scanner_bp.route('/api/pool-stats')
+@login_required
+@roles_required('Admin')
+def api_pool_stats():
+    """Database connection pool sizes and checkout wait times for this worker"""
+    return jsonify(pool_stats(db))
@@ -0,0 +1,171 @@
+"""Full-text product search backed by an SQLite FTS5 trigram index"""
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Product
+
+# Minimum term length the trigram tokenizer can match
+MIN_TERM_LENGTH = 3
+
+# bm25 column weights: name, description, sku, barcode, category_en, category_bg
+BM25_WEIGHTS = '10.0, 1.0, 5.0, 5.0, 2.0, 2.0'
+
+SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        name, description, sku, barcode, category_en, category_bg,
+        tokenize = 'trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN
+        DELETE FROM product_search WHERE rowid = new.id;
+        INSERT INTO product_search(rowid, name, description, sku, barcode, category_en, category_bg)
+        VALUES (new.id, new.name, new.description, new.sku, new.barcode,
+                (SELECT name_en FROM category WHERE id = new.category_id),
+                (SELECT name_bg FROM category WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_update
+    AFTER UPDATE OF name, description, sku, barcode, category_id ON product BEGIN
+        DELETE FROM product_search WHERE rowid = old.id;
+        INSERT INTO product_search(rowid, name, description, sku, barcode, category_en, category_bg)
+        VALUES (new.id, new.name, new.description, new.sku, new.barcode,
+                (SELECT name_en FROM category WHERE id = new.category_id),
+                (SELECT name_bg FROM category WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN
+        DELETE FROM product_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_category_update
+    AFTER UPDATE OF name_en, name_bg ON category BEGIN
+        UPDATE product_search SET category_en = new.name_en, category_bg = new.name_bg
+        WHERE rowid IN (SELECT id FROM product WHERE category_id = new.id);
+    END
+    """,
+]
+
+REBUILD_SQL = """
+    INSERT INTO product_search(rowid, name, description, sku, barcode, category_en, category_bg)
+    SELECT p.id, p.name, p.description, p.sku, p.barcode, c.name_en, c.name_bg
+    FROM product p LEFT JOIN category c ON c.id = p.category_id
+"""
+
+# Per-database cache of whether the FTS index exists
+_available = {}
+
+
+def create_search_index(connection):
+    """
+    Create the FTS5 table and its sync triggers if they do not exist
+
+    Returns:
+        True if the index is available, False if this SQLite build lacks
+        FTS5 or the trigram tokenizer (SQLite < 3.34)
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    try:
+        for statement in SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+    except OperationalError as e:
+        print(f"Full-text search unavailable: {str(e)}")
+        return False
+
+    return True
+
+
+@event.listens_for(Product.__table__, 'after_create')
+def product_table_created(target, connection, **kw):
+    """Create the search index alongside a freshly created product table"""
+    create_search_index(connection)
+
+
+@event.listens_for(Product.__table__, 'after_drop')
+def product_table_dropped(target, connection, **kw):
+    """Drop the search index together with the product table"""
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS product_search')
+    _available.clear()
+
+
+def rebuild_search_index():
+    """
+    Create the search index if needed and repopulate it from the product table
+
+    Returns:
+        Number of indexed products, or None if full-text search is unavailable
+    """
+    connection = db.session.connection()
+    if not create_search_index(connection):
+        return None
+
+    connection.exec_driver_sql('DELETE FROM product_search')
+    connection.exec_driver_sql(REBUILD_SQL)
+    db.session.commit()
+    _available.pop(str(db.engine.url), None)
+
+    return db.session.execute(text('SELECT count(*) FROM product_search')).scalar()
+
+
+def search_available():
+    """Check whether the FTS index exists in the current database"""
+    key = str(db.engine.url)
+    if key not in _available:
+        available = False
+        if db.engine.dialect.name == 'sqlite':
+            available = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+            )).first() is not None
+        _available[key] = available
+    return _available[key]
+
+
+def _match_expression(term):
+    """Quote a user term as a single FTS5 phrase"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def apply_product_search(query, term):
+    """
+    Filter a Product query by a search term
+
+    Uses the FTS5 index ranked by bm25 when available, and falls back to
+    ILIKE across name, SKU and barcode for short terms and non-SQLite
+    backends.
+
+    Args:
+        query: Product query to filter
+        term: Search term entered by the user
+
+    Returns:
+        Tuple of (filtered query, relevance ordering keys or None when
+        the ILIKE fallback was used)
+    """
+    term = term.strip()
+
+    if len(term) >= MIN_TERM_LENGTH and search_available():
+        matches = text(
+            f'SELECT rowid AS product_id, bm25(product_search, {BM25_WEIGHTS}) AS rank '
+            'FROM product_search WHERE product_search MATCH :term'
+        ).bindparams(term=_match_expression(term)).columns(
+            db.column('product_id', db.Integer), db.column('rank', db.Float)
+        ).subquery('matches')
+
+        rank_keys = [matches.c.rank, Product.id]
+        query = query.join(matches, matches.c.product_id == Product.id).order_by(*rank_keys)
+        return query, rank_keys
+
+    query = query.filter(
+        (Product.name.ilike(f'%{term}%')) |
+        (Product.sku.ilike(f'%{term}%')) |
+        (Product.barcode.ilike(f'%{term}%'))
+    )
+    return query, None
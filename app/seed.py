@@ -0,0 +1,272 @@
+"""Synthetic inventory data for benchmarks (``flask seed-bench``)"""
+import random
+from array import array
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, insert, update
+
+from app import db
+from app.models import Category, MovementRollup, Product, ProductCode, StockMovement, User
+
+# Seeded products are recognisable by this SKU prefix; a re-run appends after them
+SKU_PREFIX = 'BENCH-'
+
+CATEGORY_NAMES = [
+    ('Fasteners', 'Крепежни елементи'), ('Electrical', 'Електрически'), ('Plumbing', 'ВиК'),
+    ('Hand Tools', 'Ръчни инструменти'), ('Power Tools', 'Електроинструменти'), ('Paint', 'Бои'),
+    ('Adhesives', 'Лепила'), ('Safety', 'Безопасност'), ('Lighting', 'Осветление'),
+    ('Garden', 'Градина'), ('Packaging', 'Опаковки'), ('Cleaning', 'Почистване'),
+]
+ADJECTIVES = ['Heavy-duty', 'Compact', 'Stainless', 'Galvanised', 'Industrial', 'Premium',
+              'Standard', 'Flexible', 'Reinforced', 'Insulated', 'Coated', 'Economy']
+NOUNS = ['bolt', 'screw', 'anchor', 'cable', 'connector', 'pipe', 'valve', 'fitting', 'wrench',
+         'drill bit', 'brush', 'roller', 'tape', 'glove', 'lamp', 'hose', 'box', 'cleaner']
+SIZES = ['M4', 'M6', 'M8', 'M10', '10 mm', '25 mm', '50 mm', '1 m', '5 m', '10 m', 'S', 'M', 'L', 'XL']
+
+# Movement mix and case sizes used for the synthetic history
+MOVEMENT_TYPES = ('out', 'in', 'adjustment')
+MOVEMENT_WEIGHTS = (60, 35, 5)
+CASE_SIZES = (6, 12, 24, 48)
+
+
+def ean13(number):
+    """12-digit number plus its EAN-13 check digit"""
+    digits = f'{number:012d}'
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def zipf_weights(count, exponent=1.1):
+    """Cumulative weights where the rank-r item is chosen proportionally to 1/r^exponent"""
+    cumulative = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def seed_bench_data(products=10000, categories=50, movements=100000, days=365,
+                    user_id=None, seed=42, chunk_size=5000, progress=None):
+    """
+    Bulk-insert categories, products, product codes and stock movements
+
+    Rows are written with chunked executemany INSERTs rather than ORM adds,
+    so mapper events do not fire; the inventory summary is rebuilt and the
+    scan cache invalidated at the end instead.
+
+    Distributions:
+        products per category and movements per product follow a Zipf law
+        (a few categories and best-sellers dominate); starting quantities
+        and unit prices are log-normal; movements are 60% out, 35% in (case
+        multiples) and 5% adjustments, timestamped during working hours
+        over the last ``days`` days, with quantities that never go negative.
+
+    Args:
+        products: Number of products
+        categories: Number of categories
+        movements: Number of stock movements
+        days: Length of the movement history
+        user_id: User recorded on movements
+        seed: Random seed, so runs are reproducible
+        chunk_size: Rows per executemany
+        progress: Optional callable(stage, rows) called after each chunk
+
+    Returns:
+        Dict of row counts per table
+    """
+    from app.scan_cache import scan_cache
+    from app.utils import rebuild_inventory_summary
+
+    rng = random.Random(seed)
+    progress = progress or (lambda stage, rows: None)
+    offset = db.session.query(db.func.count(Product.id)).filter(Product.sku.like(f'{SKU_PREFIX}%')).scalar()
+    now = datetime.utcnow()
+
+    # Categories
+    category_rows = []
+    for i in range(categories):
+        name_en, name_bg = CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+        suffix = f' {i // len(CATEGORY_NAMES) + 1}' if i >= len(CATEGORY_NAMES) else ''
+        category_rows.append({'name_en': f'{name_en}{suffix}', 'name_bg': f'{name_bg}{suffix}',
+                              'description': f'Benchmark category {i + 1}', 'created_at': now})
+    first_category = (db.session.query(db.func.max(Category.id)).scalar() or 0) + 1
+    _insert_chunks(Category, category_rows, chunk_size, progress, 'categories')
+    category_ids = [row[0] for row in db.session.query(Category.id).filter(Category.id >= first_category)
+                    .order_by(Category.id)]
+
+    # Products and their lookup codes
+    category_weights = zipf_weights(len(category_ids))
+    quantities = {}
+    product_rows = []
+    code_rows = []
+    first_product = (db.session.query(db.func.max(Product.id)).scalar() or 0) + 1
+
+    for index in range(offset, offset + products):
+        sku = f'{SKU_PREFIX}{index:07d}'
+        barcode = ean13(200000000000 + index)
+        rfid_tag = f'E200{index:020X}' if rng.random() < 0.3 else None
+        quantity = int(rng.lognormvariate(3.0, 1.2)) if rng.random() > 0.05 else 0
+        product_rows.append({
+            'name': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.choice(SIZES)}',
+            'description': f'Synthetic product {index}',
+            'sku': sku,
+            'barcode': barcode,
+            'rfid_tag': rfid_tag,
+            'quantity': quantity,
+            'min_stock_level': rng.choice((5, 10, 10, 20, 50)),
+            'unit_price': round(rng.lognormvariate(2.3, 1.0), 2),
+            'location': f'{rng.choice("ABCDEFGH")}-{rng.randint(1, 40):02d}-{rng.randint(1, 6)}',
+            'category_id': rng.choices(category_ids, cum_weights=category_weights)[0] if category_ids else None,
+            'created_at': now - timedelta(days=days),
+            'updated_at': now,
+        })
+        for kind, code in (('sku', sku), ('barcode', barcode), ('rfid', rfid_tag)):
+            if code:
+                code_rows.append({'code': code, 'kind': kind, 'sku': sku})
+
+        if len(product_rows) >= chunk_size:
+            _flush_products(product_rows, code_rows, quantities, progress)
+
+    _flush_products(product_rows, code_rows, quantities, progress)
+    product_ids = [row[0] for row in db.session.query(Product.id).filter(Product.id >= first_product)
+                   .order_by(Product.id)]
+
+    # Stock movements, generated in time order so quantities stay consistent
+    if user_id is None:
+        user_id = db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    written = 0
+    if product_ids and movements and user_id is not None:
+        popularity = zipf_weights(len(product_ids), exponent=0.8)
+        rng.shuffle(product_ids)
+        start = now - timedelta(days=days)
+        # Exponential gaps scaled so the history fills the weekday working
+        # hours between start and now
+        gaps = array('d', (rng.expovariate(1.0) for _ in range(movements)))
+        scale = _working_seconds(start, now) / (sum(gaps) * (1 + 1 / movements))
+        moment = start
+        rows = []
+
+        for gap in gaps:
+            moment = min(_working_hours(moment + timedelta(seconds=gap * scale)), now)
+            product_id = rng.choices(product_ids, cum_weights=popularity)[0]
+            previous = quantities[product_id]
+            movement_type = rng.choices(MOVEMENT_TYPES, weights=MOVEMENT_WEIGHTS)[0]
+
+            if movement_type == 'out' and previous == 0:
+                movement_type = 'in'
+            if movement_type == 'in':
+                quantity = rng.choice(CASE_SIZES) * rng.randint(1, 4)
+                current = previous + quantity
+            elif movement_type == 'out':
+                quantity = min(previous, max(1, int(rng.expovariate(1 / 3))))
+                current = previous - quantity
+            else:
+                current = max(0, previous + rng.randint(-5, 5))
+                quantity = current - previous
+
+            quantities[product_id] = current
+            rows.append({
+                'product_id': product_id, 'user_id': user_id, 'movement_type': movement_type,
+                'quantity': quantity, 'previous_quantity': previous, 'new_quantity': current,
+                'reference': f'PO-{rng.randint(10000, 99999)}' if movement_type == 'in' else None,
+                'created_at': moment,
+            })
+            if len(rows) >= chunk_size:
+                _insert_chunks(StockMovement, rows, chunk_size, progress, 'movements')
+                MovementRollup.apply_movements(db.session.connection(), rows)
+                written += len(rows)
+                rows = []
+
+        _insert_chunks(StockMovement, rows, chunk_size, progress, 'movements')
+        MovementRollup.apply_movements(db.session.connection(), rows)
+        written += len(rows)
+
+        # Products end with the quantity their last movement left behind
+        statement = update(Product.__table__).where(Product.__table__.c.id == bindparam('product_id'))
+        final = [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()]
+        for i in range(0, len(final), chunk_size):
+            db.session.execute(statement.values(quantity=bindparam('quantity')), final[i:i + chunk_size])
+            progress('quantities', len(final[i:i + chunk_size]))
+
+    db.session.commit()
+    rebuild_inventory_summary()
+    scan_cache.invalidate()
+
+    return {
+        'categories': len(category_ids),
+        'products': len(product_ids),
+        'product_codes': db.session.query(db.func.count(ProductCode.id))
+        .filter(ProductCode.product_id >= first_product).scalar(),
+        'stock_movements': written,
+    }
+
+
+def bench_user(username, password):
+    """Get or create the account the load benchmark logs in with"""
+    from app.models import Role
+
+    user = User.query.filter_by(username=username).first()
+    if user is not None:
+        return user
+
+    role = Role.query.filter_by(name='Staff').first() or Role(name='Staff', description='Staff with basic access')
+    user = User(username=username, email=f'{username}@bench.local',
+                fs_uniquifier=str(uuid.uuid4()), active=True)
+    user.set_password(password)
+    user.roles.append(role)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _flush_products(product_rows, code_rows, quantities, progress):
+    """Insert buffered products, then their codes keyed by the new product ids"""
+    if not product_rows:
+        return
+
+    db.session.execute(insert(Product), product_rows)
+    skus = [row['sku'] for row in product_rows]
+    ids = dict(db.session.query(Product.sku, Product.id).filter(Product.sku.in_(skus)))
+    for row in product_rows:
+        quantities[ids[row['sku']]] = row['quantity']
+
+    codes = [{'code': row['code'], 'kind': row['kind'], 'product_id': ids[row['sku']]} for row in code_rows]
+    if codes:
+        db.session.execute(insert(ProductCode), codes)
+    progress('products', len(product_rows))
+
+    product_rows.clear()
+    code_rows.clear()
+
+
+def _insert_chunks(model, rows, chunk_size, progress, stage):
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        db.session.execute(insert(model), chunk)
+        progress(stage, len(chunk))
+
+
+def _working_seconds(start, end):
+    """Seconds of weekday 07:00-19:00 time between two timestamps"""
+    total = 0.0
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        if day.weekday() < 5:
+            opens = max(day.replace(hour=7), start)
+            closes = min(day.replace(hour=19), end)
+            total += max(0.0, (closes - opens).total_seconds())
+        day += timedelta(days=1)
+    return total
+
+
+def _working_hours(moment):
+    """Move a timestamp forward into the next weekday 07:00-19:00 window"""
+    if moment.hour >= 19:
+        moment = (moment + timedelta(days=1)).replace(hour=7, minute=0)
+    elif moment.hour < 7:
+        moment = moment.replace(hour=7, minute=0)
+    while moment.weekday() >= 5:
+        moment = (moment + timedelta(days=1)).replace(hour=7, minute=0)
+    return moment
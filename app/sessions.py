@@ -0,0 +1,261 @@
+"""Server-side sessions stored in a local SQLite file"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS session (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+class ServerSession(SecureCookieSession):
+    """Session whose data lives on the server; the cookie only carries its id"""
+
+    def __init__(self, initial=None, sid=None, version=0):
+        super().__init__(initial)
+        self.sid = sid
+        self.version = version
+        self.rotate = False
+
+
+class SQLiteSessionStore:
+    """
+    Session rows in their own SQLite file
+
+    Kept apart from the inventory database so session writes never wait on
+    (or block) the stock-movement writer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=15, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, sid):
+        """Return (data, version, expires_at) for a live session, or None"""
+        row = self._connection().execute(
+            'SELECT data, version, expires_at FROM session WHERE sid = ? AND expires_at > ?',
+            (sid, time.time())
+        ).fetchone()
+        return row
+
+    def save(self, sid, data, expires_at):
+        """Insert or replace a session and return its new version"""
+        return self._connection().execute(
+            'INSERT INTO session (sid, data, version, expires_at) VALUES (?, ?, 1, ?) '
+            'ON CONFLICT (sid) DO UPDATE SET data = excluded.data, version = version + 1, '
+            'expires_at = excluded.expires_at RETURNING version',
+            (sid, data, expires_at)
+        ).fetchone()[0]
+
+    def touch(self, sid, expires_at):
+        """Extend a session's expiry without rewriting its data"""
+        self._connection().execute('UPDATE session SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM session WHERE sid = ?', (sid,))
+
+    def purge(self):
+        """Delete expired sessions and return how many were removed"""
+        return self._connection().execute('DELETE FROM session WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Flask session interface that keeps session data in a SessionStore
+
+    The cookie holds ``<sid>.<version>``. The version changes on every
+    write, so a worker's read cache keyed by (sid, version) can only serve
+    data matching what the client last received. Cached entries are still
+    re-read after ``cache_ttl`` seconds so a session deleted elsewhere
+    (logout, expiry) stops being honoured.
+    """
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+
+    def __init__(self, store, cache_size=1024, cache_ttl=10, purge_interval=3600):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.purge_interval = purge_interval
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def open_session(self, app, request):
+        sid, version = _parse_cookie(request.cookies.get(self.get_cookie_name(app)))
+        if sid is None:
+            return self.session_class()
+
+        row = self._cache_get(sid, version)
+        if row is None:
+            row = self.store.get(sid)
+            if row is None:
+                return self.session_class()
+            self._cache_set(sid, row)
+
+        data, version, _ = row
+        return self.session_class(self.serializer.loads(data), sid=sid, version=version)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.sid is not None and (session.rotate or not session):
+            self.store.delete(session.sid)
+            self._cache_pop(session.sid)
+            session.sid = None
+
+        if not session:
+            if session.modified or session.rotate:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # The server-side TTL slides with activity (PERMANENT_SESSION_LIFETIME),
+        # whether or not the cookie itself is permanent
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        expires_at = time.time() + lifetime
+
+        if session.sid is None or session.modified:
+            session.sid = session.sid or secrets.token_urlsafe(32)
+            data = self.serializer.dumps(dict(session))
+            session.version = self.store.save(session.sid, data, expires_at)
+            self._cache_set(session.sid, (data, session.version, expires_at))
+        else:
+            self._refresh(session.sid, expires_at, lifetime)
+            if not self.should_set_cookie(app, session):
+                return
+
+        response.set_cookie(
+            name, f'{session.sid}.{session.version}',
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        self._maybe_purge()
+
+    def _refresh(self, sid, expires_at, lifetime):
+        # Only extend the expiry once half the lifetime has passed, so
+        # unmodified requests rarely write to the store
+        with self._lock:
+            entry = self._cache.get(sid)
+        if entry is not None and entry[0][2] - time.time() > lifetime / 2:
+            return
+        self.store.touch(sid, expires_at)
+        if entry is not None:
+            data, version, _ = entry[0]
+            self._cache_set(sid, (data, version, expires_at))
+
+    def _cache_get(self, sid, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None:
+                return None
+            row, fetched_at = entry
+            if row[1] != version or now - fetched_at > self.cache_ttl or row[2] <= time.time():
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+            return row
+
+    def _cache_set(self, sid, row):
+        with self._lock:
+            self._cache[sid] = (row, time.monotonic())
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_pop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = now
+        try:
+            self.store.purge()
+        except sqlite3.Error as e:
+            print(f"Error purging expired sessions: {str(e)}")
+
+
+def _parse_cookie(value):
+    """Split a ``<sid>.<version>`` cookie; malformed values start a new session"""
+    if not value:
+        return None, None
+    sid, _, version = value.rpartition('.')
+    if not sid or not version.isdigit():
+        return None, None
+    return sid, int(version)
+
+
+def rotate_session(session):
+    """Give the session a new id on its next save (e.g. after login or logout)"""
+    if isinstance(session, ServerSession):
+        session.rotate = True
+
+
+class ServerSessions:
+    """Install the server-side session interface according to ``SESSION_BACKEND``"""
+
+    def __init__(self):
+        self.interface = None
+
+    def init_app(self, app):
+        backend = app.config.get('SESSION_BACKEND', 'sqlite')
+        if backend == 'cookie':
+            return
+        if backend != 'sqlite':
+            raise ValueError(f'Invalid SESSION_BACKEND: {backend}')
+
+        path = app.config.get('SESSION_SQLITE_PATH') or os.path.join(app.instance_path, 'sessions.db')
+        self.interface = ServerSessionInterface(
+            SQLiteSessionStore(path),
+            cache_size=app.config.get('SESSION_CACHE_SIZE', 1024),
+            cache_ttl=app.config.get('SESSION_CACHE_TTL', 10),
+        )
+        app.session_interface = self.interface
+
+    def purge(self):
+        """Delete expired sessions; returns the number removed"""
+        if self.interface is None:
+            return 0
+        return self.interface.store.purge()
+
+
+server_sessions = ServerSessions()
@@ -0,0 +1,125 @@
+"""Bounded in-process LRU/TTL cache kept consistent across workers by a signal file"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class SignalCache:
+    """
+    Bounded LRU cache with a TTL, one copy per gunicorn worker
+
+    Workers are kept consistent through a shared signal file: whenever the
+    cached data changes the file is touched, and every worker clears its
+    cache as soon as it sees a newer modification time.
+
+    Subclasses name their settings through ``config_prefix`` (read as
+    ``<prefix>_ENABLED``, ``_SIZE``, ``_TTL`` and ``_SIGNAL_FILE``) and
+    ``signal_name``, the default signal file in the instance folder.
+    """
+
+    config_prefix = None
+    signal_name = None
+
+    def __init__(self, maxsize=4096, ttl=300, signal_file=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.signal_file = signal_file
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signal_mtime = None
+
+    def init_app(self, app):
+        """Configure the cache from the application config"""
+        prefix = self.config_prefix
+        self.enabled = app.config.get(f'{prefix}_ENABLED', True)
+        self.maxsize = app.config.get(f'{prefix}_SIZE', self.maxsize)
+        self.ttl = app.config.get(f'{prefix}_TTL', self.ttl)
+        self.signal_file = app.config.get(f'{prefix}_SIGNAL_FILE') or os.path.join(
+            app.instance_path, self.signal_name
+        )
+        self._signal_mtime = self._read_signal()
+        self.clear()
+
+    def get(self, key):
+        """Return the cached value for a key, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        self._check_signal()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Remember a value, evicting the least recently used entries beyond maxsize"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached entry in this worker"""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self):
+        """Clear this worker's cache and signal all other workers to do the same"""
+        self.clear()
+        self.invalidations += 1
+
+        if not self.signal_file:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.signal_file), exist_ok=True)
+            with open(self.signal_file, 'a'):
+                os.utime(self.signal_file, None)
+            self._signal_mtime = self._read_signal()
+        except OSError as e:
+            print(f"Error signalling {self.config_prefix.lower()} invalidation: {str(e)}")
+
+    def stats(self):
+        """Return hit/miss counters for this worker"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _read_signal(self):
+        if not self.signal_file:
+            return None
+        try:
+            return os.stat(self.signal_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_signal(self):
+        mtime = self._read_signal()
+        if mtime != self._signal_mtime:
+            self._signal_mtime = mtime
+            self.clear()
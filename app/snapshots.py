@@ -0,0 +1,201 @@
+"""Periodic stock snapshots and point-in-time stock replayed from them"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal, or_, select
+
+from app import db
+from app.models import Product, StockMovement, StockSnapshot, StockSnapshotLine
+
+
+def period_start(period, moment):
+    """Start of the daily or monthly period containing ``moment``"""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'monthly':
+        start = start.replace(day=1)
+    return start
+
+
+def nearest_snapshot(at):
+    """
+    The snapshot closest in time to ``at``, on either side
+
+    Returns:
+        StockSnapshot, or None when replaying back from current stock is closer
+    """
+    before = StockSnapshot.query.filter(StockSnapshot.taken_at <= at).order_by(StockSnapshot.taken_at.desc()).first()
+    after = StockSnapshot.query.filter(StockSnapshot.taken_at > at).order_by(StockSnapshot.taken_at).first()
+
+    candidates = [(at - before.taken_at, before)] if before else []
+    if after:
+        candidates.append((after.taken_at - at, after))
+    candidates.append((max(datetime.utcnow() - at, timedelta(0)), None))
+    return min(candidates, key=lambda candidate: candidate[0])[1]
+
+
+def quantities_as_of(at, base, product_id=None):
+    """
+    Select (product_id, quantity, replayed) for every product that existed at ``at``
+
+    Stock "as of" an instant includes every movement before it. Starting
+    from ``base`` (a snapshot, or current stock when None) only the movements
+    between the base and ``at`` are read: a net delta per product
+    (new_quantity - previous_quantity) is added going forward or
+    subtracted going back.
+
+    Args:
+        at: Point in time
+        base: StockSnapshot or None
+        product_id: Limit to one product
+
+    Returns:
+        Select statement
+    """
+    if base is None:
+        start, end, sign = at, None, -1
+    elif base.taken_at <= at:
+        start, end, sign = base.taken_at, at, 1
+    else:
+        start, end, sign = at, base.taken_at, -1
+
+    window = [StockMovement.created_at >= start]
+    if end is not None:
+        window.append(StockMovement.created_at < end)
+    if product_id is not None:
+        window.append(StockMovement.product_id == product_id)
+    deltas = (
+        select(StockMovement.product_id,
+               func.sum(StockMovement.new_quantity - StockMovement.previous_quantity).label('delta'),
+               func.count(StockMovement.id).label('replayed'))
+        .where(*window)
+        .group_by(StockMovement.product_id)
+        .subquery()
+    )
+
+    if base is None:
+        start_quantity = Product.quantity
+        query = select(Product.id)
+    else:
+        lines = select(StockSnapshotLine).where(StockSnapshotLine.snapshot_id == base.id).subquery()
+        start_quantity = func.coalesce(lines.c.quantity, 0)
+        query = select(Product.id).outerjoin(lines, lines.c.product_id == Product.id)
+
+    query = (
+        query.add_columns(
+            (start_quantity + sign * func.coalesce(deltas.c.delta, 0)).label('quantity'),
+            func.coalesce(deltas.c.replayed, 0).label('replayed'),
+        )
+        .outerjoin(deltas, deltas.c.product_id == Product.id)
+        .where(or_(Product.created_at.is_(None), Product.created_at < at))
+    )
+    if product_id is not None:
+        query = query.where(Product.id == product_id)
+    return query
+
+
+def take_snapshot(period, at=None):
+    """
+    Write a snapshot for the period boundary at (or before) ``at``
+
+    The lines are computed and inserted by a single INSERT ... SELECT, so
+    they are consistent even while stock keeps moving.
+
+    Returns:
+        (StockSnapshot, created) - an existing snapshot for the boundary is returned as is
+    """
+    if period not in StockSnapshot.PERIODS:
+        raise ValueError(f'Invalid snapshot period: {period}')
+
+    taken_at = period_start(period, at or datetime.utcnow())
+    existing = StockSnapshot.query.filter_by(period=period, taken_at=taken_at).first()
+    if existing is not None:
+        return existing, False
+
+    base = nearest_snapshot(taken_at)
+    snapshot = StockSnapshot(period=period, taken_at=taken_at)
+    db.session.add(snapshot)
+    db.session.flush()
+
+    replay = quantities_as_of(taken_at, base).subquery()
+    db.session.execute(
+        StockSnapshotLine.__table__.insert().from_select(
+            ['snapshot_id', 'product_id', 'quantity'],
+            select(literal(snapshot.id), replay.c.id, replay.c.quantity)
+        )
+    )
+    snapshot.product_count, snapshot.total_units = db.session.query(
+        func.count(StockSnapshotLine.product_id), func.coalesce(func.sum(StockSnapshotLine.quantity), 0)
+    ).filter(StockSnapshotLine.snapshot_id == snapshot.id).one()
+    db.session.commit()
+    return snapshot, True
+
+
+def prune_snapshots(period, keep_days):
+    """Delete snapshots of a period older than ``keep_days`` days; returns how many"""
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    ids = [row[0] for row in db.session.query(StockSnapshot.id)
+           .filter(StockSnapshot.period == period, StockSnapshot.taken_at < cutoff)]
+    if ids:
+        db.session.execute(StockSnapshotLine.__table__.delete().where(StockSnapshotLine.snapshot_id.in_(ids)))
+        db.session.execute(StockSnapshot.__table__.delete().where(StockSnapshot.id.in_(ids)))
+        db.session.commit()
+    return len(ids)
+
+
+def ledger_quantity(at):
+    """
+    Stock at ``at`` read straight from the movement chain, independent of any snapshot
+
+    The quantity left by a product's last movement before ``at``, else the
+    quantity its first later movement started from, else its current stock.
+    """
+    before = (
+        select(StockMovement.new_quantity)
+        .where(StockMovement.product_id == Product.id, StockMovement.created_at < at)
+        .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    after = (
+        select(StockMovement.previous_quantity)
+        .where(StockMovement.product_id == Product.id, StockMovement.created_at >= at)
+        .order_by(StockMovement.created_at, StockMovement.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return func.coalesce(before, after, Product.quantity)
+
+
+def verify_snapshot(snapshot):
+    """
+    Compare a snapshot with the movement ledger
+
+    Returns:
+        List of (product_id, snapshot_quantity, ledger_quantity) that differ;
+        a snapshot quantity of None means the product is missing from it
+    """
+    lines = select(StockSnapshotLine).where(StockSnapshotLine.snapshot_id == snapshot.id).subquery()
+    ledger = ledger_quantity(snapshot.taken_at)
+    query = (
+        select(Product.id, lines.c.quantity, ledger)
+        .outerjoin(lines, lines.c.product_id == Product.id)
+        .where(or_(Product.created_at.is_(None), Product.created_at < snapshot.taken_at))
+        .where(or_(lines.c.quantity.is_(None), lines.c.quantity != ledger))
+        .order_by(Product.id)
+    )
+    return [tuple(row) for row in db.session.execute(query)]
+
+
+def verify_current():
+    """Products whose quantity differs from what their last movement left (changed without a movement)"""
+    last = (
+        select(StockMovement.new_quantity)
+        .where(StockMovement.product_id == Product.id)
+        .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return [tuple(row) for row in db.session.execute(
+        select(Product.id, last, Product.quantity)
+        .where(last.isnot(None), last != Product.quantity)
+        .order_by(Product.id)
+    )]
@@ -0,0 +1,327 @@
+"""Stock-take (cycle count) sessions reconciled and applied in bulk"""
+import csv
+import hashlib
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, bindparam, case, func, insert, or_, select, update
+
+from app import db
+from app.models import (InventorySummary, MovementRollup, Product, ProductCode, StockMovement, StockTake,
+                        StockTakeLine)
+
+CODE_COLUMNS = ('code', 'barcode', 'sku', 'rfid', 'rfid_tag')
+COUNT_COLUMNS = ('counted', 'count', 'quantity', 'qty')
+
+# Variances listed on the review page (all of them are applied)
+REVIEW_ROWS = 200
+
+
+class StockTakeError(ValueError):
+    """Raised when a stock take cannot be changed or applied"""
+
+
+class Reconciliation:
+    """Set-based diff of a stock take against current product quantities"""
+
+    def __init__(self, variances, lines, counted_products, unknown_codes):
+        self.variances = variances
+        self.lines = lines
+        self.counted_products = counted_products
+        self.unknown_codes = unknown_codes
+
+    @property
+    def units_variance(self):
+        return sum(row.counted - row.expected for row in self.variances)
+
+    @property
+    def value_variance(self):
+        return sum(((row.unit_price or Decimal('0')) * (row.counted - row.expected) for row in self.variances),
+                   Decimal('0'))
+
+    def largest(self, limit):
+        """The ``limit`` variances with the largest value difference"""
+        return sorted(self.variances, key=lambda row: abs((row.unit_price or 0) * (row.counted - row.expected)),
+                      reverse=True)[:limit]
+
+    @property
+    def fingerprint(self):
+        """Digest of the variances, so an apply can detect stock that moved after review"""
+        digest = hashlib.sha256()
+        for row in self.variances:
+            digest.update(f'{row.product_id}:{row.expected}:{row.counted};'.encode())
+        return digest.hexdigest()[:16]
+
+
+def add_count_lines(stock_take, items, user_id=None, chunk_size=5000):
+    """
+    Stage counted codes with chunked bulk inserts
+
+    The new lines are then resolved to products with one statement; codes
+    still unknown are resolved again on every later count and at apply.
+
+    Args:
+        stock_take: Open StockTake
+        items: Iterable of (code, counted) pairs
+        user_id: User who counted
+
+    Returns:
+        Number of lines added
+    """
+    _require_open(stock_take)
+    now = datetime.utcnow()
+    rows = []
+    added = 0
+    for code, counted in items:
+        rows.append({'stock_take_id': stock_take.id, 'code': code, 'counted': counted,
+                     'user_id': user_id, 'created_at': now})
+        if len(rows) >= chunk_size:
+            db.session.execute(insert(StockTakeLine), rows)
+            added += len(rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(StockTakeLine), rows)
+        added += len(rows)
+    _resolve_codes(stock_take)
+    return added
+
+
+def read_count_csv(stream, errors):
+    """
+    Yield (code, counted) pairs from a CSV of counts
+
+    The header needs a code column (code, barcode, sku or rfid) and may have a
+    count column (counted, count, quantity or qty); without one every row
+    counts one unit, as if each line were a scan. Invalid rows are appended
+    to ``errors`` as (line, message) and skipped.
+    """
+    reader = csv.reader(stream)
+    header = [name.strip().lower() for name in next(reader, [])]
+    code_index = next((header.index(name) for name in CODE_COLUMNS if name in header), None)
+    count_index = next((header.index(name) for name in COUNT_COLUMNS if name in header), None)
+    if code_index is None:
+        raise StockTakeError(f'The file needs a code column ({", ".join(CODE_COLUMNS)})')
+
+    for row in reader:
+        code = row[code_index].strip() if len(row) > code_index else ''
+        if not code:
+            continue
+        if len(code) > 100:
+            errors.append((reader.line_num, 'Code is longer than 100 characters'))
+            continue
+        counted = 1
+        if count_index is not None:
+            try:
+                counted = int(row[count_index].strip() if len(row) > count_index else '')
+                if counted < 0:
+                    raise ValueError
+            except ValueError:
+                errors.append((reader.line_num, f'{code}: count must be a whole number of at least 0'))
+                continue
+        yield code, counted
+
+
+def reconcile(stock_take):
+    """
+    Diff the counts against Product.quantity without writing anything
+
+    Lines for the same product are summed. While the stock take is open,
+    lines whose code was unknown when counted are matched against the
+    current product codes on the fly. When the stock take has a location,
+    products stored there that were not counted at all are reconciled as
+    counted zero.
+
+    Args:
+        stock_take: StockTake
+
+    Returns:
+        Reconciliation
+    """
+    lines = _resolved_lines(stock_take)
+    counted = (
+        select(lines.c.product_id, func.sum(lines.c.counted).label('counted'))
+        .where(lines.c.product_id.isnot(None))
+        .group_by(lines.c.product_id)
+        .subquery()
+    )
+    counted_qty = func.coalesce(counted.c.counted, 0)
+    query = db.session.query(
+        Product.id.label('product_id'), Product.sku, Product.name, Product.location, Product.category_id,
+        Product.unit_price, Product.min_stock_level, Product.quantity.label('expected'),
+        counted_qty.label('counted'),
+    )
+    if stock_take.location:
+        query = query.outerjoin(counted, counted.c.product_id == Product.id).filter(or_(
+            counted.c.product_id.isnot(None), Product.location.startswith(stock_take.location, autoescape=True)
+        ))
+    else:
+        query = query.join(counted, counted.c.product_id == Product.id)
+
+    variances = query.filter(counted_qty != Product.quantity).order_by(Product.id).all()
+
+    totals = db.session.query(func.count(), func.count(func.distinct(lines.c.product_id))).select_from(lines).one()
+    unknown = (
+        db.session.query(lines.c.code, func.sum(lines.c.counted))
+        .filter(lines.c.product_id.is_(None))
+        .group_by(lines.c.code)
+        .order_by(lines.c.code)
+        .all()
+    )
+    return Reconciliation(variances, totals[0], totals[1], unknown)
+
+
+def apply_stock_take(stock_take, user_id, fingerprint=None, audit=None):
+    """
+    Apply every variance as an adjustment movement in one transaction
+
+    The session is claimed with a conditional UPDATE first, which also takes
+    SQLite's write lock, so no other stock movement can land between the
+    diff and the writes. Quantities are then set with one executemany
+    UPDATE and the movements inserted in bulk, all referencing the session.
+
+    Args:
+        stock_take: Open StockTake
+        user_id: User applying the count
+        fingerprint: Reconciliation.fingerprint seen at review; if stock
+            moved since, nothing is applied
+        audit: Optional callable(details) run inside the transaction
+
+    Returns:
+        Reconciliation that was applied
+
+    Raises:
+        StockTakeError: If the session is not open or stock changed since review
+    """
+    now = datetime.utcnow()
+    try:
+        claimed = db.session.execute(
+            update(StockTake)
+            .where(StockTake.id == stock_take.id, StockTake.status == 'open')
+            .values(status='applied', applied_by=user_id, applied_at=now),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not claimed:
+            raise StockTakeError('This stock take is no longer open')
+
+        # Persist the code matches the review saw; reconcile() then reads them back
+        _resolve_codes(stock_take)
+        result = reconcile(stock_take)
+        if fingerprint and fingerprint != result.fingerprint:
+            raise StockTakeError('Stock changed since the variances were reviewed. Please review them again.')
+
+        if result.variances:
+            table = Product.__table__
+            changed = db.session.execute(
+                table.update()
+                .where(and_(table.c.id == bindparam('product_id'), table.c.quantity == bindparam('expected')))
+                .values(quantity=bindparam('counted'), updated_at=now),
+                [{'product_id': row.product_id, 'expected': row.expected, 'counted': row.counted}
+                 for row in result.variances]
+            ).rowcount
+            if changed != len(result.variances):
+                raise StockTakeError('Stock changed while applying. Please review the variances again.')
+
+            notes = f'Stock take: {stock_take.name}'
+            movements = [
+                {'product_id': row.product_id, 'user_id': user_id, 'movement_type': 'adjustment',
+                 'quantity': row.counted - row.expected, 'previous_quantity': row.expected,
+                 'new_quantity': row.counted, 'notes': notes, 'reference': stock_take.reference,
+                 'stock_take_id': stock_take.id, 'created_at': now}
+                for row in result.variances
+            ]
+            db.session.execute(insert(StockMovement), movements)
+            MovementRollup.apply_movements(db.session.connection(), movements)
+            _apply_summary_deltas(result.variances)
+
+        if audit is not None:
+            audit({'stock_take': stock_take.id, 'adjusted': len(result.variances),
+                   'units_variance': result.units_variance, 'value_variance': str(result.value_variance),
+                   'lines': result.lines})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    db.session.refresh(stock_take)
+    return result
+
+
+def cancel_stock_take(stock_take):
+    """Discard an open stock take and its staged lines"""
+    _require_open(stock_take)
+    db.session.execute(
+        StockTakeLine.__table__.delete().where(StockTakeLine.stock_take_id == stock_take.id)
+    )
+    stock_take.status = 'cancelled'
+
+
+def _require_open(stock_take):
+    if stock_take.status != 'open':
+        raise StockTakeError('This stock take is no longer open')
+
+
+def _resolved_lines(stock_take):
+    """
+    Subquery of the session's lines as (code, product_id, counted)
+
+    Unresolved lines of an open session take the product and pack quantity
+    of their code as it is now, exactly as _resolve_codes() would store them.
+    """
+    query = (
+        select(StockTakeLine.code, StockTakeLine.product_id, StockTakeLine.counted)
+        .where(StockTakeLine.stock_take_id == stock_take.id)
+    )
+    if stock_take.status == 'open':
+        unresolved = StockTakeLine.product_id.is_(None)
+        query = (
+            select(
+                StockTakeLine.code,
+                func.coalesce(StockTakeLine.product_id, ProductCode.product_id).label('product_id'),
+                case((unresolved, StockTakeLine.counted * func.coalesce(ProductCode.units, 1)),
+                     else_=StockTakeLine.counted).label('counted'),
+            )
+            .outerjoin(ProductCode, and_(unresolved, ProductCode.code == StockTakeLine.code))
+            .where(StockTakeLine.stock_take_id == stock_take.id)
+        )
+    return query.subquery()
+
+
+def _resolve_codes(stock_take):
+    """
+    Fill in product_id for every unresolved line with one correlated UPDATE
+
+    Counts of case and pallet barcodes are converted to units at the same
+    time, so each line is multiplied by its pack quantity exactly once.
+    """
+    product_for_code = (
+        select(ProductCode.product_id)
+        .where(ProductCode.code == StockTakeLine.code)
+        .scalar_subquery()
+    )
+    units_for_code = (
+        select(ProductCode.units)
+        .where(ProductCode.code == StockTakeLine.code)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(StockTakeLine)
+        .where(StockTakeLine.stock_take_id == stock_take.id, StockTakeLine.product_id.is_(None))
+        .values(product_id=product_for_code,
+                counted=StockTakeLine.counted * func.coalesce(units_for_code, 1)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def _apply_summary_deltas(variances):
+    """Move the inventory summary by the adjusted quantities, one update per category"""
+    deltas = {}
+    for row in variances:
+        before = InventorySummary.contribution(row.expected, row.unit_price, row.min_stock_level)
+        after = InventorySummary.contribution(row.counted, row.unit_price, row.min_stock_level)
+        value, units, low_stock = deltas.get(row.category_id, (Decimal('0'), 0, 0))
+        deltas[row.category_id] = (value + after[0] - before[0], units + after[1] - before[1],
+                                   low_stock + after[3] - before[3])
+
+    connection = db.session.connection()
+    for category_id, (value, units, low_stock) in deltas.items():
+        InventorySummary.apply_delta(connection, category_id, value=value, units=units, low_stock=low_stock)
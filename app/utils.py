@@ -4,49 +4,69 @@ from datetime import datetime
 from flask import request, session
 from flask_login import current_user
 from app import db
-from app.models import AuditLog, StockMovement
-import barcode
-from barcode.writer import ImageWriter
-from io import BytesIO
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models import (StockMovement, Product, ProductCode, InventorySummary, Category, MovementRollup,
+                        ProductForecast)
+from app.audit import audit_sink
+from app.scan_cache import scan_cache
+from app.barcodes import barcode_cache
 import base64
 
 
-def log_audit(action, resource_type=None, resource_id=None, details=None):
+def log_audit(action, resource_type=None, resource_id=None, details=None, commit=True):
     """
     Create an audit log entry
 
+    How the entry is written depends on AUDIT_LOG_MODE (see app.audit).
+
     Args:
         action: Action performed (login, logout, create, update, delete)
         resource_type: Type of resource affected (user, product, category)
         resource_id: ID of the resource
         details: Additional details as dict or string
+        commit: Pass False to always join the caller's transaction
     """
     try:
         # Convert details to JSON if it's a dict
         if isinstance(details, dict):
             details = json.dumps(details)
 
-        audit_entry = AuditLog(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            details=details,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')[:255]
-        )
-        db.session.add(audit_entry)
-        db.session.commit()
+        audit_sink.write({
+            'user_id': current_user.id if current_user.is_authenticated else None,
+            'action': action,
+            'resource_type': resource_type,
+            'resource_id': resource_id,
+            'details': details,
+            'ip_address': request.remote_addr,
+            'user_agent': request.headers.get('User-Agent', '')[:255],
+            'created_at': datetime.utcnow()
+        }, commit=commit)
     except Exception as e:
         # Don't let audit logging break the application
         print(f"Error logging audit: {str(e)}")
-        db.session.rollback()
+        if commit and audit_sink.mode == 'sync':
+            db.session.rollback()
+
+
+class InsufficientStockError(ValueError):
+    """Raised when a stock out would take a product below zero"""
+
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        super().__init__(f'Insufficient stock. Available: {available}')
 
 
 def record_stock_movement(product, movement_type, quantity, notes=None, reference=None):
     """
     Record a stock movement
 
+    The product quantity is changed with a single conditional
+    ``UPDATE ... RETURNING`` so concurrent workers can never lose an update
+    or oversell. The movement row is built from the value the database
+    returns rather than from the quantity loaded into Python.
+
     Args:
         product: Product instance
         movement_type: 'in', 'out', or 'adjustment'
@@ -56,43 +76,228 @@ def record_stock_movement(product, movement_type, quantity, notes=None, referenc
 
     Returns:
         StockMovement instance
+
+    Raises:
+        InsufficientStockError: If a stock out exceeds the available quantity
     """
-    previous_quantity = product.quantity
+    now = datetime.utcnow()
+    stmt = update(Product).where(Product.id == product.id)
 
-    # Calculate new quantity based on movement type
     if movement_type == 'in':
-        new_quantity = previous_quantity + abs(quantity)
+        stmt = stmt.values(quantity=Product.quantity + abs(quantity), updated_at=now)
     elif movement_type == 'out':
-        new_quantity = max(0, previous_quantity - abs(quantity))
+        stmt = stmt.where(Product.quantity >= abs(quantity)).values(
+            quantity=Product.quantity - abs(quantity), updated_at=now
+        )
     elif movement_type == 'adjustment':
-        new_quantity = quantity
+        return _record_stock_adjustment(product, quantity, notes, reference, now)
     else:
         raise ValueError(f"Invalid movement type: {movement_type}")
 
-    # Create stock movement record
+    new_quantity = db.session.execute(
+        stmt.returning(Product.quantity),
+        execution_options={'synchronize_session': False}
+    ).scalar()
+
+    if new_quantity is None:
+        available = db.session.query(Product.quantity).filter_by(id=product.id).scalar()
+        set_committed_value(product, 'quantity', available)
+        raise InsufficientStockError(product, available)
+
+    if movement_type == 'in':
+        previous_quantity = new_quantity - abs(quantity)
+    else:
+        previous_quantity = new_quantity + abs(quantity)
+
+    return _add_stock_movement(product, movement_type, abs(quantity), previous_quantity,
+                               new_quantity, notes, reference, now)
+
+
+def _record_stock_adjustment(product, quantity, notes, reference, now, max_attempts=5):
+    """Set an absolute quantity with a compare-and-set update"""
+    for _ in range(max_attempts):
+        previous_quantity = db.session.query(Product.quantity).filter_by(id=product.id).scalar()
+        updated = db.session.execute(
+            update(Product)
+            .where(Product.id == product.id, Product.quantity == previous_quantity)
+            .values(quantity=quantity, updated_at=now)
+            .returning(Product.quantity),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        if updated is not None:
+            return _add_stock_movement(product, 'adjustment', quantity - previous_quantity,
+                                       previous_quantity, quantity, notes, reference, now)
+
+    raise RuntimeError(f'Stock for product {product.id} changed concurrently, please retry')
+
+
+def _add_stock_movement(product, movement_type, quantity, previous_quantity, new_quantity,
+                        notes, reference, now):
+    """Reflect the new quantity on the instance, update the summary and stage the movement row"""
+    set_committed_value(product, 'quantity', new_quantity)
+    set_committed_value(product, 'updated_at', now)
+
+    # The Core UPDATE bypasses the Product mapper events, so apply the summary delta here
+    before = InventorySummary.contribution(previous_quantity, product.unit_price, product.min_stock_level)
+    after = InventorySummary.contribution(new_quantity, product.unit_price, product.min_stock_level)
+    InventorySummary.apply_delta(
+        db.session.connection(), product.category_id,
+        value=after[0] - before[0],
+        units=after[1] - before[1],
+        low_stock=after[3] - before[3]
+    )
+
     movement = StockMovement(
         product_id=product.id,
         user_id=current_user.id,
         movement_type=movement_type,
-        quantity=abs(quantity) if movement_type != 'adjustment' else quantity - previous_quantity,
+        quantity=quantity,
         previous_quantity=previous_quantity,
         new_quantity=new_quantity,
         notes=notes,
-        reference=reference
+        reference=reference,
+        created_at=now
     )
-
-    # Update product quantity
-    product.quantity = new_quantity
-    product.updated_at = datetime.utcnow()
-
     db.session.add(movement)
 
+    MovementRollup.apply_movements(db.session.connection(), [{
+        'product_id': product.id, 'movement_type': movement_type, 'quantity': quantity, 'created_at': now
+    }])
+
     return movement
 
 
+def find_product_by_code(code):
+    """
+    Resolve a scanned barcode, RFID tag or SKU to a product
+
+    Args:
+        code: The scanned code
+
+    Returns:
+        Product instance or None
+    """
+    return resolve_code(code)[0]
+
+
+def resolve_code(code):
+    """
+    Resolve a scanned code to a product and the units one scan of it stands for
+
+    Codes are resolved with a single point query on the unique
+    product_code index. Resolved codes are kept in the in-process scan cache so repeated scans
+    of the same code only cost a primary key lookup.
+
+    Args:
+        code: The scanned code
+
+    Returns:
+        Tuple of (Product instance or None, units per scan); a case or
+        pallet barcode moves its pack quantity per scan
+    """
+    cached = scan_cache.get(code)
+    if cached is not None:
+        product_id, units = cached
+        product = db.session.get(Product, product_id)
+        if product is not None:
+            return product, units
+
+    row = db.session.query(Product, ProductCode.units).join(
+        ProductCode, ProductCode.product_id == Product.id
+    ).filter(ProductCode.code == code).first()
+
+    if row is None:
+        return None, 1
+
+    product, units = row
+    scan_cache.set(code, (product.id, units))
+    return product, units
+
+
+def find_products_by_codes(codes, chunk_size=500):
+    """
+    Resolve many scanned codes to products with set-based queries
+
+    Args:
+        codes: Iterable of scanned codes
+        chunk_size: Maximum number of codes per IN clause
+
+    Returns:
+        Dict mapping each resolved code to a (Product instance, units per scan) tuple
+    """
+    codes = list(dict.fromkeys(codes))
+    resolved = {}
+
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size]
+        rows = db.session.query(ProductCode.code, ProductCode.units, Product).join(
+            Product, ProductCode.product_id == Product.id
+        ).filter(ProductCode.code.in_(chunk))
+
+        for code, units, product in rows:
+            resolved[code] = (product, units)
+            scan_cache.set(code, (product.id, units))
+
+    return resolved
+
+
+def code_in_use(code, exclude_product_id=None):
+    """
+    Check whether a code is already assigned to a product
+
+    Args:
+        code: The code to check
+        exclude_product_id: Product whose own SKU, barcode and RFID tag should
+            be ignored (its packaging codes still count as in use)
+
+    Returns:
+        True if the code cannot be given to the product
+    """
+    query = ProductCode.query.filter_by(code=code)
+    if exclude_product_id is not None:
+        query = query.filter(db.or_(ProductCode.product_id != exclude_product_id,
+                                    ProductCode.kind.notin_(ProductCode.PRIMARY_KINDS.values())))
+    return db.session.query(query.exists()).scalar()
+
+
+def sync_product_codes(product):
+    """
+    Mirror a product's SKU, barcode and RFID tag into the product_code table
+
+    One row is kept per distinct code (see ProductCode.primary_codes). Rows
+    whose code is still wanted are kept, the others are reused for the new
+    codes, so no statement ever collides with the unique code index. Extra
+    packaging codes (each, case, pallet) are left untouched.
+
+    Args:
+        product: Product instance (pending or persistent)
+    """
+    wanted = ProductCode.primary_codes({field: getattr(product, field) for field in ProductCode.PRIMARY_KINDS})
+
+    spare = []
+    if product.id is not None:
+        for row in product.codes.filter(ProductCode.kind.in_(ProductCode.PRIMARY_KINDS.values())):
+            kind = wanted.pop(row.code, None)
+            if kind is None:
+                spare.append(row)
+            elif row.kind != kind:
+                row.kind = kind
+
+    for code, kind in wanted.items():
+        if spare:
+            row = spare.pop()
+            row.code, row.kind = code, kind
+        else:
+            db.session.add(ProductCode(code=code, kind=kind, product=product))
+    for row in spare:
+        db.session.delete(row)
+
+
 def generate_barcode(code, barcode_type='code128'):
     """
-    Generate a barcode image
+    Generate a barcode image as a data URI
+
+    Prefer linking to inventory.barcode_image, which the browser can cache.
 
     Args:
         code: The code to encode
@@ -102,17 +307,8 @@ def generate_barcode(code, barcode_type='code128'):
         Base64 encoded image string
     """
     try:
-        # Get the barcode class
-        barcode_class = barcode.get_barcode_class(barcode_type)
-
-        # Generate barcode
-        rv = BytesIO()
-        barcode_instance = barcode_class(code, writer=ImageWriter())
-        barcode_instance.write(rv)
-
-        # Convert to base64
-        rv.seek(0)
-        barcode_base64 = base64.b64encode(rv.getvalue()).decode('utf-8')
+        data, _ = barcode_cache.get(code, barcode_type, 'png')
+        barcode_base64 = base64.b64encode(data).decode('utf-8')
 
         return f"data:image/png;base64,{barcode_base64}"
 
@@ -167,16 +363,134 @@ def paginate_query(query, page=1, per_page=20):
     )
 
 
-def get_low_stock_products():
-    """Get all products that are at or below minimum stock level"""
-    from app.models import Product
-    return Product.query.filter(
+def get_low_stock_products(limit=None):
+    """Get products that are at or below minimum stock level"""
+    query = Product.query.filter(
         Product.quantity <= Product.min_stock_level
-    ).all()
+    ).order_by(Product.quantity)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def reorder_suggestions_query():
+    """Products at or below their forecast reorder point, those running out soonest first"""
+    return db.session.query(Product, ProductForecast).join(
+        ProductForecast, ProductForecast.product_id == Product.id
+    ).filter(
+        ProductForecast.velocity > 0,
+        Product.quantity <= ProductForecast.reorder_point
+    ).order_by(Product.quantity / ProductForecast.velocity, Product.id)
+
+
+def get_reorder_suggestions(limit=None):
+    """
+    Get products to reorder according to their consumption forecast
+
+    Returns:
+        List of (Product, ProductForecast)
+    """
+    query = reorder_suggestions_query()
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
 def calculate_inventory_value():
     """Calculate total inventory value"""
-    from app.models import Product
-    products = Product.query.all()
-    return sum(product.total_value for product in products)
+    value = db.session.query(
+        db.func.coalesce(db.func.sum(Product.quantity * Product.unit_price), 0)
+    ).scalar()
+    return float(value)
+
+
+def rebuild_inventory_summary():
+    """
+    Recompute the inventory summary table from the product table
+
+    Returns:
+        Number of summary rows written
+    """
+    low_stock = db.case((Product.quantity <= Product.min_stock_level, 1), else_=0)
+    rows = db.session.query(
+        Product.category_id,
+        db.func.coalesce(db.func.sum(Product.quantity * Product.unit_price), 0),
+        db.func.coalesce(db.func.sum(Product.quantity), 0),
+        db.func.count(Product.id),
+        db.func.coalesce(db.func.sum(low_stock), 0)
+    ).group_by(Product.category_id).all()
+
+    now = datetime.utcnow()
+    summaries = {
+        category_id: InventorySummary(category_key=category_id, updated_at=now)
+        for (category_id,) in db.session.query(Category.id)
+    }
+    summaries[InventorySummary.UNCATEGORIZED_KEY] = InventorySummary(
+        category_key=InventorySummary.UNCATEGORIZED_KEY, updated_at=now)
+    total = InventorySummary(category_key=InventorySummary.TOTAL_KEY, updated_at=now)
+
+    for summary in [total, *summaries.values()]:
+        summary.total_value = 0
+        summary.total_units = 0
+        summary.product_count = 0
+        summary.low_stock_count = 0
+
+    for category_id, value, units, count, low in rows:
+        key = category_id or InventorySummary.UNCATEGORIZED_KEY
+        summary = summaries.setdefault(key, InventorySummary(
+            category_key=key, total_value=0, total_units=0, product_count=0,
+            low_stock_count=0, updated_at=now))
+        for target in (summary, total):
+            target.total_value += value
+            target.total_units += units
+            target.product_count += count
+            target.low_stock_count += low
+
+    InventorySummary.query.delete()
+    db.session.add(total)
+    db.session.add_all(summaries.values())
+    db.session.commit()
+
+    return len(summaries) + 1
+
+
+def rebuild_movement_rollups():
+    """
+    Recompute the daily movement rollups from the stock movement table
+
+    Returns:
+        Number of rollup rows written
+    """
+    movements = StockMovement.__table__.c
+    day = db.func.date(movements.created_at)
+
+    def quantity_of(movement_type):
+        return db.func.coalesce(db.func.sum(
+            db.case((movements.movement_type == movement_type, movements.quantity), else_=0)), 0)
+
+    MovementRollup.query.delete()
+    result = db.session.execute(MovementRollup.__table__.insert().from_select(
+        ['product_id', 'day', 'units_in', 'units_out', 'adjusted', 'movement_count'],
+        db.select(movements.product_id, day, quantity_of('in'), quantity_of('out'),
+                  quantity_of('adjustment'), db.func.count(movements.id))
+        .where(movements.created_at.isnot(None))
+        .group_by(movements.product_id, day)
+    ))
+    db.session.commit()
+
+    return result.rowcount
+
+
+def get_inventory_summary():
+    """
+    Get the overall inventory summary, building the table on first use
+
+    Returns:
+        Tuple of (overall InventorySummary, list of per-category InventorySummary)
+    """
+    summaries = InventorySummary.query.order_by(InventorySummary.category_key).all()
+    if not summaries or summaries[0].category_key != InventorySummary.TOTAL_KEY:
+        rebuild_inventory_summary()
+        summaries = InventorySummary.query.order_by(InventorySummary.category_key).all()
+
+    return summaries[0], summaries[1:]
@@ -6,6 +6,31 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# SQLite pragma profiles, applied to every new connection (see app/database.py).
+# The busy timeout is set separately through SQLALCHEMY_ENGINE_OPTIONS.
+SQLITE_PROFILES = {
+    # SQLite defaults: rollback journal, full fsync on every commit
+    'stock': {},
+    # WAL lets readers run alongside the single writer; NORMAL only fsyncs at checkpoints
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,       # 256 MB memory-mapped reads
+        'cache_size': -65536,         # 64 MB page cache per connection
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 1000,   # pages
+    },
+}
+
+
+def sqlite_profile(default):
+    """Pragmas for the SQLITE_PROFILE environment variable, or the given default profile"""
+    name = os.environ.get('SQLITE_PROFILE', default)
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f'Invalid SQLITE_PROFILE: {name}')
+    return SQLITE_PROFILES[name]
+
+
 class Config:
     """Base configuration"""
 
@@ -18,6 +43,23 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ims.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = sqlite_profile('wal')
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 15))  # Seconds a writer waits for the lock
+    SQLITE_CHECKPOINT_INTERVAL = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 300))  # Seconds, 0 disables
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT},
+    } if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {}
+
+    # Connection pools: a small pool dedicated to the write path, and a larger
+    # one for views marked @read_only (the SQLite file opened with mode=ro, or
+    # DATABASE_READONLY_URL for a replica)
+    DB_READONLY_ROUTING = os.environ.get('DB_READONLY_ROUTING', 'True') == 'True'
+    DATABASE_READONLY_URL = os.environ.get('DATABASE_READONLY_URL')
+    DB_WRITE_POOL_SIZE = int(os.environ.get('DB_WRITE_POOL_SIZE', 2))
+    DB_WRITE_POOL_OVERFLOW = int(os.environ.get('DB_WRITE_POOL_OVERFLOW', 2))
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 10))
+    DB_READ_POOL_OVERFLOW = int(os.environ.get('DB_READ_POOL_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
 
     # Flask-Security-Too
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT') or 'dev-password-salt'
@@ -46,6 +88,12 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(
         seconds=int(os.environ.get('PERMANENT_SESSION_LIFETIME', 1800))
     )
+    # 'sqlite' keeps session data server-side and only sends a session id
+    # cookie; 'cookie' uses Flask's signed client-side sessions
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+    SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH')  # Defaults to instance/sessions.db
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 1024))
+    SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 10))  # Seconds a worker reuses a session read
 
     # CSRF Protection
     WTF_CSRF_ENABLED = True
@@ -58,10 +106,69 @@ class Config:
 
     # Application Settings
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE', 20))
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL', 60))  # Seconds a filtered total is reused
     LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 10))
 
+    # Scanner code cache (per worker, invalidated across workers via a signal file)
+    SCAN_CACHE_ENABLED = os.environ.get('SCAN_CACHE_ENABLED', 'True') == 'True'
+    SCAN_CACHE_SIZE = int(os.environ.get('SCAN_CACHE_SIZE', 4096))
+    SCAN_CACHE_TTL = int(os.environ.get('SCAN_CACHE_TTL', 300))
+    SCAN_CACHE_SIGNAL_FILE = os.environ.get('SCAN_CACHE_SIGNAL_FILE')  # Defaults to instance/scan_cache.signal
+
+    # Logged-in user principals (per worker, invalidated across workers via a signal file)
+    USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'True') == 'True'
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_SIGNAL_FILE = os.environ.get('USER_CACHE_SIGNAL_FILE')  # Defaults to instance/user_cache.signal
+
+    # Rendered barcode images (in-memory LRU backed by an on-disk cache)
+    BARCODE_CACHE_SIZE = int(os.environ.get('BARCODE_CACHE_SIZE', 256))
+    BARCODE_CACHE_DIR = os.environ.get('BARCODE_CACHE_DIR')  # Defaults to instance/barcodes
+    BARCODE_CACHE_DISK_MB = int(os.environ.get('BARCODE_CACHE_DISK_MB', 100))  # Oldest images pruned above this
+
+    # Bulk label sheets
+    LABEL_SHEET_MAX = int(os.environ.get('LABEL_SHEET_MAX', 5000))
+    LABEL_RENDER_WORKERS = int(os.environ.get('LABEL_RENDER_WORKERS', 2))  # Render processes per app worker; 1 renders inline
+
+    # Audit log writes: 'sync' (commit per entry), 'transaction' (join the
+    # request's unit of work) or 'buffered' (batched inserts on size/time)
+    AUDIT_LOG_MODE = os.environ.get('AUDIT_LOG_MODE', 'transaction')
+    AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', 100))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 2.0))
+
+    # CSV product import (flask import-products and /inventory/import)
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+    IMPORT_MAX_UPLOAD_MB = int(os.environ.get('IMPORT_MAX_UPLOAD_MB', 50))
+    IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 200))  # Row errors shown after an upload
+
+    # Stock snapshots (flask snapshot-stock); monthly snapshots are kept indefinitely
+    SNAPSHOT_KEEP_DAILY = int(os.environ.get('SNAPSHOT_KEEP_DAILY', 35))
+
+    # Consumption forecasts and reorder points (flask compute-forecasts)
+    FORECAST_WINDOW_DAYS = int(os.environ.get('FORECAST_WINDOW_DAYS', 90))  # Days of history used
+    FORECAST_HALF_LIFE_DAYS = float(os.environ.get('FORECAST_HALF_LIFE_DAYS', 14))  # Weight of a day halves every N days
+    FORECAST_LEAD_TIME_DAYS = float(os.environ.get('FORECAST_LEAD_TIME_DAYS', 7))
+    FORECAST_SERVICE_LEVEL = float(os.environ.get('FORECAST_SERVICE_LEVEL', 0.95))  # Chance of no stockout before a reorder arrives
+
+    # Batch scan uploads
+    SCAN_BATCH_MAX_ITEMS = int(os.environ.get('SCAN_BATCH_MAX_ITEMS', 1000))
+
+    # Request profiling (Server-Timing header and JSON slow request/query log)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+    PROFILING_SLOW_REQUEST_MS = float(os.environ.get('PROFILING_SLOW_REQUEST_MS', 500))
+    PROFILING_SLOW_QUERY_MS = float(os.environ.get('PROFILING_SLOW_QUERY_MS', 100))
+    PROFILING_LOG_FILE = os.environ.get('PROFILING_LOG_FILE')  # Defaults to stderr
+
+    # Serve the fingerprinted builds from `flask build-assets` (static/dist/manifest.json)
+    ASSETS_USE_MANIFEST = os.environ.get('ASSETS_USE_MANIFEST', 'True') == 'True'
+
+    # Prometheus /metrics (samples shared between workers through PROMETHEUS_MULTIPROC_DIR)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'False') == 'True'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # When set, scrapes need "Authorization: Bearer <token>"
+    PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')  # Defaults to instance/metrics
+
     # Rate Limiting
-    RATELIMIT_ENABLED = True
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True') == 'True'
     RATELIMIT_STORAGE_URL = 'memory://'
     RATELIMIT_HEADERS_ENABLED = True
 
@@ -93,6 +200,7 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test_ims.db'
+    SQLITE_PRAGMAS = sqlite_profile('stock')
     WTF_CSRF_ENABLED = False
     SECURITY_TWO_FACTOR_REQUIRED = False
 
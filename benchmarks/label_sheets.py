@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark label-sheet rendering: serial versus process pool
+
+Renders the same set of synthetic labels in-process and through
+app.labels.render_label_pages with a ProcessPoolExecutor, and reports
+pages per second for each.
+
+Usage:
+    python benchmarks/label_sheets.py --labels 2000 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.labels import render_label_pages, stream_label_pdf, LABELS_PER_PAGE
+
+
+def run(labels, workers):
+    started = time.perf_counter()
+    pages = list(render_label_pages(labels, workers=workers))
+    rendered = time.perf_counter() - started
+    pdf_size = sum(len(chunk) for chunk in stream_label_pdf(pages))
+    total = time.perf_counter() - started
+    return len(pages), rendered, total, pdf_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--labels', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    labels = [(f'Product {i:05d}', f'SKU-{i:05d}', f'{400000000000 + i}') for i in range(args.labels)]
+    print(f'{args.labels} labels, {LABELS_PER_PAGE} per page')
+
+    results = {}
+    for name, workers in (('serial', 0), (f'pool x{args.workers}', args.workers)):
+        pages, rendered, total, pdf_size = run(labels, workers)
+        results[name] = rendered
+        print(f'{name:<12} {pages} pages  render {rendered:6.2f}s ({pages / rendered:6.1f} pages/s)  '
+              f'with PDF {total:6.2f}s  {pdf_size / 1024 / 1024:.1f} MB')
+
+    serial, pooled = results.values()
+    print(f'Speed-up: {serial / pooled:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
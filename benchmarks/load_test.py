@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Closed-loop HTTP load benchmark against gunicorn
+
+Starts gunicorn (gunicorn.conf.py, with the worker count and bind
+overridden) on the configured database, or targets a running server with
+--url, logs each virtual user in, then drives a weighted mix of scanner
+API scans, dashboard views, product searches and product listings for a
+fixed duration. Latency percentiles (p50/p95/p99) and throughput per
+scenario are printed and written to a JSON file; pass --baseline with an
+earlier result to see the change between releases.
+
+Rate limits would throttle the scanner API, so the launched server runs
+with RATELIMIT_ENABLED=False; disable them on a --url target as well.
+
+Usage:
+    flask seed-bench --products 10000 --movements 100000
+    python benchmarks/load_test.py --workers 4 --concurrency 16 --duration 60
+    python benchmarks/load_test.py --output new.json --baseline old.json
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scenario name -> default weight in the request mix
+DEFAULT_MIX = {
+    'scan_lookup': 40,
+    'scan_stock_in': 10,
+    'scan_stock_out': 10,
+    'dashboard': 10,
+    'search': 15,
+    'listing': 15,
+}
+
+# Statuses that are a correct answer rather than a failure (insufficient stock)
+EXPECTED_STATUS = {'scan_stock_out': (200, 400)}
+
+
+class _CookiePolicy(http.cookiejar.DefaultCookiePolicy):
+    """Send Secure session cookies to a local plain-HTTP server"""
+
+    def return_ok_secure(self, cookie, request):
+        return True
+
+
+class Client:
+    """One virtual user: its own cookie jar and logged-in session"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        jar = http.cookiejar.CookieJar(policy=_CookiePolicy())
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+
+    def request(self, path, data=None, json_body=None):
+        """Return (status, body) without raising on HTTP errors"""
+        headers = {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            data = urllib.parse.urlencode(data).encode()
+
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def login(self, username, password):
+        status, body = self.request('/auth/login', data={'username': username, 'password': password})
+        if status != 200 or b'name="password"' in body:
+            raise RuntimeError(f'Login failed for {username} (status {status})')
+
+
+class Workload:
+    """Codes, search terms and categories the scenarios pick from"""
+
+    def __init__(self, client, sample_size=500):
+        status, body = client.request(f'/inventory/api/products?per_page={sample_size}')
+        if status != 200:
+            raise RuntimeError(f'Could not load products (status {status}); is the database seeded?')
+
+        products = json.loads(body)['products']
+        if not products:
+            raise RuntimeError('No products found; run `flask seed-bench` first')
+
+        self.codes = [code for p in products for code in (p['sku'], p['barcode']) if code]
+        self.terms = sorted({word for p in products for word in p['name'].split() if len(word) >= 3})
+        self.categories = sorted({p['category_id'] for p in products if p['category_id']})
+
+    def run(self, scenario, client, rng):
+        if scenario == 'scan_lookup':
+            return client.request('/scanner/api/scan', json_body={'code': rng.choice(self.codes), 'action': 'lookup'})
+        if scenario in ('scan_stock_in', 'scan_stock_out'):
+            action = scenario[len('scan_'):]
+            return client.request('/scanner/api/scan', json_body={
+                'code': rng.choice(self.codes), 'action': action, 'quantity': 1
+            })
+        if scenario == 'dashboard':
+            return client.request('/dashboard')
+        if scenario == 'search':
+            return client.request('/inventory/api/search?' + urllib.parse.urlencode({'q': rng.choice(self.terms)}))
+        if scenario == 'listing':
+            params = rng.choice([
+                {},
+                {'category': rng.choice(self.categories)} if self.categories else {},
+                {'search': rng.choice(self.terms)},
+                {'low_stock': 1},
+            ])
+            return client.request('/inventory/products?' + urllib.parse.urlencode(params))
+        raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def virtual_user(base_url, args, workload, mix, deadline, measure_from, results, errors, seed):
+    rng = random.Random(seed)
+    client = Client(base_url, args.timeout)
+    try:
+        client.login(args.username, args.password)
+    except Exception as e:
+        errors.append(str(e))
+        return
+
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    samples = {name: [] for name in scenarios}
+    failures = {name: {} for name in scenarios}
+
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        scenario = rng.choices(scenarios, weights=weights)[0]
+        try:
+            status, _ = workload.run(scenario, client, rng)
+        except (OSError, socket.timeout) as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - now
+
+        if now < measure_from:
+            continue
+        if status in EXPECTED_STATUS.get(scenario, (200,)):
+            samples[scenario].append(elapsed)
+        else:
+            failures[scenario][str(status)] = failures[scenario].get(str(status), 0) + 1
+
+    results.append((samples, failures))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, failures, duration):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': sum(failures.values()),
+        'error_statuses': failures,
+        'throughput_rps': round(len(latencies) / duration, 2),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+
+def start_gunicorn(args):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    env = dict(os.environ, FLASK_ENV=args.config, RATELIMIT_ENABLED='False', PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp())
+    log = tempfile.NamedTemporaryFile(prefix='load-test-gunicorn-', suffix='.log', delete=False)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}', 'run:app'],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.monotonic()
+    while time.monotonic() - started < 60:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}; see {log.name}')
+        try:
+            urllib.request.urlopen(base_url + '/auth/login', timeout=2).read()
+            return process, base_url, log.name
+        except OSError:
+            time.sleep(0.25)
+
+    process.terminate()
+    raise RuntimeError(f'gunicorn did not start within 60s; see {log.name}')
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    if value:
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name not in DEFAULT_MIX:
+                raise argparse.ArgumentTypeError(f'Unknown scenario {name!r}; choose from {", ".join(DEFAULT_MIX)}')
+            mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    rows = [('total', report['total'])] + sorted(report['scenarios'].items())
+    print(f"{'scenario':<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in rows:
+        line = (f"{name:<16}{stats['throughput_rps']:>10.1f}{_fmt(stats['p50_ms'])}"
+                f"{_fmt(stats['p95_ms'])}{_fmt(stats['p99_ms'])}{stats['errors']:>8}")
+        previous = (baseline or {}).get('total') if name == 'total' else (baseline or {}).get('scenarios', {}).get(name)
+        if previous and previous.get('p95_ms') and stats['p95_ms'] and previous['throughput_rps']:
+            line += (f"   p95 {(stats['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}%"
+                     f"  req/s {(stats['throughput_rps'] / previous['throughput_rps'] - 1) * 100:+.1f}%")
+        print(line)
+
+
+def _fmt(value):
+    return f'{value:>10.1f}' if value is not None else f"{'-':>10}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Benchmark a running server instead of starting gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers to start')
+    parser.add_argument('--config', default='production', help='FLASK_ENV for the started server')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds before measuring starts')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(None),
+                        help='Scenario weights, e.g. scan_lookup=50,search=50 (default: %(default)s)')
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='load_test_results.json', help='JSON results file')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    process = None
+    log_path = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url, log_path = start_gunicorn(args)
+        print(f'gunicorn: {args.workers} workers at {base_url} (log: {log_path})')
+
+    try:
+        setup = Client(base_url, args.timeout)
+        setup.login(args.username, args.password)
+        workload = Workload(setup)
+
+        results = []
+        errors = []
+        measure_from = time.perf_counter() + args.warmup
+        deadline = measure_from + args.duration
+        threads = [
+            threading.Thread(target=virtual_user, args=(base_url, args, workload, args.mix, deadline,
+                                                        measure_from, results, errors, args.seed + i))
+            for i in range(args.concurrency)
+        ]
+        print(f'{args.concurrency} virtual users, {args.warmup:g}s warm-up, {args.duration:g}s measured...')
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if errors:
+        print(f'{len(errors)} virtual users failed to start: {errors[0]}')
+    if not results:
+        sys.exit(1)
+
+    scenarios = {}
+    everything = []
+    all_failures = {}
+    for name in args.mix:
+        latencies = [value for samples, _ in results for value in samples[name]]
+        failures = {}
+        for _, failed in results:
+            for status, count in failed[name].items():
+                failures[status] = failures.get(status, 0) + count
+                all_failures[status] = all_failures.get(status, 0) + count
+        scenarios[name] = summarize(latencies, failures, args.duration)
+        everything.extend(latencies)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'url': args.url,
+            'workers': None if args.url else args.workers,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'mix': args.mix,
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'total': summarize(everything, all_failures, args.duration),
+        'scenarios': scenarios,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
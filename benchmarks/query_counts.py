@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Query-count regression check for the main views
+
+Seeds a throwaway SQLite database, requests each view as an admin and
+fails if a view issues more SQL statements than its budget. Budgets do
+not depend on the number of rows, so an N+1 regression shows up as soon
+as a page lists more than a handful of items.
+
+Usage:
+    python benchmarks/query_counts.py [--verbose]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+# Maximum statements per view, independent of how many rows are listed
+QUERY_BUDGETS = {
+    '/dashboard': 8,
+    '/inventory/products': 6,
+    '/inventory/products?search=widget': 6,
+    '/inventory/product/1': 6,
+    '/inventory/categories': 4,
+    '/auth/users': 5,
+}
+
+
+@contextmanager
+def count_queries(*engines):
+    """Collect every SQL statement executed on any of ``engines`` inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def assert_max_queries(client, engines, url, budget):
+    """Request ``url`` and raise AssertionError if it exceeds ``budget`` statements"""
+    with count_queries(*engines) as statements:
+        response = client.get(url)
+
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    assert len(statements) <= budget, (
+        f'{url} ran {len(statements)} queries (budget {budget}):\n  ' + '\n  '.join(statements)
+    )
+    return statements
+
+
+def seed(db, products=60, movements=40):
+    from app.models import User, Role, Category, Product, StockMovement
+
+    admin = Role(name='Admin')
+    users = [
+        User(username=f'user{i}', email=f'user{i}@ims.local', password='x',
+             fs_uniquifier=str(uuid.uuid4()), roles=[admin])
+        for i in range(5)
+    ]
+    categories = [Category(name_en=f'Category {i}', name_bg=f'Категория {i}') for i in range(8)]
+    db.session.add_all(users + categories)
+    db.session.flush()
+
+    for i in range(products):
+        db.session.add(Product(name=f'Widget {i:03d}', sku=f'W-{i:03d}', quantity=i % 15,
+                               unit_price=1.5, category_id=categories[i % len(categories)].id))
+    db.session.flush()
+
+    for i in range(movements):
+        db.session.add(StockMovement(product_id=i % 3 + 1, user_id=users[i % len(users)].id,
+                                     movement_type='in', quantity=1, previous_quantity=i,
+                                     new_quantity=i + 1))
+    db.session.commit()
+    return users[0].fs_uniquifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help='Print the statements of every view')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'query_counts.db')
+    from app import create_app, db
+
+    app = create_app('development')
+    app.config['RATELIMIT_ENABLED'] = False
+
+    with app.app_context():
+        db.create_all()
+        uniquifier = seed(db)
+        # Read-only views run on the 'readonly' bind, so count every engine
+        engines = list(db.engines.values())
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = uniquifier
+        session['_fresh'] = True
+
+    failures = 0
+    for url, budget in QUERY_BUDGETS.items():
+        client.get(url)  # Warm up lazily built tables and caches
+        try:
+            statements = assert_max_queries(client, engines, url, budget)
+            print(f'ok    {url}: {len(statements)} queries (budget {budget})')
+            if args.verbose:
+                print('  ' + '\n  '.join(statements))
+        except AssertionError as e:
+            failures += 1
+            print(f'FAIL  {e}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Scanner write throughput with and without the SQLite tuning profile
+
+Runs the same multi-process stock-in/stock-out workload as the scanner
+(record_stock_movement + audit log + commit per scan) against a fresh
+database once per SQLITE_PROFILES entry, and reports scans per second
+and how often a worker hit "database is locked".
+
+Usage:
+    python benchmarks/sqlite_write_throughput.py --workers 4 --scans 300
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+
+
+def make_app(database_url, profile):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['SQLITE_PROFILE'] = profile
+    from app_config import config, SQLITE_PROFILES
+    config['development'].SQLALCHEMY_DATABASE_URI = database_url
+    config['development'].SQLITE_PRAGMAS = SQLITE_PROFILES[profile]
+    from app import create_app
+    return create_app('development')
+
+
+def setup_database(database_url, profile, products):
+    from app import db
+    from app.models import User, Product
+    from app.utils import sync_product_codes
+
+    app = make_app(database_url, profile)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='bench', email='bench@ims.local', password='x',
+                    fs_uniquifier=str(uuid.uuid4()))
+        db.session.add(user)
+        for i in range(products):
+            product = Product(name=f'Bench product {i}', sku=f'BENCH-{i}', barcode=f'BC-{i}', quantity=1000)
+            db.session.add(product)
+            sync_product_codes(product)
+        db.session.commit()
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        return user.id, journal_mode
+
+
+def worker(database_url, profile, user_id, products, scans, seed, results):
+    from flask_login import login_user
+    from app import db
+    from app.models import User
+    from app.utils import find_product_by_code, record_stock_movement, log_audit, InsufficientStockError
+
+    app = make_app(database_url, profile)
+    rng = random.Random(seed)
+    counts = {'scans': 0, 'busy': 0}
+
+    with app.test_request_context():
+        login_user(db.session.get(User, user_id))
+        db.session.commit()
+
+        for _ in range(scans):
+            code = f'BC-{rng.randrange(products)}'
+            movement_type = rng.choice(('in', 'out'))
+            while True:
+                try:
+                    product = find_product_by_code(code)
+                    record_stock_movement(product, movement_type, 1, notes='Scanner')
+                    log_audit(f'stock_{movement_type}_scan', 'product', product.id, commit=False)
+                    db.session.commit()
+                    counts['scans'] += 1
+                    break
+                except InsufficientStockError:
+                    db.session.rollback()
+                    break
+                except OperationalError:
+                    db.session.rollback()
+                    counts['busy'] += 1
+                    time.sleep(rng.random() / 100)
+
+    results.put(counts)
+
+
+def run(profile, args):
+    path = os.path.join(tempfile.mkdtemp(), f'{profile}.db')
+    database_url = f'sqlite:///{path}'
+    user_id, journal_mode = setup_database(database_url, profile, args.products)
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(database_url, profile, user_id, args.products,
+                                                     args.scans, seed, results))
+        for seed in range(args.workers)
+    ]
+
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = {'scans': 0, 'busy': 0}
+    for _ in processes:
+        for key, value in results.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    print(f'{profile:<8} journal={journal_mode:<8} {totals["scans"]} scans in {elapsed:6.2f}s '
+          f'({totals["scans"] / elapsed:7.1f} scans/s), lock retries: {totals["busy"]}')
+    return totals['scans'] / elapsed
+
+
+def main():
+    from app_config import SQLITE_PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--scans', type=int, default=300, help='Scans per worker')
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES), choices=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    rates = {profile: run(profile, args) for profile in args.profiles}
+
+    baseline = rates.get('stock')
+    if baseline:
+        for profile, rate in rates.items():
+            if profile != 'stock':
+                print(f'{profile} vs stock: {rate / baseline:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Worker startup time and resident memory
+
+Measures, in fresh interpreters, how long importing the app and running
+create_app takes and how much memory it leaves resident. Then mimics
+gunicorn's preload_app: the app is created once, worker processes are
+forked from it and serve a few requests, and each worker's private
+(unshared) memory is reported. That private memory is what limits how
+many workers fit on a small host.
+
+Usage:
+    python benchmarks/startup_memory.py --runs 5 --workers 3 --host-mb 1024
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Modules that should only be loaded by the requests that need them
+HEAVY_MODULES = ('PIL', 'barcode', 'qrcode', 'pyotp', 'numpy')
+
+COLD_START = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app('development')
+elapsed = time.perf_counter() - started
+rss = int(next(line.split()[1] for line in open('/proc/self/status') if line.startswith('VmRSS:')))
+print(json.dumps({'seconds': elapsed, 'rss_kb': rss,
+                  'heavy': [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+
+def memory_kb(pid='self'):
+    """Resident and private memory of a process from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Rss'], values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def cold_starts(runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START], cwd=ROOT, env=os.environ,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def forked_workers(workers, paths):
+    from app import create_app, db
+
+    app = create_app('development')
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+    master_rss, _ = memory_kb()
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            client = app.test_client()
+            for path in paths:
+                client.get(path)
+            rss, private = memory_kb()
+            os.write(write_fd, json.dumps({'rss_kb': rss, 'private_kb': private}).encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    return master_rss, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Cold starts to time')
+    parser.add_argument('--workers', type=int, default=3, help='Workers to fork from a preloaded app')
+    parser.add_argument('--host-mb', type=int, default=1024, help='Host memory for the worker estimate')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+
+    starts = cold_starts(args.runs)
+    seconds = [run['seconds'] for run in starts]
+    print(f'Cold start (import + create_app), {args.runs} runs: '
+          f'median {statistics.median(seconds) * 1000:.0f} ms, max {max(seconds) * 1000:.0f} ms')
+    print(f'RSS after create_app: {statistics.median(run["rss_kb"] for run in starts) / 1024:.1f} MB')
+    print(f'Heavy modules loaded at startup: {", ".join(starts[0]["heavy"]) or "none"}')
+
+    master_rss, workers = forked_workers(args.workers, ['/', '/auth/login'])
+    private = max(worker['private_kb'] for worker in workers)
+    print(f'Preloaded master RSS: {master_rss / 1024:.1f} MB')
+    for number, worker in enumerate(workers, start=1):
+        print(f'  worker {number}: RSS {worker["rss_kb"] / 1024:.1f} MB, private {worker["private_kb"] / 1024:.1f} MB')
+
+    fit = int((args.host_mb * 1024 - master_rss) // private) if private else 0
+    print(f'Workers that fit in {args.host_mb} MB (master + private per worker): {fit}')
+
+
+if __name__ == '__main__':
+    main()
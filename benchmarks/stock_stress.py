@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Multi-process stress test for record_stock_movement
+
+Spawns several worker processes that hammer the same product with
+concurrent stock in/out scans against a shared SQLite database, then
+checks that the final quantity matches the committed movements, that no
+update was lost and that stock never went negative.
+
+Usage:
+    python benchmarks/stock_stress.py --workers 8 --iterations 200
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+
+INITIAL_QUANTITY = 100
+
+
+def make_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app
+    return create_app('development')
+
+
+def setup_database(database_url):
+    from app import db
+    from app.models import User, Product
+
+    app = make_app(database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='stress', email='stress@ims.local', password='x',
+                    fs_uniquifier=str(uuid.uuid4()))
+        product = Product(name='Stress product', sku='STRESS-1', quantity=INITIAL_QUANTITY)
+        db.session.add_all([user, product])
+        db.session.commit()
+        return user.id, product.id
+
+
+def worker(database_url, user_id, product_id, iterations, seed, results):
+    from flask_login import login_user
+    from app import db
+    from app.models import User, Product
+    from app.utils import record_stock_movement, InsufficientStockError
+
+    app = make_app(database_url)
+    rng = random.Random(seed)
+    counts = {'in': 0, 'out': 0, 'rejected': 0, 'busy': 0}
+
+    with app.test_request_context():
+        login_user(db.session.get(User, user_id))
+        product = db.session.get(Product, product_id)
+        db.session.commit()
+
+        for _ in range(iterations):
+            movement_type = rng.choice(('in', 'out', 'out'))
+            quantity = rng.randint(1, 5)
+            while True:
+                try:
+                    record_stock_movement(product, movement_type, quantity)
+                    db.session.commit()
+                    counts[movement_type] += quantity
+                    break
+                except InsufficientStockError:
+                    db.session.rollback()
+                    counts['rejected'] += 1
+                    break
+                except OperationalError:
+                    # database is locked: retry the whole unit of work
+                    db.session.rollback()
+                    counts['busy'] += 1
+                    time.sleep(rng.random() / 100)
+
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--database', help='SQLite file to use (defaults to a temporary file)')
+    args = parser.parse_args()
+
+    path = args.database or os.path.join(tempfile.mkdtemp(), 'stress.db')
+    database_url = f'sqlite:///{path}'
+    user_id, product_id = setup_database(database_url)
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker,
+                                args=(database_url, user_id, product_id, args.iterations, seed, results))
+        for seed in range(args.workers)
+    ]
+
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = {'in': 0, 'out': 0, 'rejected': 0, 'busy': 0}
+    for _ in processes:
+        for key, value in results.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    from app import db
+    from app.models import Product, StockMovement
+
+    app = make_app(database_url)
+    with app.app_context():
+        final_quantity = db.session.get(Product, product_id).quantity
+        movements = StockMovement.query.filter_by(product_id=product_id).count()
+        negative = StockMovement.query.filter(StockMovement.new_quantity < 0).count()
+        broken_chain = StockMovement.query.filter(
+            StockMovement.new_quantity != StockMovement.previous_quantity +
+            db.case((StockMovement.movement_type == 'in', StockMovement.quantity),
+                    else_=-StockMovement.quantity)
+        ).count()
+
+    expected = INITIAL_QUANTITY + totals['in'] - totals['out']
+    scans = args.workers * args.iterations
+
+    print(f'Workers: {args.workers}, scans: {scans}, elapsed: {elapsed:.2f}s '
+          f'({scans / elapsed:.0f} scans/s)')
+    print(f'Stock in: {totals["in"]}, stock out: {totals["out"]}, '
+          f'rejected: {totals["rejected"]}, lock retries: {totals["busy"]}')
+    print(f'Final quantity: {final_quantity}, expected: {expected}, movements: {movements}')
+
+    ok = final_quantity == expected and negative == 0 and broken_chain == 0 \
+        and movements == scans - totals['rejected']
+    print('PASS' if ok else 'FAIL: lost or inconsistent stock updates')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
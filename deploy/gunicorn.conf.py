@@ -3,6 +3,7 @@ Gunicorn configuration for IMS
 Optimized for AWS Lightsail $3.50-$5 tier (512MB-1GB RAM)
 """
 
+import glob
 import multiprocessing
 import os
 
@@ -46,6 +47,12 @@ tmp_upload_dir = None
 # Preload app for better performance
 preload_app = True
 
+# Shared metrics directory (app/metrics.py); workers inherit it from the master
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'metrics')
+)
+
 # Security
 limit_request_line = 4094
 limit_request_fields = 100
@@ -54,6 +61,9 @@ limit_request_field_size = 8190
 def on_starting(server):
     """Called just before the master process is initialized."""
     print("Starting IMS application...")
+    # Drop metric files left by the previous run
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
 
 def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
@@ -63,6 +73,16 @@ def when_ready(server):
     """Called just after the server is started."""
     print("IMS application ready to serve requests")
 
+def worker_exit(server, worker):
+    """Called in the worker just after it exits: drain buffered audit entries."""
+    from app.audit import audit_sink
+    audit_sink.flush()
+
+def child_exit(server, worker):
+    """Called in the master after a worker exits: drop its live gauges."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
 def on_exit(server):
     """Called just before exiting Gunicorn."""
     print("Shutting down IMS application...")
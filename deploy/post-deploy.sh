@@ -85,13 +85,21 @@ else
 fi
 echo ""
 
+# Build static assets (purged, fingerprinted, precompressed)
+echo -e "${YELLOW}Building static assets...${NC}"
+flask --app run:app build-assets > /dev/null 2>&1 || echo "Note: Asset build skipped (pages fall back to the unbuilt files)"
+echo -e "${GREEN}✓ Static assets built${NC}"
+echo ""
+
 # Run database migrations
 echo -e "${YELLOW}[6/7] Running database migrations...${NC}"
 if [ -d "migrations" ]; then
     flask --app run:app db upgrade > /dev/null 2>&1 || echo "Note: Migration skipped (database may need initialization)"
     echo -e "${GREEN}✓ Database migrations applied${NC}"
 else
-    echo -e "${YELLOW}No migrations directory found, skipping${NC}"
+    # The app no longer creates tables on startup; add any new ones here
+    flask --app run:app init-schema > /dev/null 2>&1 || echo "Note: Schema creation skipped (database may need initialization)"
+    echo -e "${GREEN}✓ Database schema up to date${NC}"
 fi
 echo ""
 
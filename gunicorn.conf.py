@@ -1,6 +1,8 @@
 # Gunicorn configuration for LightStock
 
+import glob
 import multiprocessing
+import os
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -30,7 +32,31 @@ user = None
 group = None
 tmp_upload_dir = None
 
+# Shared metrics directory (app/metrics.py); workers inherit it from the master
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+)
+
 # Security
 limit_request_line = 4094
 limit_request_fields = 100
 limit_request_field_size = 8190
+
+
+def worker_exit(server, worker):
+    """Drain buffered audit entries before the worker exits"""
+    from app.audit import audit_sink
+    audit_sink.flush()
+
+
+def on_starting(server):
+    """Drop metric files left by a previous run"""
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    """Remove a dead worker's live gauges from the metrics directory"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
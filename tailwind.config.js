@@ -4,12 +4,9 @@ module.exports = {
     "./app/templates/**/*.html",
     "./app/**/*.py",
   ],
-  safelist: [
-    // Safelist commonly used dynamic classes
-    {
-      pattern: /.*/,
-    }
-  ],
+  // Classes built up at runtime must appear literally in a template or .py
+  // file; a catch-all safelist would ship every utility (~3 MB) again
+  safelist: [],
   theme: {
     extend: {
       fontFamily: {
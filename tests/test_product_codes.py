@@ -0,0 +1,65 @@
+"""Product forms keep one product_code row per distinct SKU, barcode and RFID tag"""
+import uuid
+
+import pytest
+
+from app import create_app, db
+from app.models import Product, ProductCode, Role, User
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    user = User(username='admin', email='admin@ims.local', password='x', fs_uniquifier=str(uuid.uuid4()),
+                roles=[Role(name='Admin')])
+    db.session.add(user)
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = user.fs_uniquifier
+        session['_fresh'] = True
+    return client
+
+
+def codes_of(product):
+    return sorted((row.code, row.kind) for row in ProductCode.query.filter_by(product_id=product.id))
+
+
+def test_add_product_with_barcode_equal_to_sku(client):
+    response = client.post('/inventory/product/add', data={'name': 'Widget', 'sku': 'ABC123', 'barcode': 'ABC123'})
+
+    assert response.status_code == 302
+    product = Product.query.filter_by(sku='ABC123').one()
+    assert product.barcode == 'ABC123'
+    assert codes_of(product) == [('ABC123', 'sku')]
+
+
+def test_edit_product_barcode_to_own_sku(client):
+    client.post('/inventory/product/add', data={'name': 'Widget', 'sku': 'ABC123', 'barcode': 'XYZ789'})
+    product = Product.query.filter_by(sku='ABC123').one()
+    assert codes_of(product) == [('ABC123', 'sku'), ('XYZ789', 'barcode')]
+
+    response = client.post(f'/inventory/product/{product.id}/edit',
+                           data={'name': 'Widget', 'sku': 'ABC123', 'barcode': 'ABC123'})
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    assert product.barcode == 'ABC123'
+    assert codes_of(product) == [('ABC123', 'sku')]
+
+    # Moving the SKU away gives the shared code back to the barcode
+    client.post(f'/inventory/product/{product.id}/edit', data={'name': 'Widget', 'sku': 'NEW1', 'barcode': 'ABC123'})
+    db.session.expire_all()
+    assert codes_of(product) == [('ABC123', 'barcode'), ('NEW1', 'sku')]